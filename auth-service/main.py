@@ -1,31 +1,40 @@
 import os
+import secrets
+import time
 import uuid
-from fastapi import FastAPI, HTTPException, Depends
+from typing import Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+from sqlalchemy import text
+from prometheus_client import make_asgi_app, Counter, Histogram
+
+from shared.database import create_async_db_engine, create_async_session_factory
+from shared.rate_limit import RateLimiter
+from shared.tracing import setup_tracing
 
 app = FastAPI(title="ClassGPT Auth Service")
 
-# Rate limiting setup
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Rate limits per client IP, counted in Redis so they hold across replicas
+limiter = RateLimiter()
+
+# Prometheus metrics (database pool wait times, ...)
+app.mount("/metrics", make_asgi_app())
 
 # Conservative limits for personal project
 MAX_LOGIN_ATTEMPTS_PER_HOUR = 10  # Max 10 login attempts per hour per IP
 MAX_REGISTRATIONS_PER_HOUR = 5  # Max 5 registrations per hour per IP
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/classgpt")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_db_engine(DATABASE_URL, name="auth")
+SessionLocal = create_async_session_factory(engine)
+
+# OpenTelemetry spans for requests and Postgres (off unless OTEL_TRACES_EXPORTER is set)
+setup_tracing("auth-service", app=app, engines=[engine])
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-very-secret-key")
 ALGORITHM = "HS256"
@@ -33,6 +42,61 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 1 week
 
 security = HTTPBearer()
 
+# Users looked up by /auth/me and introspection are cached in-process for a short time, so
+# auth-service database load does not grow with API traffic. Each process has its own cache
+# and entries expire after USER_CACHE_TTL. Users are never changed or deleted here; a path that
+# does so must drop the user from every process's cache, not only this one.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))  # seconds
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+MAX_INTROSPECT_TOKENS = 100
+# Shared secret other services send as X-Service-Token to call /auth/introspect/batch.
+# Unset, the endpoint is disabled: it would let anyone check stolen or guessed tokens.
+AUTH_INTROSPECT_SECRET = os.getenv("AUTH_INTROSPECT_SECRET")
+
+USER_CACHE_REQUESTS = Counter(
+    "auth_user_cache_requests_total",
+    "User lookups served from the in-process cache (hit) or the database (miss)",
+    ["result"],
+)
+USER_LOOKUP_SECONDS = Histogram(
+    "auth_user_lookup_seconds",
+    "Time spent resolving users for an auth request",
+    ["endpoint"],
+)
+
+class UserCache:
+    """Small TTL cache of user_id -> user row, bounded by dropping the oldest entries"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: Dict[str, Tuple[float, dict]] = {}
+
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(user_id, None)
+            USER_CACHE_REQUESTS.labels(result="miss").inc()
+            return None
+        USER_CACHE_REQUESTS.labels(result="hit").inc()
+        return entry[1]
+
+    def set(self, user_id: str, user: dict):
+        if len(self._entries) >= self.max_size:
+            # dicts keep insertion order, so the first keys are the oldest entries
+            for stale in list(self._entries)[: max(1, self.max_size // 10)]:
+                del self._entries[stale]
+        self._entries[user_id] = (time.monotonic() + self.ttl, user)
+
+user_cache = UserCache(USER_CACHE_TTL, USER_CACHE_MAX_SIZE)
+
+def verify_service_token(x_service_token: Optional[str] = Header(None)):
+    """Allow only services holding AUTH_INTROSPECT_SECRET"""
+    if not AUTH_INTROSPECT_SECRET:
+        raise HTTPException(status_code=403, detail="Introspection is disabled")
+    if not x_service_token or not secrets.compare_digest(x_service_token, AUTH_INTROSPECT_SECRET):
+        raise HTTPException(status_code=401, detail="Invalid service token")
+
 class UserLogin(BaseModel):
     email: str
     password: str
@@ -45,12 +109,12 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
-def get_db():
-    db = SessionLocal()
-    try:
+class IntrospectBatchRequest(BaseModel):
+    tokens: List[str]
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -59,9 +123,9 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_token(token: str) -> str:
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
@@ -71,15 +135,41 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-@app.post("/auth/register", response_model=Token)
-@limiter.limit("5/hour")  # Rate limit: 5 registrations per hour per IP
-def register(user: UserRegister, db = Depends(get_db)):
-    result = db.execute(text("SELECT id FROM users WHERE email = :email"), {"email": user.email})
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return decode_token(credentials.credentials)
+
+async def get_users(db, user_ids: List[str]) -> Dict[str, dict]:
+    """Returns {user_id: user} for the users that exist, reading only cache misses from the database"""
+    users = {}
+    missing = []
+    for user_id in user_ids:
+        user = user_cache.get(user_id)
+        if user is None:
+            missing.append(user_id)
+        else:
+            users[user_id] = user
+    if missing:
+        result = await db.execute(
+            text("SELECT id, email, created_at FROM users WHERE id = ANY(CAST(:user_ids AS uuid[]))"),
+            {"user_ids": missing}
+        )
+        for row in result.fetchall():
+            user = {"id": str(row.id), "email": row.email, "created_at": row.created_at}
+            user_cache.set(user["id"], user)
+            users[user["id"]] = user
+    return users
+
+@app.post("/auth/register", response_model=Token, dependencies=[
+    limiter.limit("5/hour", scope="register")  # 5 registrations per hour per IP
+])
+async def register(user: UserRegister, db = Depends(get_db)):
+    result = await db.execute(text("SELECT id FROM users WHERE email = :email"), {"email": user.email})
     if result.fetchone():
         raise HTTPException(status_code=400, detail="Email already registered")
-    password_hash = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    # bcrypt is deliberately slow, keep it off the event loop
+    password_hash = (await run_in_threadpool(bcrypt.hashpw, user.password.encode('utf-8'), bcrypt.gensalt())).decode('utf-8')
     user_id = str(uuid.uuid4())
-    db.execute(text("""
+    await db.execute(text("""
         INSERT INTO users (id, email, password_hash, created_at)
         VALUES (:user_id, :email, :password_hash, NOW())
     """), {
@@ -87,33 +177,64 @@ def register(user: UserRegister, db = Depends(get_db)):
         "email": user.email,
         "password_hash": password_hash
     })
-    db.commit()
+    await db.commit()
     access_token = create_access_token(data={"sub": str(user_id)})
     return Token(access_token=access_token, token_type="bearer")
 
-@app.post("/auth/login", response_model=Token)
-@limiter.limit("10/hour")  # Rate limit: 10 login attempts per hour per IP
-def login(user: UserLogin, db = Depends(get_db)):
-    result = db.execute(text("SELECT id, password_hash FROM users WHERE email = :email"), {"email": user.email})
+@app.post("/auth/login", response_model=Token, dependencies=[
+    limiter.limit("10/hour", scope="login")  # 10 login attempts per hour per IP
+])
+async def login(user: UserLogin, db = Depends(get_db)):
+    result = await db.execute(text("SELECT id, password_hash FROM users WHERE email = :email"), {"email": user.email})
     user_data = result.fetchone()
     if not user_data:
         raise HTTPException(status_code=401, detail="Invalid email or password")
-    if not bcrypt.checkpw(user.password.encode('utf-8'), user_data.password_hash.encode('utf-8')):
+    if not await run_in_threadpool(bcrypt.checkpw, user.password.encode('utf-8'), user_data.password_hash.encode('utf-8')):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     access_token = create_access_token(data={"sub": str(user_data.id)})
     return Token(access_token=access_token, token_type="bearer")
 
 @app.get("/auth/me")
-def get_current_user(user_id: str = Depends(verify_token), db = Depends(get_db)):
-    result = db.execute(text("SELECT id, email, created_at FROM users WHERE id = :user_id"), {"user_id": user_id})
-    user_data = result.fetchone()
-    if not user_data:
+async def get_current_user(user_id: str = Depends(verify_token), db = Depends(get_db)):
+    with USER_LOOKUP_SECONDS.labels(endpoint="me").time():
+        users = await get_users(db, [user_id])
+    if user_id not in users:
         raise HTTPException(status_code=404, detail="User not found")
-    return {
-        "id": user_data.id,
-        "email": user_data.email,
-        "created_at": user_data.created_at
-    }
+    return users[user_id]
+
+@app.post("/auth/introspect/batch", dependencies=[
+    Depends(verify_service_token),
+    limiter.limit("600/minute", scope="introspect"),  # per calling service instance (IP)
+])
+async def introspect_batch(request: IntrospectBatchRequest, db = Depends(get_db)):
+    """
+    Validate many tokens in one round trip, for services holding AUTH_INTROSPECT_SECRET.
+    Results are returned in request order as {"active": true, "id", "email", "created_at"}
+    or {"active": false, "error"}.
+    """
+    if len(request.tokens) > MAX_INTROSPECT_TOKENS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_INTROSPECT_TOKENS} tokens per request")
+    with USER_LOOKUP_SECONDS.labels(endpoint="introspect_batch").time():
+        decoded = []
+        for token in request.tokens:
+            try:
+                decoded.append((decode_token(token), None))
+            except HTTPException as e:
+                decoded.append((None, e.detail))
+        users = await get_users(db, list({user_id for user_id, _ in decoded if user_id}))
+    results = []
+    for user_id, error in decoded:
+        if error:
+            results.append({"active": False, "error": error})
+        elif user_id not in users:
+            results.append({"active": False, "error": "User not found"})
+        else:
+            results.append({"active": True, **users[user_id]})
+    return {"results": results}
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await engine.dispose()
 
 @app.get("/health")
 def health():
@@ -0,0 +1,110 @@
+"""
+Benchmark Qdrant upsert throughput: the old single blocking HTTP upsert against
+gRPC with concurrent wait=False batches and a final consistency barrier.
+
+Start a local Qdrant first:
+
+    docker run --rm -p 6333:6333 -p 6334:6334 qdrant/qdrant
+
+then from the repo root:
+
+    python -m benchmarks.qdrant_upsert --points 20000 --dim 1536
+"""
+import argparse
+import random
+import time
+import uuid
+
+from qdrant_client import QdrantClient, models
+
+from shared.vector_store import VectorRecord
+from shared.vector_store.qdrant_store import QdrantVectorStore
+
+
+def make_records(count, dim, seed=0):
+    rng = random.Random(seed)
+    return [
+        VectorRecord(
+            id=str(uuid.uuid4()),
+            values=[rng.uniform(-1, 1) for _ in range(dim)],
+            metadata={
+                "user_id": f"user-{i % 10}",
+                "class_id": f"class-{i % 50}",
+                "document_id": f"doc-{i % 500}",
+                "chunk_index": i,
+                "content": "x" * 500,
+            },
+        )
+        for i in range(count)
+    ]
+
+
+def bench_single_http_upsert(args, records):
+    """What the worker used to do: one blocking HTTP upsert of every point."""
+    client = QdrantClient(url=args.url)
+    collection = f"bench_http_{uuid.uuid4().hex[:8]}"
+    client.create_collection(
+        collection_name=collection,
+        vectors_config=models.VectorParams(size=args.dim, distance=models.Distance.COSINE),
+    )
+    try:
+        started = time.perf_counter()
+        for i in range(0, len(records), args.document_size):
+            client.upsert(
+                collection_name=collection,
+                points=[
+                    models.PointStruct(id=r.id, vector=list(r.values), payload=r.metadata)
+                    for r in records[i:i + args.document_size]
+                ],
+                wait=True,
+            )
+        return time.perf_counter() - started
+    finally:
+        client.delete_collection(collection)
+
+
+def bench_grpc_parallel_upsert(args, records):
+    collection = f"bench_grpc_{uuid.uuid4().hex[:8]}"
+    store = QdrantVectorStore.from_url(
+        args.url,
+        None,
+        collection,
+        args.dim,
+        prefer_grpc=True,
+        grpc_port=args.grpc_port,
+        upsert_parallelism=args.parallelism,
+    )
+    try:
+        started = time.perf_counter()
+        for i in range(0, len(records), args.document_size):
+            store.upsert_batch(records[i:i + args.document_size], batch_size=args.batch_size)
+        elapsed = time.perf_counter() - started
+        assert store.count() == len(records), "points missing after the consistency barrier"
+        return elapsed
+    finally:
+        store.client.delete_collection(collection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--grpc-port", type=int, default=6334)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--document-size", type=int, default=2000, help="points upserted per call, like one document")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--parallelism", type=int, default=4)
+    args = parser.parse_args()
+
+    records = make_records(args.points, args.dim)
+    print(f"{args.points} points, dim {args.dim}, {args.document_size} points per document")
+    for name, bench in [
+        ("http, one blocking upsert per document", bench_single_http_upsert),
+        (f"grpc, {args.parallelism} parallel batches of {args.batch_size}", bench_grpc_parallel_upsert),
+    ]:
+        elapsed = bench(args, records)
+        print(f"{name:45s} {elapsed:8.2f}s  {args.points / elapsed:10.0f} points/s")
+
+
+if __name__ == "__main__":
+    main()
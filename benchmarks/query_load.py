@@ -0,0 +1,484 @@
+"""
+Load-test the /query pipeline offline and break its latency down by stage.
+
+Starts query-service in a child process, and in another local stand-ins for everything
+it calls, each with its own injected latency:
+
+- auth: a /me endpoint answering after --auth-ms
+- embeddings and LLM: query-service/llm_stub.py, answering after --embed-ms and a
+  log-normal --llm-ms (spread --llm-sigma)
+- vector store: the in-memory backend seeded with --chunks chunks for one class, with
+  --search-ms added to every search and fetch
+
+then sends open-loop /query traffic at --rps for --duration seconds (after --warmup
+seconds that are not counted) and reports throughput, p50/p95/p99 latency and the
+per-stage breakdown query-service reports in its Server-Timing header (auth, session,
+embed, search, rerank, llm, serialize, other). From the repo root:
+
+    python -m benchmarks.query_load --rps 20 --duration 30 --output bench/query_load.json
+    python -m benchmarks.query_load --rps 20 --duration 30 --compare bench/query_load.json
+
+Results are written as JSON with the commit they were measured at. --compare prints
+the change against an earlier result and exits non-zero if p95 latency or throughput
+regressed by more than --max-regression percent.
+
+The report includes query-service's memory per process: RSS, PSS (shared pages split
+between the processes sharing them) and private memory. With --workers N it runs under
+server.py, with N worker processes forked after the models and the seeded vector store
+are loaded; benchmarks/query_workers.py compares worker counts. --embedding-provider
+local embeds queries with the sentence-transformers model (--embedding-model, of
+dimension --dim) instead of the stub.
+
+Chat sessions and the embedding index are read from --redis-url. Without a reachable
+Redis those calls fail fast and query-service keeps serving.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+QUERY_SERVICE_DIR = REPO_ROOT / "query-service"
+
+BENCH_USER_ID = "bench-user"
+BENCH_CLASS_ID = "bench-class"
+# Arguments that do not change what is measured
+NOT_CONFIG = ("serve", "serve_stubs", "output", "compare", "max_regression", "port", "auth_port", "stub_port")
+STAGES = ("auth", "session", "embed", "search", "rerank", "llm", "serialize", "other")
+
+VOCABULARY = (
+    "gradient descent learning rate loss function convex optimization matrix vector eigenvalue "
+    "probability distribution variance expectation theorem proof lemma induction recursion graph "
+    "tree algorithm complexity sorting hashing dynamic programming greedy network protocol cache "
+    "memory process thread scheduler entropy regression classifier overfitting regularization"
+).split()
+QUERIES = [
+    "What is gradient descent and how is the learning rate chosen?",
+    "Explain the difference between variance and expectation.",
+    "How does dynamic programming differ from a greedy algorithm?",
+    "What is the time complexity of sorting with a heap?",
+    "Why does regularization reduce overfitting?",
+    "Summarize the proof by induction from the lecture.",
+    "How does the scheduler pick the next thread?",
+    "What are eigenvalues of a matrix used for?",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def at(fraction):
+        return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)], 2)
+
+    return {
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+def _parse_server_timing(header: str):
+    timings = {}
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, _, duration = entry.partition(";dur=")
+        if duration:
+            timings[name] = float(duration)
+    return timings
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Child process: query-service and its stand-ins -------------------------------------
+
+def _start_in_thread(app, port):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+
+
+def _auth_stub(latency_ms):
+    from fastapi import FastAPI
+
+    app = FastAPI()
+
+    @app.get("/me")
+    async def me():
+        await asyncio.sleep(latency_ms / 1000)
+        return {"id": BENCH_USER_ID}
+
+    return app
+
+
+def _with_latency(method, latency_ms):
+    def delayed(*args, **kwargs):
+        time.sleep(latency_ms / 1000)
+        return method(*args, **kwargs)
+    return delayed
+
+
+def _seed_vector_store(store, chunks, dimension):
+    from shared.vector_store import VectorRecord, chunk_vector_id, tenant_namespace
+
+    rng = random.Random(0)
+    records = []
+    for i in range(chunks):
+        document_id = f"bench-doc-{i // 100}"
+        chunk_index = i % 100
+        records.append(VectorRecord(
+            id=chunk_vector_id(document_id, chunk_index),
+            values=[rng.gauss(0, 1) for _ in range(dimension)],
+            metadata={
+                "user_id": BENCH_USER_ID,
+                "class_id": BENCH_CLASS_ID,
+                "document_id": document_id,
+                "chunk_index": chunk_index,
+                "page_number": chunk_index // 5 + 1,
+                "content": " ".join(rng.choice(VOCABULARY) for _ in range(120)),
+            },
+        ))
+    store.upsert_batch(records, namespace=tenant_namespace(BENCH_USER_ID, BENCH_CLASS_ID))
+
+
+def serve_stubs(args):
+    """Run in the second child: the auth and LLM stand-ins, apart so they do not compete with query-service."""
+    sys.path[:0] = [str(QUERY_SERVICE_DIR), str(REPO_ROOT)]
+    import llm_stub
+
+    _start_in_thread(_auth_stub(args.auth_ms), args.auth_port)
+    _start_in_thread(llm_stub.app, args.stub_port)
+    threading.Event().wait()
+
+
+def serve(args):
+    """Run in the child: query-service, with the in-memory vector store seeded."""
+    sys.path[:0] = [str(QUERY_SERVICE_DIR), str(REPO_ROOT)]
+    if args.workers:
+        # First: it sets the thread counts numpy and torch read when they load
+        import server
+    import uvicorn
+    import main
+    from shared.embedding_index import get_active_index
+
+    store = get_active_index().store()
+    _seed_vector_store(store, args.chunks, args.dim)
+    store.search = _with_latency(store.search, args.search_ms)
+    store.fetch = _with_latency(store.fetch, args.search_ms)
+
+    # The hourly limit would turn the run into a stream of 429s
+    main.limiter.enabled = False
+    if args.workers:
+        # Workers are forked after the seeding, so they share the store too
+        server.run(main.app, host="127.0.0.1", port=args.port)
+    else:
+        uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+
+def start_child(args, role, log_file):
+    """Start query-service (role "serve") or the stand-ins (role "serve_stubs") in a child process."""
+    stub_url = f"http://127.0.0.1:{args.stub_port}/v1"
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [str(QUERY_SERVICE_DIR), str(REPO_ROOT), os.getenv("PYTHONPATH")])),
+        AUTH_SERVICE_URL=f"http://127.0.0.1:{args.auth_port}/me",
+        OPENAI_API_KEY="stub",
+        OPENAI_BASE_URL=stub_url,
+        LLM_BASE_URL=stub_url,
+        EMBEDDING_PROVIDER=args.embedding_provider,
+        EMBEDDING_MODEL=args.embedding_model if args.embedding_provider == "local" else "text-embedding-ada-002",
+        EMBEDDING_DIM=str(args.dim),
+        QUERY_WORKERS=str(args.workers),
+        VECTOR_STORE_BACKEND="memory",
+        VECTOR_STORE_LEGACY_FALLBACK="false",
+        REDIS_URL=args.redis_url,
+        RERANK_MODE=args.rerank_mode,
+        QUERY_SERVER_TIMING="true",
+        LLM_STUB_LATENCY_MS=str(args.llm_ms),
+        LLM_STUB_LATENCY_SIGMA=str(args.llm_sigma),
+        LLM_STUB_EMBEDDING_MS=str(args.embed_ms),
+        LLM_STUB_EMBEDDING_DIM=str(args.dim),
+        LLM_STUB_ERROR_RATE=str(args.error_rate),
+    )
+    command = [sys.executable, "-m", "benchmarks.query_load", f"--{role.replace('_', '-')}"] + [
+        f"--{name.replace('_', '-')}={value}" for name, value in vars(args).items()
+        if name not in ("serve", "serve_stubs", "output", "compare") and value is not None
+    ]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def _smaps_rollup(pid):
+    fields = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+        name, _, value = line.partition(":")
+        if value.strip().endswith("kB"):
+            fields[name] = int(value.split()[0]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def server_memory(pid):
+    """Memory in MB of the server process and the workers it forked. None without /proc."""
+    try:
+        cmdline = Path(f"/proc/{pid}/cmdline").read_bytes()
+        workers = []
+        for stat in Path("/proc").glob("[0-9]*/stat"):
+            try:
+                parent = int(stat.read_text().rsplit(")", 1)[1].split()[1])
+                if parent == pid and (stat.parent / "cmdline").read_bytes() == cmdline:
+                    workers.append(int(stat.parent.name))
+            except (OSError, ValueError, IndexError):
+                continue
+        master = _smaps_rollup(pid)
+        processes = [_smaps_rollup(worker) for worker in workers] or [master]
+    except (OSError, KeyError):
+        return None
+
+    def mean(field):
+        return round(sum(process[field] for process in processes) / len(processes), 1)
+
+    return {
+        "workers": len(workers),
+        "rss_per_worker": mean("rss"),
+        "pss_per_worker": mean("pss"),
+        "private_per_worker": mean("private"),
+        # What the service as a whole costs: every page counted once
+        "total_pss": round(sum(process["pss"] for process in processes) + (master["pss"] if workers else 0), 1),
+    }
+
+
+# --- Parent process: load generator -----------------------------------------------------
+
+async def wait_until_ready(client, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("query-service exited during startup")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"query-service not ready after {timeout}s")
+
+
+async def drive_load(args, client):
+    """Open-loop traffic: request i is sent at its scheduled time however slow earlier ones are."""
+    samples = []  # (sent_at, status, latency ms, stage timings)
+    dropped = 0
+    in_flight = set()
+    rng = random.Random(1)
+
+    async def send(query, sent_at):
+        started = time.perf_counter()
+        try:
+            response = await client.post("/query", json={"query": query, "class_id": BENCH_CLASS_ID, "top_k": 5})
+            status, timings = response.status_code, _parse_server_timing(response.headers.get("server-timing", ""))
+        except Exception as e:
+            status, timings = type(e).__name__, {}
+        samples.append((sent_at, status, (time.perf_counter() - started) * 1000, timings))
+
+    started = time.monotonic()
+    total = args.warmup + args.duration
+    next_at = 0.0
+    while next_at < total:
+        delay = started + next_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= args.concurrency:
+            # The client is saturated; sending late would understate latency, so count it instead
+            dropped += next_at >= args.warmup
+        else:
+            task = asyncio.create_task(send(rng.choice(QUERIES), next_at))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        next_at += rng.expovariate(args.rps) if args.arrivals == "poisson" else 1 / args.rps
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return samples, dropped, time.monotonic() - started - args.warmup
+
+
+def summarize(args, samples, dropped, elapsed, memory=None):
+    measured = [sample for sample in samples if sample[0] >= args.warmup]
+    ok = [sample for sample in measured if sample[1] == 200]
+    stages = defaultdict(list)
+    for _, _, _, timings in ok:
+        for name in STAGES:
+            stages[name].append(timings.get(name, 0.0))
+    return {
+        "benchmark": "query_load",
+        "commit": _git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {name: value for name, value in vars(args).items() if name not in NOT_CONFIG},
+        "requests": {
+            "sent": len(measured),
+            "ok": len(ok),
+            "errors": {str(status): count for status, count in Counter(s[1] for s in measured if s[1] != 200).items()},
+            "dropped": dropped,
+        },
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": _percentiles([sample[2] for sample in ok]),
+        "server_ms": _percentiles([sample[3].get("total", 0.0) for sample in ok]),
+        "stages_ms": {name: _percentiles(values) for name, values in stages.items()},
+        "memory_mb": memory,
+    }
+
+
+def print_report(result):
+    requests = result["requests"]
+    print(f"\n{requests['ok']}/{requests['sent']} ok, errors {requests['errors'] or 'none'}, dropped {requests['dropped']}")
+    print(f"throughput {result['throughput_rps']:.2f} req/s")
+    print(f"{'':12s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'mean':>9s}  (ms)")
+    rows = [("client", result["latency_ms"]), ("server", result["server_ms"])] + list(result["stages_ms"].items())
+    for name, stats in rows:
+        if stats:
+            print(f"{name:12s} {stats['p50']:9.1f} {stats['p95']:9.1f} {stats['p99']:9.1f} {stats['mean']:9.1f}")
+    memory = result.get("memory_mb")
+    if memory:
+        print(
+            f"memory per worker: RSS {memory['rss_per_worker']:.0f} MB, PSS {memory['pss_per_worker']:.0f} MB, "
+            f"private {memory['private_per_worker']:.0f} MB; total PSS {memory['total_pss']:.0f} MB"
+        )
+
+
+def compare(result, baseline, max_regression):
+    """Print the change from the baseline; True if p95 latency or throughput regressed too much."""
+    def change(new, old):
+        return (new - old) / old * 100 if old else 0.0
+
+    print(f"\nagainst {baseline.get('commit') or 'baseline'}:")
+    differences = sorted(name for name, value in result["config"].items() if baseline["config"].get(name) != value)
+    if differences:
+        print(f"(measured with different settings: {', '.join(differences)})")
+    throughput = change(result["throughput_rps"], baseline["throughput_rps"])
+    print(f"{'throughput':12s} {baseline['throughput_rps']:9.2f} -> {result['throughput_rps']:9.2f} req/s  {throughput:+6.1f}%")
+    rows = [("client p95", result["latency_ms"], baseline["latency_ms"])] + [
+        (f"{name} p95", stats, baseline["stages_ms"].get(name)) for name, stats in result["stages_ms"].items()
+    ]
+    for name, new, old in rows:
+        if new and old:
+            print(f"{name:12s} {old['p95']:9.1f} -> {new['p95']:9.1f} ms     {change(new['p95'], old['p95']):+6.1f}%")
+    latency = change(result["latency_ms"]["p95"], baseline["latency_ms"]["p95"]) if result["latency_ms"] and baseline["latency_ms"] else 0.0
+    return latency > max_regression or -throughput > max_regression
+
+
+async def run(args):
+    import httpx
+
+    log_file = tempfile.NamedTemporaryFile(prefix="query_load_server_", suffix=".log", delete=False)
+    stubs = start_child(args, "serve_stubs", log_file)
+    process = start_child(args, "serve", log_file)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.port}",
+            headers={"Authorization": "Bearer bench"},
+            timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency),
+        ) as client:
+            await wait_until_ready(client, process)
+            print(f"Sending {args.rps} req/s for {args.warmup}s warmup + {args.duration}s (server log: {log_file.name})")
+            samples, dropped, elapsed = await drive_load(args, client)
+            return samples, dropped, elapsed, server_memory(process.pid)
+    except RuntimeError:
+        log_file.flush()
+        print(Path(log_file.name).read_text()[-3000:])
+        raise
+    finally:
+        for child in (process, stubs):
+            child.terminate()
+            child.wait(timeout=30)
+        log_file.close()
+
+
+def build_parser(description=__doc__):
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=10, help="target request rate")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of traffic before measuring")
+    parser.add_argument("--concurrency", type=int, default=200, help="max requests in flight")
+    parser.add_argument("--arrivals", choices=["poisson", "uniform"], default="poisson")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--auth-ms", type=float, default=20)
+    parser.add_argument("--embed-ms", type=float, default=30)
+    parser.add_argument("--search-ms", type=float, default=10)
+    parser.add_argument("--llm-ms", type=float, default=800, help="median LLM latency")
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="log-normal spread of the LLM latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of stub LLM/embedding calls that fail")
+    parser.add_argument("--chunks", type=int, default=2000, help="chunks in the benchmark class")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--rerank-mode", default="lexical")
+    parser.add_argument("--embedding-provider", choices=["openai", "local"], default="openai", help="openai is the stub")
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2", help="with --embedding-provider local")
+    parser.add_argument("--workers", type=int, default=0, help="serve with server.py and this many workers (0: one uvicorn process)")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://127.0.0.1:6379/15"))
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--auth-port", type=int, default=None)
+    parser.add_argument("--stub-port", type=int, default=None)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=10, help="percent; with --compare")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--serve-stubs", action="store_true", help=argparse.SUPPRESS)
+    return parser
+
+
+def measure(args):
+    """Start query-service, send the load and summarize it."""
+    args.port = args.port or _free_port()
+    args.auth_port = args.auth_port or _free_port()
+    args.stub_port = args.stub_port or _free_port()
+    return summarize(args, *asyncio.run(run(args)))
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.serve:
+        serve(args)
+        return
+    if args.serve_stubs:
+        serve_stubs(args)
+        return
+
+    result = measure(args)
+    print_report(result)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(result, indent=2) + "\n")
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        if compare(result, json.loads(Path(args.compare).read_text()), args.max_regression):
+            print(f"\nRegression above {args.max_regression:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compare query-service's throughput, latency and memory per worker as it runs with more
+worker processes under query-service/server.py.
+
+Runs benchmarks/query_load.py once per count in --workers, with the same traffic and
+stand-ins each time (every query_load option applies). Send more traffic than one worker
+can serve so throughput shows what the extra workers add. Set the embedder or reranker to
+a local model to measure the memory the workers share. From the repo root:
+
+    python -m benchmarks.query_workers --workers 1,2,4 --embedding-provider local \\
+        --rerank-mode cross-encoder --rps 50 --duration 30 --output bench/query_workers.json
+
+Results are written as JSON with the commit they were measured at.
+"""
+import argparse
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks import query_load
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args, load_args = parser.parse_known_args()
+
+    runs = []
+    for workers in (int(count) for count in args.workers.split(",")):
+        load = query_load.build_parser().parse_args(load_args)
+        load.workers = workers
+        print(f"\n--- {workers} worker{'s' if workers != 1 else ''}")
+        result = query_load.measure(load)
+        query_load.print_report(result)
+        runs.append({"workers": workers, **{key: result[key] for key in (
+            "requests", "throughput_rps", "latency_ms", "stages_ms", "memory_mb"
+        )}})
+
+    print(f"\n{'workers':>7s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'RSS MB':>8s} {'PSS MB':>8s} {'private':>8s} {'total PSS':>10s}")
+    for run in runs:
+        latency, memory = run["latency_ms"] or {}, run["memory_mb"] or {}
+        print(
+            f"{run['workers']:7d} {run['throughput_rps']:8.1f} {latency.get('p50', 0):8.0f} {latency.get('p95', 0):8.0f}"
+            f" {memory.get('rss_per_worker', 0):8.0f} {memory.get('pss_per_worker', 0):8.0f}"
+            f" {memory.get('private_per_worker', 0):8.0f} {memory.get('total_pss', 0):10.0f}"
+        )
+
+    if args.output:
+        config = vars(query_load.build_parser().parse_args(load_args))
+        report = {
+            "benchmark": "query_workers",
+            "commit": query_load._git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "config": {name: value for name, value in config.items() if name not in query_load.NOT_CONFIG + ("workers",)},
+            "runs": runs,
+        }
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Compare embedding-worker's document throughput under different Celery execution settings.
+
+Queues --documents synthetic PDFs, a --long-fraction of them --long-pages long and the
+rest --short-pages, then starts --workers Celery workers of --concurrency pool processes
+each to drain the queue. This is repeated once per entry in --settings:
+
+- before: Celery's defaults. Each process reserves 4 messages and acknowledges them on
+  receipt, and the embedding model is loaded by the first task each process runs.
+- default, cpu_heavy or io: that profile from embedding-worker/celery_config.py, with its
+  prefetch, acknowledgement and memory settings, and the model loaded in worker_process_init.
+
+Each task does the CPU-heavy part of process_document (PyMuPDF extraction, chunking,
+embedding) without S3, Postgres or the vector store. It embeds with the deterministic
+fake embedder, or with --embedder local. The fake embedder stands in for a model: it
+waits --model-load-s to load and keeps the CPU busy for --embed-ms per chunk.
+
+Reported per setting:
+- seconds from starting the workers to the last document done, and documents and
+  pages per second
+- how long documents waited for a process (p50/p95)
+- pool utilisation: the share of the run's process time spent processing. Work held by
+  one worker while another idles shows up here.
+
+Needs the embedding-worker requirements and a broker. Redis from docker compose is used
+by default; each run gets a queue of its own. `--broker filesystem://` needs no server,
+but it polls for messages, which delays tasks acknowledged late. Use it to try the
+benchmark, not to compare settings.
+From the repo root:
+
+    python -m benchmarks.worker_throughput --settings before,cpu_heavy --output bench/worker_throughput.json
+
+Results are written as JSON with the commit they were measured at.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from celery import Celery
+from celery.signals import worker_process_init
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+WORKER_PATHS = [REPO_ROOT / "embedding-worker", REPO_ROOT / "ingestion-service", REPO_ROOT]
+CONFIG_ENV = "WORKER_BENCHMARK_CONFIG"
+TASK_NAME = "benchmark.process_document"
+
+# Celery's own defaults, as embedding-worker ran before it had profiles
+BEFORE = {"worker_prefetch_multiplier": 4, "task_acks_late": False}
+
+_config = None
+_embedder = None
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def celery_settings(setting: str) -> dict:
+    """The Celery settings a --settings entry stands for"""
+    if setting == "before":
+        return dict(BEFORE)
+    sys.path[:0] = [str(path) for path in WORKER_PATHS]
+    from celery_config import WORKER_PROFILES, worker_config
+
+    if setting not in WORKER_PROFILES:
+        raise SystemExit(f"Unknown setting {setting!r}: use before or one of {', '.join(WORKER_PROFILES)}")
+    # The benchmark's own queue replaces the profile's
+    return {key: value for key, value in worker_config(WORKER_PROFILES[setting]).items() if key != "task_queues"}
+
+
+def _transport_options(broker: str, run_dir: str) -> dict:
+    if broker.startswith("filesystem://"):
+        folder = os.path.join(run_dir, "broker")
+        os.makedirs(folder, exist_ok=True)
+        return {
+            "data_folder_in": folder, "data_folder_out": folder,
+            "control_folder": os.path.join(run_dir, "control"), "polling_interval": 0.05,
+        }
+    return {}
+
+
+def make_app(config: dict) -> Celery:
+    app = Celery("worker_benchmark", broker=config["broker"])
+    app.conf.update(
+        task_serializer="json",
+        accept_content=["json"],
+        broker_transport_options=_transport_options(config["broker"], config["run_dir"]),
+        worker_hijack_root_logger=False,
+        worker_enable_remote_control=False,
+        **config["celery"],
+    )
+    app.task(name=TASK_NAME)(process_document)
+    return app
+
+
+def _get_embedder():
+    """The embedder of this process, loaded on first use: (embedder, seconds spent loading it now)"""
+    global _embedder
+    if _embedder is not None:
+        return _embedder, 0.0
+    started = time.perf_counter()
+    if _config["embedder"] == "local":
+        from embedding_providers import get_embedding_provider
+        _embedder = get_embedding_provider("local", _config["model"])
+    else:
+        from benchmarks.ingestion import FakeEmbeddingProvider
+        time.sleep(_config["model_load_s"])
+        _embedder = FakeEmbeddingProvider(_config["dim"])
+    _embedder.embed(["warm up"])
+    return _embedder, time.perf_counter() - started
+
+
+def _preload(**kwargs):
+    _get_embedder()
+
+
+def process_document(path: str):
+    started = time.time()
+    from core.chunking import chunk_text
+    from core.pdf_parser import extract_text_by_page
+
+    pages = extract_text_by_page(path)
+    chunks = [chunk for _, page_text in pages if page_text.strip() for chunk in chunk_text(page_text)]
+    embedder, model_load_s = _get_embedder()
+    embedder.embed(chunks)
+    if _config["embedder"] == "fake":
+        # Inference time, spent on the CPU as a model's would be
+        busy_until = time.perf_counter() + _config["embed_ms"] * len(chunks) / 1000
+        while time.perf_counter() < busy_until:
+            pass
+    record = {
+        "pid": os.getpid(), "started": started, "finished": time.time(),
+        "pages": len(pages), "chunks": len(chunks), "model_load_s": model_load_s,
+    }
+    # One small O_APPEND write per document, so the pool processes' lines never interleave
+    fd = os.open(_config["results"], os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        os.write(fd, (json.dumps(record) + "\n").encode())
+    finally:
+        os.close(fd)
+
+
+def make_documents(args, directory: str):
+    """Paths and page counts of the queued documents, long ones spread through the queue"""
+    from benchmarks.ingestion import make_pdf
+
+    rng = random.Random(args.seed)
+    long_count = round(args.documents * args.long_fraction)
+    sizes = [args.long_pages] * long_count + [args.short_pages] * (args.documents - long_count)
+    rng.shuffle(sizes)
+    documents = []
+    for number, pages in enumerate(sizes):
+        path = os.path.join(directory, f"document_{number}.pdf")
+        Path(path).write_bytes(make_pdf("prose", pages, seed=number))
+        documents.append((path, pages))
+    return documents
+
+
+def run(args, setting: str, documents) -> dict:
+    """Queue the documents, drain them with fresh workers and summarize the run"""
+    with tempfile.TemporaryDirectory(prefix="worker_benchmark_") as run_dir:
+        config = {
+            "broker": args.broker,
+            "run_dir": run_dir,
+            "results": os.path.join(run_dir, "results.jsonl"),
+            "embedder": args.embedder,
+            "model": args.model,
+            "dim": args.dim,
+            "model_load_s": args.model_load_s,
+            "embed_ms": args.embed_ms,
+            "preload": setting != "before",
+            "celery": celery_settings(setting),
+        }
+        queue = f"worker_benchmark_{uuid.uuid4().hex[:8]}"
+        app = make_app(config)
+        for path, _ in documents:
+            app.send_task(TASK_NAME, args=[path], queue=queue)
+
+        env = dict(
+            os.environ,
+            **{CONFIG_ENV: json.dumps(config)},
+            PYTHONPATH=os.pathsep.join(filter(None, [str(path) for path in WORKER_PATHS] + [os.getenv("PYTHONPATH")])),
+        )
+        command = [
+            sys.executable, "-m", "celery", "-A", "benchmarks.worker_throughput", "worker",
+            "--pool", "prefork", "--concurrency", str(args.concurrency), "--queues", queue,
+            "--loglevel", "warning", "--without-gossip", "--without-mingle", "--without-heartbeat",
+        ]
+        started = time.time()
+        workers = [
+            subprocess.Popen(command + ["--hostname", f"benchmark{number}@%h"], cwd=REPO_ROOT, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for number in range(args.workers)
+        ]
+        try:
+            records = []
+            while len(records) < len(documents):
+                if time.time() - started > args.timeout:
+                    raise SystemExit(f"{setting}: only {len(records)} of {len(documents)} documents done in {args.timeout}s")
+                if any(worker.poll() is not None for worker in workers):
+                    raise SystemExit(f"{setting}: a worker exited early, run its command by hand to see why:\n{' '.join(command)}")
+                time.sleep(0.1)
+                if os.path.exists(config["results"]):
+                    records = [json.loads(line) for line in Path(config["results"]).read_text().splitlines()]
+        finally:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                try:
+                    worker.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    worker.kill()
+    return summarize(setting, config, records, started, args.workers * args.concurrency)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(setting: str, config: dict, records, started: float, processes: int) -> dict:
+    seconds = max(record["finished"] for record in records) - started
+    waits = [record["started"] - started for record in records]
+    busy = defaultdict(float)
+    for record in records:
+        busy[record["pid"]] += record["finished"] - record["started"]
+    first_start = min(record["started"] for record in records)
+    pages = sum(record["pages"] for record in records)
+    loads = [record["model_load_s"] for record in records if record["model_load_s"]]
+    return {
+        "setting": setting,
+        "celery": config["celery"],
+        "model_loaded_at_process_start": config["preload"],
+        "documents": len(records),
+        "pages": pages,
+        "seconds": round(seconds, 2),
+        "documents_per_second": round(len(records) / seconds, 3),
+        "pages_per_second": round(pages / seconds, 2),
+        "wait_seconds": {"p50": round(_percentile(waits, 0.5), 2), "p95": round(_percentile(waits, 0.95), 2)},
+        "pool_utilisation": round(sum(busy.values()) / (processes * (seconds - (first_start - started))), 3),
+        "model_loads_in_tasks": len(loads),
+        "model_load_seconds_in_tasks": round(sum(loads), 2),
+    }
+
+
+def print_report(results):
+    print(f"\n{'setting':10s} {'seconds':>8s} {'docs/s':>7s} {'pages/s':>8s} {'wait p50':>9s} {'wait p95':>9s} {'pool use':>9s} {'loads in tasks':>15s}")
+    for result in results:
+        print(
+            f"{result['setting']:10s} {result['seconds']:8.1f} {result['documents_per_second']:7.2f} {result['pages_per_second']:8.1f}"
+            f" {result['wait_seconds']['p50']:9.1f} {result['wait_seconds']['p95']:9.1f} {result['pool_utilisation']:9.0%}"
+            f" {result['model_loads_in_tasks']:15d}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--settings", default="before,cpu_heavy", help="comma-separated: before, or profiles from celery_config.py")
+    parser.add_argument("--broker", default=os.getenv("CELERY_REDIS_URL") or os.getenv("REDIS_URL") or "redis://localhost:6379/0")
+    parser.add_argument("--documents", type=int, default=24)
+    parser.add_argument("--long-fraction", type=float, default=0.25)
+    parser.add_argument("--long-pages", type=int, default=200)
+    parser.add_argument("--short-pages", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=2, help="worker instances, as separate containers would run")
+    parser.add_argument("--concurrency", type=int, default=1, help="pool processes per worker")
+    parser.add_argument("--embedder", choices=["fake", "local"], default="fake")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="with --embedder local")
+    parser.add_argument("--dim", type=int, default=384, help="with --embedder fake")
+    parser.add_argument("--model-load-s", type=float, default=3.0, help="with --embedder fake: time to stand in for loading a model")
+    parser.add_argument("--embed-ms", type=float, default=5.0, help="with --embedder fake: CPU time per chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=1800, help="seconds to wait for each setting's run")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="worker_benchmark_documents_") as directory:
+        documents = make_documents(args, directory)
+        results = []
+        for setting in args.settings.split(","):
+            print(f"--- {setting}")
+            results.append(run(args, setting, documents))
+    print_report(results)
+
+    if args.output:
+        config = {name: value for name, value in vars(args).items() if name not in ("settings", "broker", "output", "timeout")}
+        report = {
+            "benchmark": "worker_throughput",
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "config": config,
+            "runs": results,
+        }
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nResults written to {args.output}")
+
+
+# The app a benchmark worker process loads, set up from the run's configuration
+if CONFIG_ENV in os.environ:
+    _config = json.loads(os.environ[CONFIG_ENV])
+    app = make_app(_config)
+    if _config["preload"]:
+        worker_process_init.connect(_preload, weak=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,11 @@
-import os
-from qdrant_client import QdrantClient
+"""
+Create the Qdrant collection, its keyword payload indexes and scalar quantization.
 
-QDRANT_URL = os.environ["QDRANT_URL"]
-QDRANT_API_KEY = os.environ["QDRANT_API_KEY"]
-COLLECTION_NAME = os.environ.get("QDRANT_COLLECTION", "classgpt_chunks")
+The worker and query service do this themselves at startup; this script is for
+preparing a collection ahead of a deploy or a migration. Uses the same QDRANT_*
+environment variables as the services.
+"""
+from shared.vector_store import create_vector_store
 
-client = QdrantClient(
-    url=QDRANT_URL,
-    api_key=QDRANT_API_KEY
-)
-
-print(f"Creating payload index for 'user_id'...")
-client.create_payload_index(
-    collection_name=COLLECTION_NAME,
-    field_name="user_id",
-    field_schema="keyword"
-)
-print("Done.")
-
-print(f"Creating payload index for 'class_id'...")
-client.create_payload_index(
-    collection_name=COLLECTION_NAME,
-    field_name="class_id",
-    field_schema="keyword"
-)
-print("Done.") 
\ No newline at end of file
+store = create_vector_store("qdrant")
+print(f"Collection '{store.collection_name}' is ready with payload indexes and quantization.")
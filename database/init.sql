@@ -13,6 +13,7 @@ CREATE TABLE classes (
   id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
   user_id UUID, -- In a real app, this would link to a users table
   name TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'active', -- "active" or "deleting"
   created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -21,7 +22,7 @@ CREATE TABLE documents (
   id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
   class_id UUID NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
   filename TEXT NOT NULL,
-  status TEXT NOT NULL, -- e.g., "pending", "processing", "indexed", "failed"
+  status TEXT NOT NULL, -- e.g., "uploading", "pending", "processed", "failed", "deleting"
   uploaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
   updated_at TIMESTAMP DEFAULT NOW()
 );
@@ -42,6 +43,7 @@ CREATE TABLE IF NOT EXISTS document_chunks (
     document_id UUID REFERENCES documents(id) ON DELETE CASCADE,
     chunk_index INTEGER NOT NULL,
     content TEXT NOT NULL,
+    page_number INTEGER,
     created_at TIMESTAMP DEFAULT NOW()
 );
 
@@ -55,4 +57,76 @@ INSERT INTO classes (id, user_id, name) VALUES
 ('747ac10b-58cc-4372-a567-0e02b2c3d479', 'a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11', 'MATH240');
 
 -- Add updated_at column to existing documents table if not present
-ALTER TABLE documents ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW(); 
\ No newline at end of file
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+
+-- Add status column to existing classes table if not present (used for background deletion)
+ALTER TABLE classes ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'active';
+
+-- Parsed S3 location of each document, so presigning never re-parses s3_url
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS s3_bucket TEXT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS s3_key TEXT;
+
+-- Owner and S3 location of each document
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS user_id UUID;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS s3_url TEXT;
+
+-- Per-user usage counters, kept up to date in the same transaction as document and class
+-- inserts/deletes so quota checks are a single row lookup. Reconciled periodically by the worker.
+CREATE TABLE IF NOT EXISTS user_usage (
+  user_id UUID PRIMARY KEY,
+  document_count INTEGER NOT NULL DEFAULT 0,
+  class_count INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_documents_user_id ON documents(user_id);
+CREATE INDEX IF NOT EXISTS idx_classes_user_id ON classes(user_id);
+
+-- Per-class change counter for the documents listing ETag. Bumped by a trigger whenever a
+-- document of the class is added, removed, or changes a listed column.
+ALTER TABLE classes ADD COLUMN IF NOT EXISTS documents_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_class_documents_version() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP <> 'INSERT' THEN
+    UPDATE classes SET documents_version = documents_version + 1 WHERE id = OLD.class_id;
+  END IF;
+  IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.class_id IS DISTINCT FROM OLD.class_id) THEN
+    UPDATE classes SET documents_version = documents_version + 1 WHERE id = NEW.class_id;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS documents_version_insert_delete ON documents;
+CREATE TRIGGER documents_version_insert_delete
+  AFTER INSERT OR DELETE ON documents
+  FOR EACH ROW EXECUTE FUNCTION bump_class_documents_version();
+
+DROP TRIGGER IF EXISTS documents_version_update ON documents;
+CREATE TRIGGER documents_version_update
+  AFTER UPDATE ON documents
+  FOR EACH ROW
+  WHEN (OLD.class_id IS DISTINCT FROM NEW.class_id
+        OR OLD.filename IS DISTINCT FROM NEW.filename
+        OR OLD.status IS DISTINCT FROM NEW.status
+        OR OLD.uploaded_at IS DISTINCT FROM NEW.uploaded_at)
+  EXECUTE FUNCTION bump_class_documents_version();
+
+-- Keyset pagination of a class's documents on (uploaded_at, id)
+CREATE INDEX IF NOT EXISTS idx_documents_class_uploaded_at_id ON documents(class_id, uploaded_at, id);
+
+-- Text extracted from each distinct uploaded file, keyed by the SHA-256 of its bytes, so
+-- documents can be chunked again without downloading and parsing the PDF
+-- (shared/extracted_text.py). pages_zlib is zlib-compressed JSON: [[page_number, text], ...]
+CREATE TABLE IF NOT EXISTS extracted_texts (
+  content_hash TEXT PRIMARY KEY,
+  extractor TEXT NOT NULL,
+  page_count INTEGER NOT NULL,
+  text_bytes INTEGER NOT NULL,
+  pages_zlib BYTEA NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash);
\ No newline at end of file
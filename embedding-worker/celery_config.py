@@ -1,12 +1,33 @@
-import os
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple
+
 from celery import Celery
+from kombu import Exchange, Queue
 from pydantic_settings import BaseSettings
-from typing import Optional
+
+from shared.task_routes import TASK_ROUTES, EMBEDDING_QUEUE, DELETION_QUEUE
 
 class Settings(BaseSettings):
     REDIS_URL: str = "redis://redis:6379"
     CELERY_REDIS_URL: Optional[str] = None  # Optional, for Celery-specific Redis URL
     DATABASE_URL: str = "postgresql://postgres:postgres@db:5432/classgpt"
+    USAGE_RECONCILE_INTERVAL: int = 15 * 60  # seconds between user_usage reconciliations
+    # Documents still "uploading" this many seconds after their presign are deleted. Keep it
+    # well above PRESIGNED_UPLOAD_EXPIRES_IN so no upload can still land after the sweep.
+    STALE_UPLOAD_AGE: int = 24 * 60 * 60
+    STALE_UPLOAD_SWEEP_INTERVAL: int = 60 * 60
+    # How this worker takes and runs tasks: a name from WORKER_PROFILES, whose settings the
+    # CELERY_* values below override one by one
+    CELERY_WORKER_PROFILE: str = "default"
+    CELERY_QUEUES: Optional[str] = None  # comma-separated
+    CELERY_PREFETCH_MULTIPLIER: Optional[int] = None
+    CELERY_ACKS_LATE: Optional[bool] = None
+    CELERY_MAX_MEMORY_PER_CHILD_MB: Optional[int] = None
+    CELERY_MAX_TASKS_PER_CHILD: Optional[int] = None
+    # Seconds a new pool process may take in worker_process_init, which loads the embedding
+    # models, before the pool kills it. Celery's default of 4 is shorter than a cold load of
+    # a local SentenceTransformer model, which would kill every process it starts.
+    CELERY_PROC_ALIVE_TIMEOUT: float = 300
 
     class Config:
         env_file = ".env"
@@ -16,9 +37,65 @@ settings = Settings()
 # Use CELERY_REDIS_URL if set, otherwise fall back to REDIS_URL
 celery_broker_url = settings.CELERY_REDIS_URL or settings.REDIS_URL
 
-print("ENV REDIS_URL:", os.environ.get("REDIS_URL"))
-print("ENV CELERY_REDIS_URL:", os.environ.get("CELERY_REDIS_URL"))
-print("CELERY BROKER URL:", celery_broker_url)
+TASK_TIME_LIMIT = 30 * 60  # 30 minutes
+
+@dataclass(frozen=True)
+class WorkerProfile:
+    queues: Tuple[str, ...]
+    # Messages each pool process reserves ahead of the one it is running. A reserved
+    # message waits for that process even while other processes are idle.
+    prefetch_multiplier: int
+    # Acknowledge a message once its task has finished rather than when it starts, so
+    # tasks running when the worker is stopped or dies are delivered again
+    acks_late: bool
+    # Replace a pool process after its task once it holds more than this much memory
+    max_memory_per_child_mb: Optional[int] = None
+    max_tasks_per_child: Optional[int] = None
+
+WORKER_PROFILES = {
+    # Every task in one worker, as docker-compose runs it
+    "default": WorkerProfile(
+        queues=(EMBEDDING_QUEUE, DELETION_QUEUE), prefetch_multiplier=1, acks_late=True, max_memory_per_child_mb=2048,
+    ),
+    # Documents only: long, CPU-heavy tasks in processes holding an embedding model
+    "cpu_heavy": WorkerProfile(
+        queues=(EMBEDDING_QUEUE,), prefetch_multiplier=1, acks_late=True, max_memory_per_child_mb=2048,
+    ),
+    # Deletions and maintenance: short tasks, mostly waiting on the network
+    "io": WorkerProfile(
+        queues=(DELETION_QUEUE,), prefetch_multiplier=8, acks_late=True,
+    ),
+}
+
+def get_worker_profile(settings: Settings) -> WorkerProfile:
+    """The profile CELERY_WORKER_PROFILE names, with any CELERY_* overrides applied"""
+    if settings.CELERY_WORKER_PROFILE not in WORKER_PROFILES:
+        raise ValueError(f"Unknown CELERY_WORKER_PROFILE: {settings.CELERY_WORKER_PROFILE}")
+    overrides = {
+        "queues": tuple(queue.strip() for queue in settings.CELERY_QUEUES.split(",")) if settings.CELERY_QUEUES else None,
+        "prefetch_multiplier": settings.CELERY_PREFETCH_MULTIPLIER,
+        "acks_late": settings.CELERY_ACKS_LATE,
+        "max_memory_per_child_mb": settings.CELERY_MAX_MEMORY_PER_CHILD_MB,
+        "max_tasks_per_child": settings.CELERY_MAX_TASKS_PER_CHILD,
+    }
+    return replace(WORKER_PROFILES[settings.CELERY_WORKER_PROFILE], **{k: v for k, v in overrides.items() if v is not None})
+
+def worker_config(profile: WorkerProfile) -> dict:
+    """Celery settings running a worker with the given profile"""
+    return dict(
+        # Declared as `celery worker -Q` and the senders' routes declare them
+        task_queues=[Queue(queue, Exchange(queue), routing_key=queue) for queue in profile.queues],
+        worker_prefetch_multiplier=profile.prefetch_multiplier,
+        task_acks_late=profile.acks_late,
+        # A pool process killed mid-task (e.g. out of memory) fails the task instead of
+        # putting it back, so one document that crashes the worker cannot do so forever.
+        # tasks.ProcessDocumentRequest then marks the document failed.
+        task_reject_on_worker_lost=False,
+        worker_max_memory_per_child=profile.max_memory_per_child_mb * 1024 if profile.max_memory_per_child_mb else None,  # KiB
+        worker_max_tasks_per_child=profile.max_tasks_per_child,
+    )
+
+worker_profile = get_worker_profile(settings)
 
 # Create Celery app
 celery_app = Celery(
@@ -36,6 +113,22 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
-    task_time_limit=30 * 60,  # 30 minutes
+    task_time_limit=TASK_TIME_LIMIT,
     task_soft_time_limit=25 * 60,  # 25 minutes
-) 
\ No newline at end of file
+    task_routes=TASK_ROUTES,
+    # Redis delivers an unacknowledged message again after this long. With late acks it
+    # must outlast the longest task, or a running task would be handed to a second worker.
+    broker_transport_options={"visibility_timeout": 2 * TASK_TIME_LIMIT},
+    worker_proc_alive_timeout=settings.CELERY_PROC_ALIVE_TIMEOUT,
+    beat_schedule={
+        "reconcile-usage-counters": {
+            "task": "tasks.reconcile_usage_counters",
+            "schedule": settings.USAGE_RECONCILE_INTERVAL,
+        },
+        "expire-stale-uploads": {
+            "task": "tasks.expire_stale_uploads",
+            "schedule": settings.STALE_UPLOAD_SWEEP_INTERVAL,
+        },
+    },
+    **worker_config(worker_profile),
+)
\ No newline at end of file
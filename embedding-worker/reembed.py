@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Re-embed every stored chunk into a new index, e.g. after changing the embedding model
+or dimension, without re-uploading any PDF.
+
+    python reembed.py start --provider local --model all-MiniLM-L6-v2 --dim 384 --name classgpt_chunks_minilm
+    python reembed.py status
+    python reembed.py cutover    # only needed after `start --no-cutover`
+    python reembed.py abort
+
+`start` registers the new index as pending, so from then on the worker writes every new
+upload to both indexes. It then reads document_chunks in primary-key order in large
+batches, reading the next batch while the current one is embedded with several provider
+requests in flight, and upserts the vectors under the same IDs the worker uses.
+
+Progress, throughput and ETA are kept in Redis (see `status`, or GET /embedding-index on
+query-service) together with the last chunk ID written, so running `start` again with
+the same index resumes. When the last batch is written the pending index becomes the
+active one in a single Redis transaction, and query-service switches its query model and
+index together within EMBEDDING_INDEX_CACHE_TTL seconds.
+
+The old index is left untouched so the switch can be undone; delete it once the new one
+has been checked.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+
+from sqlalchemy import text
+
+from celery_config import settings
+from embedding_providers import get_embedding_provider
+from shared.database import create_db_engine, create_session_factory, session_scope
+from shared.embedding_index import (
+    EMBEDDING_INDEX_CACHE_TTL,
+    EmbeddingIndex,
+    clear_pending_index,
+    cutover,
+    get_active_index,
+    get_pending_index,
+    get_reembed_progress,
+    set_pending_index,
+    set_reembed_progress,
+)
+from shared.vector_store import VectorRecord, chunk_vector_id, tenant_namespace
+
+CHUNKS_QUERY = text("""
+    SELECT c.id, c.document_id, c.chunk_index, c.content, c.page_number, d.user_id, d.class_id
+    FROM document_chunks c
+    JOIN documents d ON d.id = c.document_id
+    WHERE c.id > :after_id AND d.status = 'processed'
+    ORDER BY c.id
+    LIMIT :limit
+""")
+COUNT_QUERY = text("""
+    SELECT count(*) FROM document_chunks c
+    JOIN documents d ON d.id = c.document_id
+    WHERE d.status = 'processed'
+""")
+
+engine = create_db_engine(settings.DATABASE_URL, name="reembed")
+SessionLocal = create_session_factory(engine)
+
+
+def read_chunks(after_id, limit):
+    with session_scope(SessionLocal) as db:
+        return db.execute(CHUNKS_QUERY, {"after_id": after_id, "limit": limit}).fetchall()
+
+
+def count_chunks():
+    with session_scope(SessionLocal) as db:
+        return db.execute(COUNT_QUERY).scalar()
+
+
+def embed_rows(provider, rows, executor, embed_batch_size):
+    """Embed the rows' content with one provider request per embed_batch_size rows, in parallel"""
+    batches = [rows[i:i + embed_batch_size] for i in range(0, len(rows), embed_batch_size)]
+    results = executor.map(lambda batch: provider.embed([row.content for row in batch]), batches)
+    return [embedding for batch in results for embedding in batch]
+
+
+def write_rows(index, rows, embeddings):
+    """Upsert the vectors grouped by class namespace, with the metadata the worker writes"""
+    by_namespace = {}
+    for row, embedding in zip(rows, embeddings):
+        if len(embedding) != index.dimension:
+            raise ValueError(f"{index.model} returned {len(embedding)}-dimensional embeddings, not {index.dimension}")
+        metadata = {
+            "user_id": str(row.user_id),
+            "class_id": str(row.class_id),
+            "document_id": str(row.document_id),
+            "chunk_index": row.chunk_index,
+            "content": row.content,
+        }
+        if row.page_number is not None:
+            metadata["page_number"] = row.page_number
+        by_namespace.setdefault(tenant_namespace(row.user_id, row.class_id), []).append(
+            VectorRecord(id=chunk_vector_id(row.document_id, row.chunk_index), values=embedding, metadata=metadata)
+        )
+    store = index.store()
+    for namespace, records in by_namespace.items():
+        store.upsert_batch(records, namespace=namespace)
+
+
+def print_status():
+    active, pending, progress = get_active_index(), get_pending_index(), get_reembed_progress()
+    print(f"📊 Active index: {asdict(active)}")
+    print(f"🏗️  Pending index: {asdict(pending) if pending else None}")
+    if progress:
+        eta = progress.get("eta_seconds")
+        print(
+            f"⏱️  {progress['state']}: {progress['processed']}/{progress['total']} chunks, "
+            f"{progress.get('rate') or 0:.0f} chunks/s, ETA {f'{eta / 60:.0f} min' if eta is not None else 'unknown'}"
+        )
+
+
+def copy_chunks(target, progress, args):
+    """Embed and write every chunk after progress["last_chunk_id"], recording progress after each batch"""
+    provider = get_embedding_provider(target.provider, target.model)
+    processed_this_run = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as embedder, ThreadPoolExecutor(max_workers=1) as reader:
+        rows = read_chunks(progress["last_chunk_id"], args.batch_size)
+        while rows:
+            # Read the next batch while this one is embedded
+            next_rows = reader.submit(read_chunks, rows[-1].id, args.batch_size)
+            write_rows(target, rows, embed_rows(provider, rows, embedder, args.embed_batch_size))
+
+            processed_this_run += len(rows)
+            elapsed = time.time() - progress["started_at"]
+            rate = processed_this_run / elapsed if elapsed else None
+            progress.update(
+                processed=progress["processed"] + len(rows),
+                last_chunk_id=rows[-1].id,
+                rate=rate,
+                eta_seconds=max(progress["total"] - progress["processed"] - len(rows), 0) / rate if rate else None,
+                updated_at=time.time(),
+            )
+            set_reembed_progress(progress)
+            print(f"📦 {progress['processed']}/{progress['total']} chunks, {rate or 0:.0f} chunks/s")
+            rows = next_rows.result()
+
+
+def start(args):
+    target = EmbeddingIndex(provider=args.provider, model=args.model, dimension=args.dim, name=args.name)
+    if target == get_active_index():
+        raise SystemExit("❌ That index is already active")
+    pending = get_pending_index()
+    if pending and pending != target:
+        raise SystemExit(f"❌ Another index is being built: {asdict(pending)}. Run `reembed.py abort` first.")
+
+    progress = get_reembed_progress()
+    if progress and progress["index"] == asdict(target) and progress["state"] != "done":
+        print(f"▶️  Resuming after chunk {progress['last_chunk_id']} ({progress['processed']} chunks done)")
+    else:
+        progress = {"index": asdict(target), "processed": 0, "last_chunk_id": 0}
+    progress.update(state="running", total=count_chunks(), started_at=time.time(), rate=None, eta_seconds=None)
+    set_reembed_progress(progress)
+
+    target.store()  # create the index or collection before anything writes to it
+    set_pending_index(target)
+    # Let every worker pick up the pending index, so uploads from here on are dual-written
+    time.sleep(EMBEDDING_INDEX_CACHE_TTL + 1)
+
+    try:
+        copy_chunks(target, progress, args)
+    except BaseException:
+        # Interrupted or failed: the next `start` resumes after the last chunk written
+        progress["state"] = "failed"
+        set_reembed_progress(progress)
+        raise
+
+    if args.no_cutover:
+        progress.update(state="ready", eta_seconds=0)
+        set_reembed_progress(progress)
+        print("✅ Re-embedding complete. Run `reembed.py cutover` to switch query-service to the new index.")
+        return
+    cutover()
+    progress.update(state="done", eta_seconds=0)
+    set_reembed_progress(progress)
+    print(f"✅ Re-embedded {progress['processed']} chunks; {asdict(target)} is now the active index")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    start_parser = commands.add_parser("start", help="build a new index from document_chunks, then switch to it")
+    start_parser.add_argument("--provider", required=True, choices=["openai", "local"])
+    start_parser.add_argument("--model", required=True)
+    start_parser.add_argument("--dim", type=int, required=True)
+    start_parser.add_argument("--name", required=True, help="new Pinecone index or Qdrant collection")
+    start_parser.add_argument("--batch-size", type=int, default=2000, help="chunks read from the database at a time")
+    start_parser.add_argument("--embed-batch-size", type=int, default=256, help="chunks per embedding request")
+    start_parser.add_argument("--concurrency", type=int, default=4, help="embedding requests in flight")
+    start_parser.add_argument("--no-cutover", action="store_true", help="leave the new index pending when done")
+    commands.add_parser("status")
+    commands.add_parser("cutover", help="make the pending index active")
+    commands.add_parser("abort", help="stop dual-writing to the pending index")
+    args = parser.parse_args()
+
+    if args.command == "start":
+        start(args)
+    elif args.command == "status":
+        print_status()
+    elif args.command == "cutover":
+        progress = get_reembed_progress()
+        if progress and progress["state"] == "running":
+            raise SystemExit("❌ The re-embedding job is still running; it cuts over by itself when done")
+        print(f"✅ Active index is now {asdict(cutover())}")
+    elif args.command == "abort":
+        clear_pending_index()
+        progress = get_reembed_progress()
+        if progress:
+            progress["state"] = "aborted"
+            set_reembed_progress(progress)
+        print("🛑 Pending index cleared; its vectors are left in place")
+
+
+if __name__ == "__main__":
+    main()
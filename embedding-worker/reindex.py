@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Chunk and embed processed documents again, e.g. after changing how text is chunked,
+without re-uploading any PDF.
+
+    python reindex.py --class-id 3f2b...     # one class
+    python reindex.py --all                  # every processed document
+
+Each document is queued as a normal process_document task. Documents whose extracted
+text is stored (see shared/extracted_text.py) are chunked from it, so their PDFs are
+neither downloaded nor parsed; older documents are extracted once more and stored then.
+Documents stay "processed" and searchable while they are re-indexed. Their chunks are
+replaced in one transaction, then their vectors are overwritten under the same IDs, so
+until that finishes a search can match a mix of old and new vectors. If re-indexing a
+document fails, before or after its new chunks are committed, it keeps the "processed"
+status and the task is retried (tasks.PROCESSED_MAX_RETRIES times, with backoff). If it
+still fails, the document keeps whichever chunks were last committed, and the error is
+in the worker log.
+"""
+import argparse
+
+from sqlalchemy import text
+
+from celery_config import celery_app, settings
+from shared.database import create_db_engine, create_session_factory, session_scope
+
+DOCUMENTS_QUERY = text("""
+    SELECT id, s3_url, content_hash FROM documents
+    WHERE status = 'processed' AND (CAST(:class_id AS uuid) IS NULL OR class_id = CAST(:class_id AS uuid))
+    ORDER BY uploaded_at, id
+""")
+
+engine = create_db_engine(settings.DATABASE_URL, name="reindex")
+SessionLocal = create_session_factory(engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--class-id", help="re-index the processed documents of this class")
+    target.add_argument("--all", action="store_true", help="re-index every processed document")
+    parser.add_argument("--dry-run", action="store_true", help="count the documents without queueing them")
+    args = parser.parse_args()
+
+    with session_scope(SessionLocal) as db:
+        rows = db.execute(DOCUMENTS_QUERY, {"class_id": args.class_id}).fetchall()
+    stored = sum(1 for row in rows if row.content_hash)
+    print(f"📄 {len(rows)} documents to re-index, {stored} with stored text, {len(rows) - stored} to extract again")
+    if args.dry_run:
+        return
+
+    for row in rows:
+        celery_app.send_task('tasks.process_document', args=[str(row.id), row.s3_url])
+    print(f"✅ Queued {len(rows)} documents for re-indexing")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,83 @@
 import os
-import fitz  # PyMuPDF
 from celery import current_task, Task
-from celery_config import celery_app, settings
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from celery.signals import worker_process_init, worker_process_shutdown
+from celery.worker.request import Request
+from celery_config import celery_app, settings, worker_profile
+from sqlalchemy import text
 import json
 from embedding_providers import get_embedding_provider
-import openai
-from pinecone_utils import upsert_embeddings
+from shared.vector_store import VectorRecord, chunk_vector_id, tenant_namespace, VECTOR_STORE_LEGACY_FALLBACK
+from shared.embedding_index import get_active_index, get_write_indexes
+from shared.storage import get_s3_client, parse_s3_url, delete_s3_objects, S3_DELETE_BATCH_SIZE
+from shared.database import create_db_engine, create_session_factory, session_scope
+from shared.events import publish_document_event
+from shared.tracing import setup_tracing, shutdown_tracing, get_tracer, current_trace_id
+from shared.task_routes import EMBEDDING_QUEUE
+from shared.extracted_text import content_hash as file_content_hash, load_pages, save_pages, delete_unreferenced
 from core.pdf_parser import extract_text_by_page
 from core.chunking import chunk_text
-import requests
-import boto3
-import re
-import io
 
-# Database setup
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Database setup. Each task uses a single session for its whole unit of work.
+engine = create_db_engine(settings.DATABASE_URL, name="embedding-worker")
+SessionLocal = create_session_factory(engine)
+
+tracer = get_tracer(__name__)
+
+@worker_process_init.connect
+def reset_db_pool(**kwargs):
+    """Forked worker processes must not share the parent's pooled connections"""
+    engine.dispose(close=False)
+
+@worker_process_init.connect
+def init_tracing(**kwargs):
+    """Span exporter threads do not survive the fork, so each worker process starts its own"""
+    setup_tracing("embedding-worker", engines=[engine], celery=True)
+
+@worker_process_shutdown.connect
+def flush_traces(**kwargs):
+    """Pool processes exit without running atexit handlers"""
+    shutdown_tracing()
+
+@worker_process_init.connect
+def init_s3_client(**kwargs):
+    """Each pool process builds its own S3 client once, instead of one per download"""
+    get_s3_client()
+
+@worker_process_init.connect
+def init_embedding_models(**kwargs):
+    """
+    Load the embedding models of the indexes being written to once per worker process,
+    before it takes a task, rather than in the first document it processes. A process
+    replaced for using too much memory loads them again here.
+    """
+    if EMBEDDING_QUEUE not in worker_profile.queues:
+        return
+    try:
+        for index in get_write_indexes():
+            get_embedding_provider(index.provider, index.model)
+    except Exception as e:
+        print(f"[CLASSGPT_DEBUG] Embedding models not loaded at startup, will load on first use: {e}")
+
+@worker_process_init.connect
+def init_vector_store(**kwargs):
+    """Connect to the vector store and create its collection/indexes before the first task"""
+    try:
+        get_active_index().store()
+    except Exception as e:
+        print(f"[CLASSGPT_DEBUG] Vector store not ready at startup, will retry on first use: {e}")
 
 def get_s3_file_bytes(s3_url):
     """Download file from S3 and return as bytes"""
-    match = re.match(r"https://([^.]+)\.s3\.[^.]+\.amazonaws\.com/(.+)", s3_url)
-    if not match:
+    parsed = parse_s3_url(s3_url)
+    if not parsed:
         raise ValueError("Invalid S3 URL format")
-    bucket, key = match.group(1), match.group(2)
-    s3 = boto3.client("s3")
-    obj = s3.get_object(Bucket=bucket, Key=key)
+    bucket, key = parsed
+    obj = get_s3_client().get_object(Bucket=bucket, Key=key)
     return obj["Body"].read()
 
 def extract_text_by_page_from_bytes(file_bytes):
     """Extract text from PDF bytes using PyMuPDF"""
+    import fitz  # imported on first use to keep worker boot fast
     try:
         # Open PDF from bytes
         doc = fitz.open(stream=file_bytes, filetype="pdf")
@@ -46,60 +93,105 @@ def extract_text_by_page_from_bytes(file_bytes):
         print(f"[CLASSGPT_DEBUG] Failed to extract text from PDF bytes: {e}")
         return None
 
-@celery_app.task(bind=True)
-def process_document(self, document_id: int, file_url: str):
+# Stored with each file's extracted text; bump it when extraction changes so files are parsed again
+TEXT_EXTRACTOR = "pymupdf-text-v1"
+# A processed document whose processing fails again (e.g. while re-indexing) stays processed
+# and searchable; its task is retried this many times, PROCESSED_RETRY_DELAY * 2**n seconds apart
+PROCESSED_MAX_RETRIES = 3
+PROCESSED_RETRY_DELAY = 30
+
+def upsert_embeddings(index, document_id: str, chunks: list, embeddings: list, metadata: list, namespace: str):
+    """Write one vector per chunk into the class's namespace of an index, with the chunk text and its metadata stored alongside"""
+    records = [
+        VectorRecord(
+            id=chunk_vector_id(document_id, i),
+            values=embedding,
+            metadata={"document_id": document_id, "chunk_index": i, "content": chunk, **meta},
+        )
+        for i, (chunk, embedding, meta) in enumerate(zip(chunks, embeddings, metadata))
+    ]
+    with tracer.start_as_current_span("vector_store.upsert", attributes={"vector_store.index": index.name or "default", "vector_store.records": len(records)}):
+        written = index.store().upsert_batch(records, namespace=namespace)
+    print(f"[CLASSGPT_DEBUG] Successfully upserted {written} vectors for document {document_id} into {index.name or 'the default index'}")
+
+def _report_progress(task, user_id, class_id, document_id, current, status):
+    """Record the task's progress and push it to the document owner's event stream"""
+    task.update_state(
+        state='PROGRESS',
+        meta={'current': current, 'total': 100, 'status': status}
+    )
+    publish_document_event(user_id, class_id, document_id, "processing", progress=current, message=status)
+
+def mark_document_failed(document_id, reason):
     """
-    Process a document: download from S3, extract text, chunk, generate embeddings, and store chunks in database.
+    Mark a document failed if it is still waiting to be processed, and tell its owner.
+    Documents already processed, failed or being deleted are left alone.
     """
-    # Download file from S3
     try:
-        file_bytes = get_s3_file_bytes(file_url)
-        print(f"[CLASSGPT_DEBUG] Downloaded file from S3: {file_url}")
-        print(f"[CLASSGPT_DEBUG] File bytes length: {len(file_bytes)}")
-        
-        # Save file for debugging
-        debug_file_path = f"/tmp/debug_upload_{document_id}.pdf"
-        with open(debug_file_path, "wb") as f:
-            f.write(file_bytes)
-        print(f"[CLASSGPT_DEBUG] Saved file to {debug_file_path}")
-        
+        with session_scope(SessionLocal) as db:
+            row = db.execute(text("""
+                UPDATE documents SET status = 'failed', updated_at = NOW()
+                WHERE id = :document_id AND status NOT IN ('processed', 'failed', 'deleting')
+                RETURNING user_id, class_id
+            """), {'document_id': document_id}).fetchone()
+        if row:
+            print(f"[CLASSGPT_DEBUG] Document {document_id} failed without finishing its task: {reason}")
+            publish_document_event(row.user_id, row.class_id, document_id, "failed", message=reason)
     except Exception as e:
-        print(f"[CLASSGPT_DEBUG] Failed to download file from S3: {e}")
-        raise Exception(f"Failed to download file from S3: {e}")
-    
-    # Continue with PDF/text extraction using file_bytes
+        print(f"[CLASSGPT_DEBUG] Failed to mark document {document_id} failed: {e}")
+
+class ProcessDocumentRequest(Request):
+    """
+    Runs in the main worker process, so it still sees a document task whose pool process
+    was killed (out of memory, or past the hard time limit) before the task could mark the
+    document failed. With task_reject_on_worker_lost off the message is not delivered
+    again, so without this the document would wait forever and keep its quota.
+    """
+
+    def on_failure(self, exc_info, send_failed_event=True, return_ok=False):
+        super().on_failure(exc_info, send_failed_event=send_failed_event, return_ok=return_ok)
+        if self.args:
+            # Exceptions from the pool process arrive wrapped
+            exception = getattr(exc_info.exception, "exc", exc_info.exception)
+            mark_document_failed(self.args[0], str(exception) or repr(exception))
+
+@celery_app.task(bind=True, Request=ProcessDocumentRequest)
+def process_document(self, document_id: int, file_url: str, stale_chunks: int = 0):
+    """
+    Process a document: extract its text, chunk, generate embeddings, and store chunks in database.
+    The text is extracted from the PDF in S3 once per distinct file and stored; processing
+    the document again (a retry, or re-indexing after a chunking change) reads it from there.
+
+    A document that is already processed keeps that status if this fails, and the task is
+    retried. stale_chunks is the chunk count an earlier attempt replaced, so a retry still
+    deletes the vectors of chunks that no longer exist.
+    """
+    print(f"[CLASSGPT_DEBUG] Processing document {document_id}, trace {current_trace_id()}")
+    db = SessionLocal()
+    user_id = class_id = None
+    was_processed = False
+    replaced_chunks = stale_chunks
     try:
-        # Update task status
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 0, 'total': 100, 'status': 'Starting document processing...'}
-        )
-        
         # Get document info including user_id and class_id
-        db = SessionLocal()
-        try:
-            query = text("SELECT user_id, class_id FROM documents WHERE id = :document_id")
-            result = db.execute(query, {'document_id': document_id}).fetchone()
-            if not result:
-                raise Exception(f"Document {document_id} not found")
-            user_id, class_id = result
-            print(f"[CLASSGPT_DEBUG] Found document {document_id} in class {class_id} for user {user_id}")
-        finally:
-            db.close()
-        
-        # Extract text per page
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 10, 'total': 100, 'status': 'Extracting text from PDF...'}
-        )
+        query = text("SELECT user_id, class_id, content_hash, status FROM documents WHERE id = :document_id")
+        result = db.execute(query, {'document_id': document_id}).fetchone()
+        if not result or result.status == "deleting":
+            print(f"[CLASSGPT_DEBUG] Document {document_id} was deleted, skipping it")
+            return {'status': 'skipped', 'document_id': document_id}
+        user_id, class_id, stored_hash, status = result
+        was_processed = status == "processed"
+        print(f"[CLASSGPT_DEBUG] Found document {document_id} in class {class_id} for user {user_id}")
+        pages = load_pages(db, stored_hash, TEXT_EXTRACTOR) if stored_hash else None
+        # End the read transaction so the connection goes back to the pool during extraction and embedding
+        db.commit()
         
-        print(f"[CLASSGPT_DEBUG] Starting PDF text extraction...")
-        pages = extract_text_by_page_from_bytes(file_bytes)
+        # Update task status
+        _report_progress(self, user_id, class_id, document_id, 0, 'Starting document processing...')
         
-        print(f"[CLASSGPT_DEBUG] extract_text_by_page_from_bytes returned: {type(pages)}")
-        if pages is None:
-            print(f"[CLASSGPT_DEBUG] extract_text_by_page_from_bytes returned None")
-            raise Exception("PDF text extraction failed - function returned None")
+        if pages is not None:
+            print(f"[CLASSGPT_DEBUG] Using stored text of file {stored_hash}, skipping download and extraction")
+        else:
+            pages = _download_and_extract(self, db, document_id, file_url, user_id, class_id)
         
         print(f"[CLASSGPT_DEBUG] Number of pages extracted: {len(pages)}")
         
@@ -117,28 +209,27 @@ def process_document(self, document_id: int, file_url: str):
             raise Exception("No text content extracted from PDF")
         
         # Chunk per page, track page_number
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 30, 'total': 100, 'status': 'Chunking text...'}
-        )
+        _report_progress(self, user_id, class_id, document_id, 30, 'Chunking text...')
         
         print(f"[CLASSGPT_DEBUG] Starting text chunking...")
         all_chunks = []
         all_metadata = []
-        for page_number, page_text in pages:
-            if not page_text.strip():
-                print(f"[CLASSGPT_DEBUG] Skipping empty page {page_number}")
-                continue
-            page_chunks = chunk_text(page_text)
-            print(f"[CLASSGPT_DEBUG] Page {page_number}: created {len(page_chunks)} chunks")
-            for chunk in page_chunks:
-                all_chunks.append(chunk)
-                all_metadata.append({
-                    "user_id": str(user_id),
-                    "class_id": str(class_id),
-                    "document_id": str(document_id),
-                    "page_number": page_number
-                })
+        with tracer.start_as_current_span("document.chunk", attributes={"document.pages": len(pages)}) as chunk_span:
+            for page_number, page_text in pages:
+                if not page_text.strip():
+                    print(f"[CLASSGPT_DEBUG] Skipping empty page {page_number}")
+                    continue
+                page_chunks = chunk_text(page_text)
+                print(f"[CLASSGPT_DEBUG] Page {page_number}: created {len(page_chunks)} chunks")
+                for chunk in page_chunks:
+                    all_chunks.append(chunk)
+                    all_metadata.append({
+                        "user_id": str(user_id),
+                        "class_id": str(class_id),
+                        "document_id": str(document_id),
+                        "page_number": page_number
+                    })
+            chunk_span.set_attribute("document.chunks", len(all_chunks))
         
         print(f"[CLASSGPT_DEBUG] Total chunks created: {len(all_chunks)}")
         
@@ -147,37 +238,64 @@ def process_document(self, document_id: int, file_url: str):
             raise Exception("No text chunks created from PDF")
         
         # Generate embeddings
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 50, 'total': 100, 'status': 'Generating embeddings...'}
-        )
+        _report_progress(self, user_id, class_id, document_id, 50, 'Generating embeddings...')
         
         print(f"[CLASSGPT_DEBUG] Starting embedding generation for {len(all_chunks)} chunks...")
-        embedding_provider = get_embedding_provider()
-        embeddings = embedding_provider.embed(all_chunks)
+        active_index = get_active_index()
+        embedding_provider = get_embedding_provider(active_index.provider, active_index.model)
+        with tracer.start_as_current_span("embedding.embed", attributes={"embedding.model": active_index.model or "", "embedding.texts": len(all_chunks)}):
+            embeddings = embedding_provider.embed(all_chunks)
         
         print(f"[CLASSGPT_DEBUG] Generated {len(embeddings)} embeddings for document {document_id}")
         
         # Store chunks in database
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 70, 'total': 100, 'status': 'Storing chunks in database...'}
-        )
+        _report_progress(self, user_id, class_id, document_id, 70, 'Storing chunks in database...')
         
         print(f"[CLASSGPT_DEBUG] Storing {len(all_chunks)} chunks in database...")
-        store_chunks_in_database(document_id, all_chunks)
+        with tracer.start_as_current_span("db.store_chunks", attributes={"document.chunks": len(all_chunks)}):
+            replaced_chunks = max(
+                store_chunks_in_database(db, document_id, all_chunks, [meta["page_number"] for meta in all_metadata]),
+                stale_chunks,
+            )
         
         # Update document status
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 90, 'total': 100, 'status': 'Updating document status...'}
-        )
+        _report_progress(self, user_id, class_id, document_id, 90, 'Updating document status...')
         
         print(f"[CLASSGPT_DEBUG] Updating document status to 'processed'...")
-        update_document_status(document_id, "processed")
+        if not update_document_status(db, document_id, "processed"):
+            print(f"[CLASSGPT_DEBUG] Document {document_id} was deleted while it was processed, discarding its chunks")
+            db.rollback()
+            return {'status': 'skipped', 'document_id': document_id}
+        db.commit()
+        # Searchable from here on, with the vectors of the previous run until these are written
+        was_processed = True
         
-        print(f"[CLASSGPT_DEBUG] Upserting embeddings to Pinecone...")
-        upsert_embeddings(str(document_id), all_chunks, embeddings, all_metadata)
+        # Read the indexes after the commit: a re-embedding job that started before it has
+        # either seen these chunks in document_chunks or is listed here as pending
+        print(f"[CLASSGPT_DEBUG] Upserting embeddings to the vector store...")
+        embeddings_by_model = {(active_index.provider, active_index.model): embeddings}
+        for index in get_write_indexes():
+            model_key = (index.provider, index.model)
+            if model_key not in embeddings_by_model:
+                with tracer.start_as_current_span("embedding.embed", attributes={"embedding.model": index.model or "", "embedding.texts": len(all_chunks)}):
+                    embeddings_by_model[model_key] = get_embedding_provider(index.provider, index.model).embed(all_chunks)
+            upsert_embeddings(
+                index, str(document_id), all_chunks, embeddings_by_model[model_key], all_metadata,
+                tenant_namespace(user_id, class_id),
+            )
+            # Re-chunking can leave fewer chunks than before; drop the vectors of the rest
+            if replaced_chunks > len(all_chunks):
+                index.store().delete_by_ids(
+                    [chunk_vector_id(str(document_id), i) for i in range(len(all_chunks), replaced_chunks)],
+                    namespace=tenant_namespace(user_id, class_id),
+                )
+        # A deletion that started after the commit may have cleared the namespace before
+        # these upserts landed; remove them so they are not left behind
+        if _document_deleted(db, document_id):
+            print(f"[CLASSGPT_DEBUG] Document {document_id} was deleted while it was indexed, removing its vectors")
+            _delete_chunk_vectors(document_id, user_id, class_id, len(all_chunks))
+            return {'status': 'skipped', 'document_id': document_id}
+        publish_document_event(user_id, class_id, document_id, "processed", progress=100)
         
         print(f"[CLASSGPT_DEBUG] Document processing completed successfully!")
         return {
@@ -188,16 +306,270 @@ def process_document(self, document_id: int, file_url: str):
         
     except Exception as e:
         print(f"[CLASSGPT_DEBUG] Document processing failed: {e}")
+        db.rollback()
+        if was_processed:
+            # Its chunks in the database are complete, from the previous run or this one, so it
+            # stays searchable. A retry rewrites every vector, repairing a cut-short upsert.
+            if self.request.retries < PROCESSED_MAX_RETRIES:
+                print(f"[CLASSGPT_DEBUG] Document {document_id} stays processed, retrying")
+                raise self.retry(
+                    exc=e,
+                    countdown=PROCESSED_RETRY_DELAY * 2 ** self.request.retries,
+                    max_retries=PROCESSED_MAX_RETRIES,
+                    kwargs={'stale_chunks': replaced_chunks},
+                )
+            publish_document_event(user_id, class_id, document_id, "processed", message=f"Re-processing failed: {e}")
+            raise Exception(f"Document processing failed, document left processed: {str(e)}")
         # Update document status to failed
         try:
-            update_document_status(document_id, "failed")
+            failed = update_document_status(db, document_id, "failed")
+            db.commit()
+            if failed and user_id is not None:
+                publish_document_event(user_id, class_id, document_id, "failed", message=str(e))
         except Exception as update_error:
+            db.rollback()
             print(f"[CLASSGPT_DEBUG] Failed to update document status: {update_error}")
         
         raise Exception(f"Document processing failed: {str(e)}")
+    finally:
+        db.close()
+
+def _download_and_extract(task, db, document_id, file_url, user_id, class_id):
+    """
+    Download a document's file and get its pages: stored ones if the same file was uploaded
+    before, otherwise extracted with PyMuPDF and stored. Records the file's hash on the document.
+    """
+    try:
+        file_bytes = get_s3_file_bytes(file_url)
+        print(f"[CLASSGPT_DEBUG] Downloaded file from S3: {file_url}")
+        print(f"[CLASSGPT_DEBUG] File bytes length: {len(file_bytes)}")
+        
+        # Save file for debugging
+        debug_file_path = f"/tmp/debug_upload_{document_id}.pdf"
+        with open(debug_file_path, "wb") as f:
+            f.write(file_bytes)
+        print(f"[CLASSGPT_DEBUG] Saved file to {debug_file_path}")
+        
+    except Exception as e:
+        print(f"[CLASSGPT_DEBUG] Failed to download file from S3: {e}")
+        raise Exception(f"Failed to download file from S3: {e}")
+    
+    file_hash = file_content_hash(file_bytes)
+    pages = load_pages(db, file_hash, TEXT_EXTRACTOR)
+    db.commit()
+    if pages is not None:
+        print(f"[CLASSGPT_DEBUG] File {file_hash} was extracted before, using its stored text")
+    else:
+        # Extract text per page
+        _report_progress(task, user_id, class_id, document_id, 10, 'Extracting text from PDF...')
+        
+        print(f"[CLASSGPT_DEBUG] Starting PDF text extraction...")
+        with tracer.start_as_current_span("document.extract", attributes={"document.bytes": len(file_bytes)}):
+            pages = extract_text_by_page_from_bytes(file_bytes)
+        
+        print(f"[CLASSGPT_DEBUG] extract_text_by_page_from_bytes returned: {type(pages)}")
+        if pages is None:
+            print(f"[CLASSGPT_DEBUG] extract_text_by_page_from_bytes returned None")
+            raise Exception("PDF text extraction failed - function returned None")
+        
+        stored_bytes = save_pages(db, file_hash, TEXT_EXTRACTOR, pages)
+        print(f"[CLASSGPT_DEBUG] Stored extracted text of file {file_hash} ({stored_bytes} bytes compressed)")
+    
+    db.execute(
+        text("UPDATE documents SET content_hash = :content_hash WHERE id = :document_id"),
+        {'content_hash': file_hash, 'document_id': document_id}
+    )
+    db.commit()
+    return pages
+
+def _document_deleted(db, document_id):
+    """Whether the document is gone or being deleted"""
+    status = db.execute(
+        text("SELECT status FROM documents WHERE id = :document_id"), {'document_id': document_id}
+    ).scalar()
+    db.commit()
+    return status is None or status == "deleting"
+
+def _delete_chunk_vectors(document_id, user_id, class_id, chunk_count):
+    """Delete the vectors of a document's first chunk_count chunks from every write index"""
+    ids = [chunk_vector_id(str(document_id), i) for i in range(chunk_count)]
+    for index in get_write_indexes():
+        index.store().delete_by_ids(ids, namespace=tenant_namespace(user_id, class_id))
+
+def _delete_document_files(task, rows):
+    """Delete the S3 files of document rows in batches, reporting progress on the task"""
+    keys_by_bucket = {}
+    for row in rows:
+        parsed = parse_s3_url(row.s3_url) if row.s3_url else None
+        if parsed:
+            bucket, key = parsed
+            keys_by_bucket.setdefault(bucket, []).append(key)
+
+    total = sum(len(keys) for keys in keys_by_bucket.values())
+    deleted = 0
+    for bucket, keys in keys_by_bucket.items():
+        for start in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+            deleted += delete_s3_objects(keys[start:start + S3_DELETE_BATCH_SIZE], bucket=bucket)
+            task.update_state(
+                state='PROGRESS',
+                meta={'current': deleted, 'total': total, 'status': 'Deleting files...'}
+            )
+    print(f"[CLASSGPT_DEBUG] Deleted {deleted} S3 files")
+    return deleted
+
+@celery_app.task(bind=True, autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 5})
+def delete_class(self, class_id: str):
+    """
+    Delete a class marked as "deleting": its S3 files in bulk, its vector namespace,
+    then the class row (documents and chunks cascade). Safe to retry.
+    """
+    with session_scope(SessionLocal) as db:
+        owner = db.execute(
+            text("SELECT user_id FROM classes WHERE id = :class_id"),
+            {'class_id': class_id}
+        ).fetchone()
+        rows = db.execute(
+            text("SELECT id, s3_url, content_hash FROM documents WHERE class_id = :class_id"),
+            {'class_id': class_id}
+        ).fetchall()
+        db.commit()
+
+        print(f"[CLASSGPT_DEBUG] Deleting class {class_id} with {len(rows)} documents")
+        files_deleted = _delete_document_files(self, rows)
+
+        self.update_state(
+            state='PROGRESS',
+            meta={'current': files_deleted, 'total': files_deleted, 'status': 'Deleting embeddings...'}
+        )
+        for index in get_write_indexes():
+            vector_store = index.store()
+            if owner:
+                vector_store.delete_namespace(tenant_namespace(owner.user_id, class_id))
+            if VECTOR_STORE_LEGACY_FALLBACK:
+                vector_store.delete_by_filter({"class_id": str(class_id)})
+
+        db.execute(text("DELETE FROM classes WHERE id = :class_id"), {'class_id': class_id})
+        delete_unreferenced(db, [row.content_hash for row in rows])
+
+    print(f"[CLASSGPT_DEBUG] Class {class_id} deleted")
+    return {'status': 'success', 'class_id': class_id, 'documents_deleted': len(rows)}
+
+@celery_app.task(bind=True, autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 5})
+def delete_documents(self, document_ids: list):
+    """
+    Delete documents marked as "deleting": their S3 files in bulk, their vectors by ID in
+    their class namespace (chunk vector IDs follow from the chunk count), then the rows
+    (chunks cascade). Safe to retry.
+    """
+    with session_scope(SessionLocal) as db:
+        rows = db.execute(
+            text("""
+                SELECT d.id, d.s3_url, d.user_id, d.class_id, d.content_hash,
+                    (SELECT COALESCE(MAX(c.chunk_index) + 1, 0) FROM document_chunks c WHERE c.document_id = d.id) AS chunk_count
+                FROM documents d WHERE d.id = ANY(CAST(:document_ids AS uuid[]))
+            """),
+            {'document_ids': document_ids}
+        ).fetchall()
+        db.commit()
+
+        print(f"[CLASSGPT_DEBUG] Deleting {len(rows)} documents")
+        files_deleted = _delete_document_files(self, rows)
+
+        self.update_state(
+            state='PROGRESS',
+            meta={'current': files_deleted, 'total': files_deleted, 'status': 'Deleting embeddings...'}
+        )
+        ids_by_namespace = {}
+        for row in rows:
+            ids_by_namespace.setdefault(tenant_namespace(row.user_id, row.class_id), []).extend(
+                chunk_vector_id(str(row.id), i) for i in range(row.chunk_count)
+            )
+        for index in get_write_indexes():
+            vector_store = index.store()
+            for namespace, ids in ids_by_namespace.items():
+                vector_store.delete_by_ids(ids, namespace=namespace)
+            if VECTOR_STORE_LEGACY_FALLBACK:
+                # Vectors in the default namespace may predate deterministic chunk IDs
+                vector_store.delete_by_filter({"document_id": {"$in": [str(document_id) for document_id in document_ids]}})
+
+        db.execute(
+            text("DELETE FROM documents WHERE id = ANY(CAST(:document_ids AS uuid[]))"),
+            {'document_ids': document_ids}
+        )
+        delete_unreferenced(db, [row.content_hash for row in rows])
+
+    return {'status': 'success', 'documents_deleted': len(rows)}
+
+@celery_app.task(bind=True, autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 5})
+def expire_stale_uploads(self):
+    """
+    Delete documents still "uploading" STALE_UPLOAD_AGE seconds after their presign, i.e.
+    whose S3 upload failed or was never completed: any file that did land in S3, then the
+    rows, giving back their quota. Safe to retry: nothing is committed until the files are gone.
+    """
+    with session_scope(SessionLocal) as db:
+        rows = db.execute(text("""
+            SELECT id, s3_url, user_id FROM documents
+            WHERE status = 'uploading' AND uploaded_at < NOW() - make_interval(secs => :max_age)
+            FOR UPDATE SKIP LOCKED
+        """), {'max_age': settings.STALE_UPLOAD_AGE}).fetchall()
+        if not rows:
+            return {'status': 'success', 'documents_deleted': 0}
+
+        print(f"[CLASSGPT_DEBUG] Expiring {len(rows)} uploads that were never completed")
+        _delete_document_files(self, rows)
+
+        db.execute(
+            text("DELETE FROM documents WHERE id = ANY(CAST(:document_ids AS uuid[]))"),
+            {'document_ids': [str(row.id) for row in rows]}
+        )
+        released = {}
+        for row in rows:
+            released[row.user_id] = released.get(row.user_id, 0) + 1
+        for user_id, amount in released.items():
+            db.execute(text("""
+                UPDATE user_usage
+                SET document_count = GREATEST(document_count - :amount, 0), updated_at = NOW()
+                WHERE user_id = :user_id
+            """), {'user_id': user_id, 'amount': amount})
+
+    return {'status': 'success', 'documents_deleted': len(rows)}
+
+@celery_app.task
+def reconcile_usage_counters():
+    """
+    Recompute user_usage from the documents and classes tables and fix any drift.
+    Rows touched in the last minute are skipped so in-flight reservations are not overwritten.
+    """
+    with session_scope(SessionLocal) as db:
+        result = db.execute(text("""
+            WITH users AS (
+                SELECT user_id FROM user_usage
+                UNION SELECT user_id FROM documents WHERE user_id IS NOT NULL
+                UNION SELECT user_id FROM classes WHERE user_id IS NOT NULL
+            )
+            INSERT INTO user_usage (user_id, document_count, class_count, updated_at)
+            SELECT users.user_id,
+                (SELECT count(*) FROM documents d WHERE d.user_id = users.user_id AND d.status != 'deleting'),
+                (SELECT count(*) FROM classes c WHERE c.user_id = users.user_id AND c.status != 'deleting'),
+                NOW()
+            FROM users
+            ON CONFLICT (user_id) DO UPDATE
+            SET document_count = EXCLUDED.document_count,
+                class_count = EXCLUDED.class_count,
+                updated_at = NOW()
+            WHERE (user_usage.document_count != EXCLUDED.document_count
+                   OR user_usage.class_count != EXCLUDED.class_count)
+              AND user_usage.updated_at < NOW() - INTERVAL '1 minute'
+            RETURNING user_id
+        """))
+        corrected = len(result.fetchall())
+    print(f"[CLASSGPT_DEBUG] Reconciled usage counters, {corrected} rows written")
+    return {'status': 'success', 'rows_written': corrected}
 
 def extract_text_from_pdf(file_path: str) -> str:
     """Extract text from PDF using PyMuPDF"""
+    import fitz
     try:
         doc = fitz.open(file_path)
         text = ""
@@ -208,48 +580,41 @@ def extract_text_from_pdf(file_path: str) -> str:
     except Exception as e:
         raise Exception(f"Failed to extract text from PDF: {str(e)}")
 
-def store_chunks_in_database(document_id: int, chunks: list):
-    """Store text chunks in the database"""
-    db = SessionLocal()
+def store_chunks_in_database(db, document_id: int, chunks: list, page_numbers: list):
+    """
+    Store text chunks in the database as part of the caller's transaction, replacing any
+    the document already has: a task delivered again after a crash stores them once.
+    Returns how many chunks were replaced.
+    """
+    delete_query = text("DELETE FROM document_chunks WHERE document_id = :document_id")
+    query = text("""
+        INSERT INTO document_chunks (document_id, chunk_index, content, page_number, created_at)
+        VALUES (:document_id, :chunk_index, :content, :page_number, NOW())
+    """)
     try:
-        for i, chunk in enumerate(chunks):
-            # Insert chunk into database
-            query = text("""
-                INSERT INTO document_chunks (document_id, chunk_index, content, created_at)
-                VALUES (:document_id, :chunk_index, :content, NOW())
-            """)
-            
-            db.execute(query, {
-                'document_id': document_id,
-                'chunk_index': i,
-                'content': chunk
-            })
-        
-        db.commit()
+        replaced = db.execute(delete_query, {'document_id': document_id}).rowcount
+        db.execute(query, [
+            {'document_id': document_id, 'chunk_index': i, 'content': chunk, 'page_number': page_number}
+            for i, (chunk, page_number) in enumerate(zip(chunks, page_numbers))
+        ])
+        return replaced
     except Exception as e:
-        db.rollback()
         raise Exception(f"Failed to store chunks in database: {str(e)}")
-    finally:
-        db.close()
 
-def update_document_status(document_id: int, status: str):
-    """Update document status in database"""
-    db = SessionLocal()
+def update_document_status(db, document_id: int, status: str) -> bool:
+    """
+    Update document status in database as part of the caller's transaction. A document
+    being deleted keeps its "deleting" status. Returns whether the document was updated.
+    """
+    query = text("""
+        UPDATE documents 
+        SET status = :status, updated_at = NOW()
+        WHERE id = :document_id AND status <> 'deleting'
+    """)
     try:
-        query = text("""
-            UPDATE documents 
-            SET status = :status, updated_at = NOW()
-            WHERE id = :document_id
-        """)
-        
-        db.execute(query, {
+        return db.execute(query, {
             'document_id': document_id,
             'status': status
-        })
-        
-        db.commit()
+        }).rowcount > 0
     except Exception as e:
-        db.rollback()
-        raise Exception(f"Failed to update document status: {str(e)}")
-    finally:
-        db.close() 
\ No newline at end of file
+        raise Exception(f"Failed to update document status: {str(e)}") 
\ No newline at end of file
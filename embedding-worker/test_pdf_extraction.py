@@ -1,21 +1,39 @@
 #!/usr/bin/env python3
 """
 Test script to verify PDF extraction functionality
+
+    python test_pdf_extraction.py [path/to/file.pdf]
+
+Without a path, a small generated PDF is used.
 """
 import os
 import sys
+import tempfile
 import fitz  # PyMuPDF
 
+def sample_pdf_path():
+    """The PDF given on the command line, or a generated three-page one"""
+    if len(sys.argv) > 1:
+        return sys.argv[1]
+    path = os.path.join(tempfile.gettempdir(), "classgpt_sample.pdf")
+    doc = fitz.open()
+    for page_number in range(1, 4):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {page_number}. Gradient descent minimizes a loss function step by step.")
+    doc.save(path)
+    doc.close()
+    return path
+
 def test_pdf_extraction_from_bytes():
     """Test PDF extraction from bytes"""
     print("=== Testing PDF Extraction from Bytes ===")
     
     # Test with a simple PDF (you can replace this with your actual PDF)
-    test_pdf_path = "/tmp/debug_upload_1.pdf"  # Adjust this path as needed
+    test_pdf_path = sample_pdf_path()
     
     if not os.path.exists(test_pdf_path):
         print(f"❌ Test PDF not found at {test_pdf_path}")
-        print("Please upload a PDF first to create the test file")
+        print("Pass the path of an existing PDF")
         return False
     
     try:
@@ -59,7 +77,7 @@ def test_pdf_extraction_from_file():
     """Test PDF extraction from file path"""
     print("\n=== Testing PDF Extraction from File Path ===")
     
-    test_pdf_path = "/tmp/debug_upload_1.pdf"  # Adjust this path as needed
+    test_pdf_path = sample_pdf_path()
     
     if not os.path.exists(test_pdf_path):
         print(f"❌ Test PDF not found at {test_pdf_path}")
@@ -101,4 +119,4 @@ if __name__ == "__main__":
     if bytes_test and file_test:
         print("\n🎉 All tests passed! PDF extraction should work.")
     else:
-        print("\n⚠️  Some tests failed. Check the output above for details.") 
\ No newline at end of file
+        print("\n⚠️  Some tests failed. Check the output above for details.") 
\ No newline at end of file
@@ -3,7 +3,6 @@ import { useClassContext } from '../context/ClassContext';
 import { useDocumentRefresh } from '../context/DocumentRefreshContext';
 import { useUserContext } from '../context/UserContext';
 
-const POLL_INTERVAL = 5000; // 5 seconds
 
 const ClassSelector = forwardRef((_, ref) => {
   const { classes, selectedClass, addClass, selectClass, deleteClass } = useClassContext();
@@ -56,17 +55,54 @@ const ClassSelector = forwardRef((_, ref) => {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [selectedClass, refreshCount]);
 
-  // Polling for document status updates
+  // Document status updates pushed by the server. Each connection is opened with a
+  // single-use ticket, so instead of letting EventSource retry with a spent one we
+  // reconnect with a new ticket and the server replays anything missed since the last
+  // event it delivered.
   useEffect(() => {
-    if (!selectedClass || documents.length === 0) return;
-    const hasPending = documents.some(doc => doc.status && doc.status !== 'processed');
-    if (!hasPending) return;
-    const interval = setInterval(() => {
-      refreshDocuments();
-    }, POLL_INTERVAL);
-    return () => clearInterval(interval);
-    // eslint-disable-next-line react-hooks/exhaustive-deps
-  }, [selectedClass, documents]);
+    if (!selectedClass || !token) return;
+    let source: EventSource | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    let lastEventId = '';
+    let closed = false;
+
+    const connect = async () => {
+      try {
+        const res = await fetch('/api/events/ticket', {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${token}` },
+        });
+        if (!res.ok) throw new Error(`ticket request failed: ${res.status}`);
+        const { ticket } = await res.json();
+        if (closed) return;
+        const params = new URLSearchParams({ class_id: selectedClass.id, ticket });
+        if (lastEventId) params.set('last_event_id', lastEventId);
+        source = new EventSource(`/api/events?${params}`);
+        source.addEventListener('document', (e) => {
+          const message = e as MessageEvent;
+          lastEventId = message.lastEventId || lastEventId;
+          const event = JSON.parse(message.data);
+          setDocuments(prev => prev.map(doc =>
+            doc.id === event.document_id
+              ? { ...doc, status: event.status, progress: event.progress }
+              : doc
+          ));
+        });
+        source.onerror = () => {
+          source?.close();
+          if (!closed) retryTimer = setTimeout(connect, 3000);
+        };
+      } catch (err) {
+        if (!closed) retryTimer = setTimeout(connect, 3000);
+      }
+    };
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      source?.close();
+    };
+  }, [selectedClass, token]);
 
   const handleDeleteDocument = async (docId: string) => {
     if (deletingDocId) return; // Prevent multiple deletes
@@ -250,7 +286,9 @@ const ClassSelector = forwardRef((_, ref) => {
                         <span className="truncate max-w-[110px]" title={doc.filename || doc.name}>{doc.filename || doc.name}</span>
                         {/* Show status only if not processed */}
                         {doc.status && doc.status !== 'processed' && (
-                          <span className="ml-2 px-2 py-0.5 rounded bg-yellow-100 text-yellow-800 text-[10px] font-semibold">{doc.status}</span>
+                          <span className="ml-2 px-2 py-0.5 rounded bg-yellow-100 text-yellow-800 text-[10px] font-semibold">
+                            {doc.status}{doc.status === 'processing' && doc.progress != null ? ` ${doc.progress}%` : ''}
+                          </span>
                         )}
                       </div>
                       {/* Download button */}
@@ -344,4 +382,4 @@ const ClassSelector = forwardRef((_, ref) => {
   );
 });
 
-export default ClassSelector as React.FC<any>; 
\ No newline at end of file
+export default ClassSelector as React.FC<any>; 
\ No newline at end of file
@@ -16,6 +16,8 @@ const Chat: React.FC = () => {
   const [isLoading, setIsLoading] = useState(false);
   const isUploading = false; // TODO: Replace with actual upload state from context if available
   const [isMappingLoading, setIsMappingLoading] = useState(false);
+  // Server-side chat session, so follow-up questions can build on earlier answers
+  const [sessionId, setSessionId] = useState<string | null>(null);
 
   const refreshDocumentMapping = async () => {
     if (!selectedClass) return;
@@ -52,6 +54,7 @@ const Chat: React.FC = () => {
     setMessages([
       { id: 1, text: "Hello! I'm your ClassGPT assistant. Ask me anything about your course materials.", isUser: false }
     ]);
+    setSessionId(null);
     // Fetch document list for mapping document_id to filename
     if (selectedClass) {
       fetch(`/api/documents?class_id=${selectedClass.id}`, {
@@ -108,7 +111,8 @@ const Chat: React.FC = () => {
         body: JSON.stringify({
           query: userMessage.text,
           class_id: selectedClass.id,
-          top_k: 5
+          top_k: 5,
+          session_id: sessionId
         })
       });
       let data;
@@ -128,6 +132,7 @@ const Chat: React.FC = () => {
         }
         throw new Error(errorMessage);
       }
+      setSessionId(data.session_id || null);
       // Collect citations from returned chunks, deduplicated by filename+page_number
       const seen = new Set<string>();
       let citations = (data.chunks || []).map((chunk: any) => ({
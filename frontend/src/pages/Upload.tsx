@@ -44,20 +44,74 @@ const Upload: React.FC = () => {
     }
   };
 
+  const showUploadError = async (res: Response) => {
+    let err: any = {};
+    try {
+      err = await res.json();
+    } catch (jsonErr) {
+      // S3 answers with XML, fall through to the generic messages
+    }
+    // Show user-friendly error messages
+    if (err.detail) {
+      alert(err.detail);
+    } else if (res.status === 429) {
+      alert('Too many uploads. Please wait before trying again.');
+    } else if (res.status === 413 || res.status === 400) {
+      alert('File too large. Maximum file size is 10MB.');
+    } else {
+      alert('Upload failed. Please try again.');
+    }
+  };
+
   const handleUpload = async () => {
     if (!selectedClass || files.length === 0 || isUploading) return;
     
     setIsUploading(true);
-    const formData = new FormData();
-    formData.append('class_id', selectedClass.id);
-    files.forEach(file => formData.append('files', file));
+    const authHeaders = token ? { 'Authorization': `Bearer ${token}` } : {};
     try {
-      const res = await fetch('/api/upload', {
+      // 1. Ask the ingestion service for presigned S3 uploads
+      const presignRes = await fetch('/api/upload/presign', {
         method: 'POST',
-        body: formData,
-        headers: token ? { 'Authorization': `Bearer ${token}` } : {},
+        headers: { 'Content-Type': 'application/json', ...authHeaders },
+        body: JSON.stringify({
+          class_id: selectedClass.id,
+          files: files.map(file => ({ filename: file.name, size: file.size })),
+        }),
       });
-      if (res.ok) {
+      if (!presignRes.ok) {
+        await showUploadError(presignRes);
+        setIsUploading(false);
+        return;
+      }
+      const { uploads } = await presignRes.json();
+
+      // 2. Send the files straight to S3, all in parallel
+      const s3Results = await Promise.all(uploads.map((upload: any, i: number) => {
+        const formData = new FormData();
+        Object.entries(upload.fields).forEach(([key, value]) => formData.append(key, value as string));
+        formData.append('file', files[i]);
+        // A network error fails only this file, like an error response from S3
+        return fetch(upload.url, { method: 'POST', body: formData }).catch(() => null);
+      }));
+      const succeeded = uploads.filter((_: any, i: number) => s3Results[i]?.ok);
+      const failed = s3Results.find((res: Response | null) => !res?.ok);
+
+      // 3. Tell the ingestion service which uploads finished so they get processed.
+      // The others stay "uploading" until the worker expires them and frees their quota.
+      const completeRes = succeeded.length > 0 ? await fetch('/api/upload/complete', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', ...authHeaders },
+        body: JSON.stringify({ document_ids: succeeded.map((upload: any) => upload.document_id) }),
+      }) : null;
+      if (failed !== undefined) {
+        if (failed) {
+          await showUploadError(failed);
+        } else {
+          alert('Network error. Please check your connection and try again.');
+        }
+      } else if (completeRes && !completeRes.ok) {
+        await showUploadError(completeRes);
+      } else {
         setFiles([]);
         setSuccessMsg('Upload successful!');
         selectClass(selectedClass.id);
@@ -66,18 +120,6 @@ const Upload: React.FC = () => {
           setSuccessMsg('');
           navigate('/chat');
         }, 1200);
-      } else {
-        const err = await res.json();
-        // Show user-friendly error messages
-        if (err.detail) {
-          alert(err.detail);
-        } else if (res.status === 429) {
-          alert('Too many uploads. Please wait before trying again.');
-        } else if (res.status === 413) {
-          alert('File too large. Maximum file size is 10MB.');
-        } else {
-          alert('Upload failed. Please try again.');
-        }
       }
     } catch (err) {
       alert('Network error. Please check your connection and try again.');
@@ -188,4 +230,4 @@ const Upload: React.FC = () => {
   );
 };
 
-export default Upload; 
\ No newline at end of file
+export default Upload; 
\ No newline at end of file
@@ -1,8 +1,9 @@
-import os
 from celery import Celery
 from pydantic_settings import BaseSettings
 from typing import Optional
 
+from shared.task_routes import TASK_ROUTES
+
 class Settings(BaseSettings):
     REDIS_URL: str = "redis://redis:6379"
     CELERY_REDIS_URL: Optional[str] = None  # Optional, for Celery-specific Redis URL
@@ -13,12 +14,8 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-print("ENV REDIS_URL:", os.environ.get("REDIS_URL"))
-print("ENV CELERY_REDIS_URL:", os.environ.get("CELERY_REDIS_URL"))
-
 # Use CELERY_REDIS_URL if set, otherwise fall back to REDIS_URL
 celery_broker_url = settings.CELERY_REDIS_URL or settings.REDIS_URL
-print("CELERY BROKER URL:", celery_broker_url)
 
 # Create Celery app
 celery_app = Celery(
@@ -37,4 +34,5 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 minutes
     task_soft_time_limit=25 * 60,  # 25 minutes
+    task_routes=TASK_ROUTES,
 ) 
\ No newline at end of file
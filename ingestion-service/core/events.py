@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import re
+import secrets
+from typing import AsyncIterator, Optional
+
+import redis
+
+from shared.events import event_stream_key
+
+logger = logging.getLogger(__name__)
+
+# Tell EventSource how long to wait before reconnecting
+SSE_RETRY_MS = 3000
+# Longest a read blocks before a keep-alive comment is sent, so proxies keep the connection open
+SSE_BLOCK_MS = 15000
+SSE_READ_COUNT = 100
+# A client connecting without Last-Event-ID gets the events of this many milliseconds
+# before it connected, covering those published since it fetched the document list
+SSE_REPLAY_MS = int(os.getenv("SSE_REPLAY_MS", "30000"))
+# EventSource cannot send an Authorization header and a query-string JWT would end up in
+# access logs, so the stream is opened with a single-use ticket that expires this fast
+EVENT_TICKET_TTL = int(os.getenv("EVENT_TICKET_TTL", "60"))
+
+_STREAM_ID = re.compile(r"^\d+-\d+$")
+
+
+def _as_str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _ticket_key(ticket: str) -> str:
+    return f"events:ticket:{ticket}"
+
+
+async def issue_stream_ticket(redis_client, user_id: str) -> str:
+    """A ticket that opens one event stream for the user within EVENT_TICKET_TTL seconds."""
+    ticket = secrets.token_urlsafe(32)
+    await redis_client.set(_ticket_key(ticket), user_id, ex=EVENT_TICKET_TTL)
+    return ticket
+
+
+async def redeem_stream_ticket(redis_client, ticket: str) -> Optional[str]:
+    """The user a ticket was issued to, or None if it is unknown, expired or already used."""
+    user_id = await redis_client.getdel(_ticket_key(ticket))
+    return _as_str(user_id) if user_id is not None else None
+
+
+async def stream_document_events(
+    redis_client,
+    request,
+    user_id: str,
+    class_id: Optional[str] = None,
+    last_event_id: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Yields SSE frames for the user's document events, optionally limited to one class.
+
+    Events after last_event_id are replayed first (as far back as the stream is kept).
+    Without one, the events of the last SSE_REPLAY_MS milliseconds are; replaying them
+    on top of a freshly fetched document list leaves each document at its latest status.
+    """
+    key = event_stream_key(user_id)
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+
+    try:
+        if last_event_id and _STREAM_ID.match(last_event_id):
+            cursor = last_event_id
+        else:
+            # Stream IDs start with the Redis server's time in milliseconds
+            seconds, microseconds = await redis_client.time()
+            cursor = f"{max(seconds * 1000 + microseconds // 1000 - SSE_REPLAY_MS, 0)}-0"
+
+        while not await request.is_disconnected():
+            response = await redis_client.xread({key: cursor}, count=SSE_READ_COUNT, block=SSE_BLOCK_MS)
+            if not response:
+                yield ": keep-alive\n\n"
+                continue
+            for entry_id, fields in response[0][1]:
+                cursor = _as_str(entry_id)
+                data = fields.get(b"data") or fields.get("data")
+                if data is None:
+                    continue
+                event = json.loads(data)
+                if class_id and event.get("class_id") != class_id:
+                    continue
+                yield f"id: {cursor}\nevent: {event.get('type', 'message')}\ndata: {json.dumps(event)}\n\n"
+    except redis.RedisError as e:
+        # End the stream; EventSource reconnects with the last event ID it saw
+        logger.warning(f"Event stream for user {user_id} failed: {e}")
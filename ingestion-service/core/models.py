@@ -3,6 +3,7 @@ from sqlalchemy import (
     create_engine,
     Column,
     String,
+    BigInteger,
     DateTime,
     ForeignKey,
 )
@@ -17,6 +18,9 @@ class Class(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), nullable=True)
     name = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="active", server_default="active")  # "active" or "deleting"
+    # Bumped by a database trigger whenever the class's document listing changes
+    documents_version = Column(BigInteger, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     documents = relationship(
@@ -35,5 +39,9 @@ class Document(Base):
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
     user_id = Column(UUID(as_uuid=True), nullable=False)
     s3_url = Column(String, nullable=True)
+    s3_bucket = Column(String, nullable=True)
+    s3_key = Column(String, nullable=True)
+    # SHA-256 of the file, set by the worker; keys its extracted text in extracted_texts
+    content_hash = Column(String, nullable=True)
 
-    class_ = relationship("Class", back_populates="documents") 
\ No newline at end of file
+    class_ = relationship("Class", back_populates="documents") 
\ No newline at end of file
@@ -0,0 +1,35 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Tuple
+
+DOCUMENTS_PAGE_SIZE = 100
+DOCUMENTS_MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(uploaded_at: datetime, document_id: uuid.UUID) -> str:
+    """Opaque cursor pointing just after the (uploaded_at, id) of the last row on a page."""
+    raw = json.dumps([uploaded_at.isoformat(), str(document_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        uploaded_at, document_id = json.loads(raw)
+        return datetime.fromisoformat(uploaded_at), uuid.UUID(document_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def documents_etag(class_id: uuid.UUID, version: int, cursor: str, limit: int) -> str:
+    """
+    Weak ETag for a page of a class's documents. The class's documents_version is bumped
+    by a database trigger on every visible change, so it identifies the listing without reading it.
+    """
+    return f'W/"{class_id}.{version}.{cursor or ""}.{limit}"'
@@ -1,4 +1,3 @@
-import fitz  # PyMuPDF
 import logging
 from typing import Optional, List, Tuple
 
@@ -9,6 +8,7 @@ def extract_text_by_page(file_path: str) -> Optional[List[Tuple[int, str]]]:
     Extract text content from a PDF file, per page.
     Returns a list of (page_number, text) tuples.
     """
+    import fitz  # PyMuPDF, imported on first use to keep startup fast
     try:
         doc = fitz.open(file_path)
         pages = []
@@ -28,6 +28,7 @@ def extract_text_from_pdf(file_path: str) -> str:
     Extract all text from a PDF file as a single string.
     Returns the concatenated text from all pages.
     """
+    import fitz  # PyMuPDF
     try:
         doc = fitz.open(file_path)
         text = ""
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+from shared.storage import get_s3_client
+
+logger = logging.getLogger(__name__)
+
+PRESIGNED_URL_EXPIRES_IN = 3600  # 1 hour
+# Stop handing out a cached URL this long before it expires, so clients still get a usable link
+PRESIGNED_URL_REFRESH_MARGIN = 300  # 5 minutes
+CACHE_KEY_PREFIX = "presign:"
+
+
+def _cache_key(document_id: str) -> str:
+    return f"{CACHE_KEY_PREFIX}{document_id}"
+
+
+async def get_presigned_download_urls(
+    redis_client,
+    documents: Iterable[Tuple[str, Optional[str], Optional[str]]],
+) -> Dict[str, Optional[str]]:
+    """
+    Returns {document_id: presigned GET url} for (document_id, bucket, key) tuples.
+
+    URLs are cached in Redis until PRESIGNED_URL_REFRESH_MARGIN before they expire, so
+    repeat calls cost one MGET for the whole batch. Only cache misses are signed.
+    If Redis is unavailable every URL is signed directly.
+    """
+    documents = list(documents)
+    if not documents:
+        return {}
+
+    cache_keys = [_cache_key(document_id) for document_id, _, _ in documents]
+    try:
+        cached = await redis_client.mget(cache_keys)
+    except Exception as e:
+        logger.warning(f"Presigned URL cache unavailable, signing directly: {e}")
+        cached = [None] * len(documents)
+
+    result = {}
+    fresh = {}
+    for (document_id, bucket, key), cached_url in zip(documents, cached):
+        if cached_url:
+            result[document_id] = cached_url.decode() if isinstance(cached_url, bytes) else cached_url
+            continue
+        if not bucket or not key:
+            result[document_id] = None
+            continue
+        try:
+            url = get_s3_client().generate_presigned_url(
+                ClientMethod='get_object',
+                Params={'Bucket': bucket, 'Key': key},
+                ExpiresIn=PRESIGNED_URL_EXPIRES_IN,
+            )
+        except Exception as e:
+            logger.error(f"Failed to presign S3 file {key}: {e}")
+            result[document_id] = None
+            continue
+        result[document_id] = url
+        fresh[_cache_key(document_id)] = url
+
+    if fresh:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for cache_key, url in fresh.items():
+                pipe.setex(cache_key, PRESIGNED_URL_EXPIRES_IN - PRESIGNED_URL_REFRESH_MARGIN, url)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to cache presigned URLs: {e}")
+
+    return result
+
+
+async def invalidate_presigned_urls(redis_client, document_ids: Iterable[str]) -> None:
+    """Drops cached URLs, e.g. when documents are deleted."""
+    cache_keys = [_cache_key(str(document_id)) for document_id in document_ids]
+    if not cache_keys:
+        return
+    try:
+        await redis_client.delete(*cache_keys)
+    except Exception as e:
+        logger.warning(f"Failed to invalidate presigned URLs: {e}")
+
+
+def compute_etag(payload) -> str:
+    """Weak ETag for a JSON-serialisable response body."""
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    return f'W/"{digest}"'
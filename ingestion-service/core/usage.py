@@ -0,0 +1,97 @@
+import logging
+from typing import Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    """Raised when a reservation would take a user over their limit."""
+
+    def __init__(self, current: int, limit: int):
+        super().__init__(f"Quota exceeded: {current}/{limit}")
+        self.current = current
+        self.limit = limit
+
+
+# Seeds the counter row from the real tables the first time a user is seen.
+# The NOT EXISTS guard keeps the COUNT(*) subqueries from running once the row exists.
+_ENSURE_ROW = text("""
+    INSERT INTO user_usage (user_id, document_count, class_count)
+    SELECT CAST(:user_id AS uuid),
+        (SELECT count(*) FROM documents WHERE user_id = :user_id AND status != 'deleting'),
+        (SELECT count(*) FROM classes WHERE user_id = :user_id AND status != 'deleting')
+    WHERE NOT EXISTS (SELECT 1 FROM user_usage WHERE user_id = :user_id)
+    ON CONFLICT (user_id) DO NOTHING
+""")
+
+_RESERVE = {
+    column: text(f"""
+        UPDATE user_usage
+        SET {column} = {column} + :amount, updated_at = NOW()
+        WHERE user_id = :user_id AND {column} + :amount <= :limit
+        RETURNING {column}
+    """)
+    for column in ("document_count", "class_count")
+}
+
+_RELEASE = {
+    column: text(f"""
+        UPDATE user_usage
+        SET {column} = GREATEST({column} - :amount, 0), updated_at = NOW()
+        WHERE user_id = :user_id
+    """)
+    for column in ("document_count", "class_count")
+}
+
+
+async def get_usage(db: AsyncSession, user_id: str) -> Tuple[int, int]:
+    """Returns (document_count, class_count) for a user with a single primary-key lookup."""
+    await db.execute(_ENSURE_ROW, {"user_id": user_id})
+    row = (await db.execute(
+        text("SELECT document_count, class_count FROM user_usage WHERE user_id = :user_id"),
+        {"user_id": user_id},
+    )).fetchone()
+    await db.commit()
+    return row.document_count, row.class_count
+
+
+async def _reserve(db: AsyncSession, column: str, user_id: str, amount: int, limit: int) -> int:
+    await db.execute(_ENSURE_ROW, {"user_id": user_id})
+    row = (await db.execute(_RESERVE[column], {"user_id": user_id, "amount": amount, "limit": limit})).fetchone()
+    if row is None:
+        current = (await db.execute(
+            text(f"SELECT {column} FROM user_usage WHERE user_id = :user_id"),
+            {"user_id": user_id},
+        )).scalar()
+        raise QuotaExceeded(current or 0, limit)
+    return row[0]
+
+
+async def reserve_documents(db: AsyncSession, user_id: str, amount: int, limit: int) -> int:
+    """
+    Atomically checks and reserves room for `amount` documents.
+    The counter row stays locked until the caller's transaction ends, so concurrent
+    uploads cannot both squeeze under the limit. Call this in the same transaction
+    that inserts the documents; a rollback gives the reservation back.
+    Returns the new document count, or raises QuotaExceeded.
+    """
+    return await _reserve(db, "document_count", user_id, amount, limit)
+
+
+async def reserve_class(db: AsyncSession, user_id: str, limit: int) -> int:
+    """Atomically checks and reserves room for one class. See reserve_documents."""
+    return await _reserve(db, "class_count", user_id, 1, limit)
+
+
+async def release_documents(db: AsyncSession, user_id: str, amount: int) -> None:
+    """Gives back `amount` documents, in the same transaction that marks them deleted."""
+    if amount > 0:
+        await db.execute(_RELEASE["document_count"], {"user_id": user_id, "amount": amount})
+
+
+async def release_class(db: AsyncSession, user_id: str) -> None:
+    """Gives back one class, in the same transaction that marks it deleted."""
+    await db.execute(_RELEASE["class_count"], {"user_id": user_id, "amount": 1})
@@ -1,47 +1,75 @@
 import os
 import logging
 import uuid
-from typing import List
-import re
+from typing import List, Optional
 import ssl
 
+import httpx
 import redis
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Form, Query
-from sqlalchemy.orm import Session
-from pinecone import Pinecone
+import redis.asyncio as aioredis
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Form, Query, Request, Response
+from sqlalchemy import select, update, delete, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from prometheus_client import make_asgi_app
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import requests
-from fastapi import APIRouter
-import boto3
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 
 from core.config import settings
-from core.database import get_db
+from core.database import get_db, engine
 from core import models
 from core.pdf_parser import extract_text_from_pdf
 from core.chunking import chunk_text
+from core.usage import (
+    QuotaExceeded,
+    get_usage,
+    reserve_documents,
+    reserve_class,
+    release_documents,
+    release_class,
+)
+from core.presign import get_presigned_download_urls, invalidate_presigned_urls, compute_etag
+from core.events import stream_document_events, issue_stream_ticket, redeem_stream_ticket
+from core.pagination import (
+    DOCUMENTS_PAGE_SIZE,
+    DOCUMENTS_MAX_PAGE_SIZE,
+    InvalidCursor,
+    encode_cursor,
+    decode_cursor,
+    documents_etag,
+)
 from celery_config import celery_app
-from shared.storage import upload_file_to_s3, s3_client
+from shared.rate_limit import RateLimiter
+from shared.tracing import setup_tracing
+from shared.storage import (
+    AWS_S3_BUCKET,
+    upload_fileobjs_to_s3,
+    build_s3_key,
+    s3_url_for_key,
+    parse_s3_url,
+    generate_presigned_upload,
+    get_s3_object_size,
+    delete_s3_object,
+    get_s3_client,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Rate limiting setup
-limiter = Limiter(key_func=get_remote_address)
-
 app = FastAPI(
     title="ClassGPT Ingestion Service",
     description="Handles file uploads, class management, and queues documents for embedding.",
     version="1.0.0",
 )
 
-# Add rate limiting error handler
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Prometheus metrics (database pool wait times, ...)
+app.mount("/metrics", make_asgi_app())
+
+# OpenTelemetry spans for requests, S3, Postgres and queued tasks (off unless OTEL_TRACES_EXPORTER is set).
+# The trace context travels in the Celery message headers to the embedding worker.
+setup_tracing("ingestion-service", app=app, engines=[engine], celery=True)
 
 # Conservative limits for personal project ($5-10/month budget)
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB per file (reduced from 50MB)
@@ -52,41 +80,64 @@ MAX_UPLOADS_PER_HOUR = 10  # Max 10 uploads per hour per user
 
 # Production-ready Redis client initialization for Upstash
 if ".upstash.io" in settings.REDIS_URL:
-    redis_client = redis.from_url(settings.REDIS_URL, ssl_cert_reqs=ssl.CERT_NONE)
+    redis_client = aioredis.from_url(settings.REDIS_URL, ssl_cert_reqs=ssl.CERT_NONE)
 else:
-    redis_client = redis.from_url(settings.REDIS_URL)
+    redis_client = aioredis.from_url(settings.REDIS_URL)
+
+# Rate limits per user, counted in Redis so they hold across replicas
+limiter = RateLimiter(client=redis_client)
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Pinecone configuration
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "classgpt-chunks")
+class ClassCreate(BaseModel):
+    name: str
 
-# Initialize Pinecone client
-pc = Pinecone(api_key=PINECONE_API_KEY)
+class BatchPresignRequest(BaseModel):
+    document_ids: List[str]
+
+class UploadFileSpec(BaseModel):
+    filename: str
+    size: int
+
+class PresignUploadRequest(BaseModel):
+    class_id: uuid.UUID
+    files: List[UploadFileSpec]
+
+class CompleteUploadRequest(BaseModel):
+    document_ids: List[uuid.UUID]
 
 security = HTTPBearer()
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8002/me")
 
+# One pooled HTTP client for auth lookups, so token checks never block the event loop
+auth_http_client = httpx.AsyncClient(timeout=5)
+
 # Helper to get user_id from JWT
-async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    headers = {"Authorization": f"Bearer {credentials.credentials}"}
+async def resolve_user_id(token: str):
+    headers = {"Authorization": f"Bearer {token}"}
     try:
-        resp = requests.get(AUTH_SERVICE_URL, headers=headers, timeout=5)
+        resp = await auth_http_client.get(AUTH_SERVICE_URL, headers=headers)
         resp.raise_for_status()
         return resp.json()["id"]
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
+async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await resolve_user_id(credentials.credentials)
+
+create_class_limit = limiter.limit("5/hour", scope="create_class", identity=get_current_user_id)
+# Direct and presigned uploads share one budget
+upload_limit = limiter.limit(f"{MAX_UPLOADS_PER_HOUR}/hour", scope="upload", identity=get_current_user_id)
+
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     """
-    Check Redis connection on startup.
+    Build the S3 client and check Redis connection on startup.
     """
+    await run_in_threadpool(get_s3_client)
     try:
-        redis_client.ping()
+        await redis_client.ping()
         logger.info("Successfully connected to Redis.")
     except redis.exceptions.ConnectionError as e:
         logger.error(f"Failed to connect to Redis: {e}")
@@ -94,6 +145,16 @@ def on_startup():
         # raise RuntimeError("Failed to connect to Redis") from e
 
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    """
+    Release pooled connections.
+    """
+    await auth_http_client.aclose()
+    await redis_client.close()
+    await engine.dispose()
+
+
 @app.get("/health", status_code=200)
 def health_check():
     """
@@ -103,26 +164,31 @@ def health_check():
 
 
 @app.get("/api/classes", status_code=200)
-def get_classes(db: Session = Depends(get_db), user_id: str = Depends(get_current_user_id)):
+async def get_classes(db: AsyncSession = Depends(get_db), user_id: str = Depends(get_current_user_id)):
     """
     Returns a list of all classes.
     """
-    classes = db.query(models.Class).filter(models.Class.user_id == user_id).all()
+    result = await db.execute(select(models.Class).where(
+        models.Class.user_id == user_id,
+        models.Class.status != "deleting",
+    ))
+    classes = result.scalars().all()
     return classes
 
 
-@app.post("/api/classes", status_code=201)
-@limiter.limit("5/hour")  # Rate limit: 5 class creations per hour per IP
+@app.post("/api/classes", status_code=201, dependencies=[create_class_limit])
 async def create_class(
     class_data: ClassCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: str = Depends(get_current_user_id),
 ):
     """Create a new class for the authenticated user."""
     
-    # Check user class quota
-    user_class_count = db.query(models.Class).filter(models.Class.user_id == user_id).count()
-    if user_class_count >= MAX_CLASSES_PER_USER:
+    # Check and reserve user class quota, committed together with the new class
+    try:
+        await reserve_class(db, user_id, MAX_CLASSES_PER_USER)
+    except QuotaExceeded:
+        await db.rollback()
         raise HTTPException(
             status_code=400, 
             detail=f"You have reached your class limit. Maximum {MAX_CLASSES_PER_USER} classes allowed."
@@ -134,42 +200,49 @@ async def create_class(
         user_id=user_id,
     )
     db.add(new_class)
-    db.commit()
-    db.refresh(new_class)
+    await db.commit()
+    await db.refresh(new_class)
     return new_class
 
 
 @app.delete("/api/classes/{class_id}", status_code=204)
-def delete_class(class_id: uuid.UUID, db: Session = Depends(get_db), user_id: str = Depends(get_current_user_id)):
+async def delete_class(class_id: uuid.UUID, db: AsyncSession = Depends(get_db), user_id: str = Depends(get_current_user_id)):
     """
-    Deletes a class and all associated documents, including S3 files.
+    Marks a class and its documents as deleting and queues the cleanup.
+    S3 files, embeddings and the rows themselves are removed by the embedding worker.
     """
-    db_class = db.query(models.Class).filter(models.Class.id == class_id, models.Class.user_id == user_id).first()
+    result = await db.execute(select(models.Class).where(
+        models.Class.id == class_id,
+        models.Class.user_id == user_id,
+        models.Class.status != "deleting",
+    ))
+    db_class = result.scalars().first()
     if not db_class:
         raise HTTPException(status_code=404, detail="Class not found")
-    # Delete all S3 files for this class
-    docs = db.query(models.Document).filter(models.Document.class_id == class_id).all()
-    for doc in docs:
-        if doc.s3_url:
-            match = re.match(r"https://([^.]+)\.s3\.[^.]+\.amazonaws\.com/(.+)", doc.s3_url)
-            if match:
-                bucket, key = match.group(1), match.group(2)
-                try:
-                    s3_client.delete_object(Bucket=bucket, Key=key)
-                except Exception as e:
-                    print(f"Warning: Failed to delete S3 file {key}: {e}")
-    # Associated documents are deleted via CASCADE in the database
-    db.delete(db_class)
-    db.commit()
+    db_class.status = "deleting"
+    result = await db.execute(select(models.Document.id).where(models.Document.class_id == class_id))
+    document_ids = result.scalars().all()
+    result = await db.execute(
+        update(models.Document)
+        .where(models.Document.class_id == class_id, models.Document.status != "deleting")
+        .values(status="deleting")
+    )
+    await release_class(db, user_id)
+    await release_documents(db, user_id, result.rowcount)
+    await db.commit()
+    await invalidate_presigned_urls(redis_client, document_ids)
+    celery_app.send_task(
+        'tasks.delete_class',
+        args=[str(class_id)],
+    )
     return
 
 
-@app.post("/api/upload", status_code=200)
-@limiter.limit("10/hour")  # Rate limit: 10 uploads per hour per IP
+@app.post("/api/upload", status_code=200, dependencies=[upload_limit])
 async def upload_files(
     class_id: uuid.UUID = Form(...),
     files: List[UploadFile] = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: str = Depends(get_current_user_id),
 ):
     """
@@ -195,172 +268,421 @@ async def upload_files(
             )
         total_size += file.size
 
-    # Check user document quota
-    user_doc_count = db.query(models.Document).filter(models.Document.user_id == user_id).count()
-    if user_doc_count + len(files) > MAX_DOCUMENTS_PER_USER:
+    # 1. Verify class exists, belongs to user and is not being deleted. The row stays share-locked
+    # until the documents are inserted, so a concurrent class deletion counts them.
+    result = await db.execute(select(models.Class).where(
+        models.Class.id == class_id,
+        models.Class.user_id == user_id,
+        models.Class.status != "deleting",
+    ).with_for_update(read=True))
+    db_class = result.scalars().first()
+    if not db_class:
+        raise HTTPException(status_code=404, detail=f"Class with ID {class_id} not found.")
+
+    # 2. Reserve quota and record every document as "uploading" before anything is sent to S3,
+    # so a rejected upload never writes a file. Each file goes under its own document's key.
+    new_documents = []
+    for file in files:
+        document_id = uuid.uuid4()
+        key = build_s3_key(user_id, db_class.id, document_id, file.filename)
+        new_documents.append(models.Document(
+            id=document_id,
+            class_id=db_class.id,
+            filename=file.filename,
+            status="uploading",
+            user_id=user_id,
+            s3_url=s3_url_for_key(key),
+            s3_bucket=AWS_S3_BUCKET,
+            s3_key=key,
+        ))
+    try:
+        await reserve_documents(db, user_id, len(new_documents), MAX_DOCUMENTS_PER_USER)
+        db.add_all(new_documents)
+        await db.commit()
+    except QuotaExceeded as e:
+        await db.rollback()
         raise HTTPException(
-            status_code=400, 
-            detail=f"Upload would exceed your document limit. You have {user_doc_count}/{MAX_DOCUMENTS_PER_USER} documents."
+            status_code=400,
+            detail=f"Upload would exceed your document limit. You have {e.current}/{MAX_DOCUMENTS_PER_USER} documents."
         )
+    document_ids = [doc.id for doc in new_documents]
 
-    # 1. Verify class exists and belongs to user
-    db_class = db.query(models.Class).filter(models.Class.id == class_id, models.Class.user_id == user_id).first()
+    # 3. Stream every file to S3 in parallel, off the event loop. On failure the files that
+    # did upload are already removed; drop the rows and give back the quota.
+    try:
+        await run_in_threadpool(
+            upload_fileobjs_to_s3,
+            [(file.file, file.filename, doc.id) for file, doc in zip(files, new_documents)],
+            user_id,
+            db_class.id,
+        )
+    except Exception as e:
+        logger.error(f"Failed to upload files to S3 for class {db_class.name}. Error: {e}")
+        result = await db.execute(
+            delete(models.Document)
+            .where(models.Document.id.in_(document_ids), models.Document.status == "uploading")
+        )
+        await release_documents(db, user_id, result.rowcount)
+        await db.commit()
+        raise HTTPException(status_code=500, detail="Could not upload files.")
+
+    # 4. Mark the documents pending and queue them for processing by the embedding worker.
+    # Any the class deletion has claimed meanwhile are left to it.
+    result = await db.execute(
+        update(models.Document)
+        .where(models.Document.id.in_(document_ids), models.Document.status == "uploading")
+        .values(status="pending")
+        .returning(models.Document.id)
+    )
+    pending = set(result.scalars().all())
+    await db.commit()
+    new_documents = [doc for doc in new_documents if doc.id in pending]
+    for new_document in new_documents:
+        celery_app.send_task(
+            'tasks.process_document',
+            args=[str(new_document.id), new_document.s3_url],
+        )
+    processed_files = [doc.filename for doc in new_documents]
+    logger.info(f"Successfully saved and queued {len(processed_files)} document(s) for class {db_class.name}")
+
+    response_data = {
+        "message": f"Successfully uploaded and queued {len(processed_files)} file(s).",
+        "filenames": processed_files,
+    }
+
+    return response_data
+
+
+@app.post("/api/upload/presign", status_code=200, dependencies=[upload_limit])
+async def presign_upload(
+    upload: PresignUploadRequest,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Step 1 of a direct-to-S3 upload.
+    Validates quotas, creates a document row per file in the "uploading" state and
+    returns a presigned POST for each one. The file bytes never pass through this service.
+    """
+    if not upload.files:
+        raise HTTPException(status_code=400, detail="No files were sent.")
+
+    if len(upload.files) > MAX_FILES_PER_UPLOAD:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files. Maximum {MAX_FILES_PER_UPLOAD} files per upload."
+        )
+
+    for spec in upload.files:
+        if spec.size <= 0 or spec.size > MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File {spec.filename} is too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB."
+            )
+
+    # Share-locked until the documents are inserted, so a concurrent class deletion counts them
+    result = await db.execute(select(models.Class).where(
+        models.Class.id == upload.class_id,
+        models.Class.user_id == user_id,
+        models.Class.status != "deleting",
+    ).with_for_update(read=True))
+    db_class = result.scalars().first()
     if not db_class:
-        raise HTTPException(status_code=404, detail=f"Class with ID {class_id} not found.")
+        raise HTTPException(status_code=404, detail=f"Class with ID {upload.class_id} not found.")
 
-    processed_files = []
-    
-    for file in files:
-        file_bytes = await file.read()
-        
-        try:
-            # Upload to S3
-            s3_url = upload_file_to_s3(file_bytes, file.filename, user_id, class_id)
+    # Reserve quota in the same transaction that creates the document rows
+    try:
+        await reserve_documents(db, user_id, len(upload.files), MAX_DOCUMENTS_PER_USER)
+    except QuotaExceeded as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Upload would exceed your document limit. You have {e.current}/{MAX_DOCUMENTS_PER_USER} documents."
+        )
 
-            # 4. Create a document record in the database
+    uploads = []
+    try:
+        for spec in upload.files:
+            document_id = uuid.uuid4()
+            key = build_s3_key(user_id, db_class.id, document_id, spec.filename)
+            presigned = generate_presigned_upload(key, MAX_FILE_SIZE)
             new_document = models.Document(
-                id=uuid.uuid4(),
+                id=document_id,
                 class_id=db_class.id,
-                filename=file.filename,
-                status="pending",
+                filename=spec.filename,
+                status="uploading",
                 user_id=user_id,
-                s3_url=s3_url,
+                s3_url=s3_url_for_key(key),
+                s3_bucket=AWS_S3_BUCKET,
+                s3_key=key,
             )
             db.add(new_document)
-            db.commit()
-            db.refresh(new_document)
-
-            # 5. Queue the document for processing using Celery
-            # We'll use a simple task name that the embedding worker will handle
-            celery_app.send_task(
-                'tasks.process_document',
-                args=[str(new_document.id), s3_url],
-                queue='embedding_queue'
-            )
-            
-            processed_files.append(file.filename)
-            logger.info(f"Successfully saved and queued document: {file.filename} for class {db_class.name}")
-
-        except Exception as e:
-            logger.error(f"Failed to process file {file.filename}. Error: {e}")
-            # Optionally, rollback the DB commit or handle partial failure
-            db.rollback()
-            raise HTTPException(
-                status_code=500, detail=f"Could not save or queue file: {file.filename}"
-            )
+            uploads.append({
+                "document_id": str(new_document.id),
+                "filename": spec.filename,
+                "url": presigned["url"],
+                "fields": presigned["fields"],
+            })
+        await db.commit()
+    except Exception as e:
+        logger.error(f"Failed to presign upload for class {upload.class_id}. Error: {e}")
+        await db.rollback()
+        raise HTTPException(status_code=500, detail="Could not prepare upload.")
 
-    response_data = {
-        "message": f"Successfully uploaded and queued {len(processed_files)} file(s).",
-        "filenames": processed_files,
-    }
+    return {"uploads": uploads}
 
-    return response_data
+
+@app.post("/api/upload/complete", status_code=200)
+async def complete_upload(
+    upload: CompleteUploadRequest,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Step 2 of a direct-to-S3 upload.
+    Verifies each object landed in S3 and queues it for processing. Documents whose
+    object is missing stay in the "uploading" state so the client can retry; the worker
+    deletes those never completed (expire_stale_uploads) and gives back their quota.
+    If S3 cannot be reached nothing is changed and the client gets a 503 to retry on.
+    """
+    result = await db.execute(select(models.Document).where(
+        models.Document.id.in_(upload.document_ids),
+        models.Document.user_id == user_id,
+        models.Document.status == "uploading",
+    ))
+    docs = result.scalars().all()
+
+    queued, missing, rejected = [], [], []
+    for doc in docs:
+        key = doc.s3_key
+        if not key:
+            rejected.append(str(doc.id))
+            continue
+        try:
+            size = await run_in_threadpool(get_s3_object_size, key)
+        except RuntimeError as e:
+            logger.error(f"Failed to verify S3 file {key}: {e}")
+            await db.rollback()
+            raise HTTPException(status_code=503, detail="Could not verify uploaded files. Please try again.")
+        if size is None:
+            missing.append(str(doc.id))
+            continue
+        if size > MAX_FILE_SIZE:
+            # The presigned policy should make this impossible, but never process oversized files
+            try:
+                await run_in_threadpool(delete_s3_object, key)
+            except Exception as e:
+                logger.warning(f"Failed to delete oversized S3 file {key}: {e}")
+            doc.status = "failed"
+            rejected.append(str(doc.id))
+            continue
+        doc.status = "pending"
+        queued.append(doc)
+    await db.commit()
+
+    for doc in queued:
+        celery_app.send_task(
+            'tasks.process_document',
+            args=[str(doc.id), doc.s3_url],
+        )
+        logger.info(f"Successfully verified and queued document: {doc.filename}")
+
+    return {
+        "queued": [str(doc.id) for doc in queued],
+        "missing": missing,
+        "rejected": rejected,
+    }
 
 
 @app.get("/api/documents", status_code=200)
-def get_documents(class_id: uuid.UUID = Query(...), db: Session = Depends(get_db), user_id: str = Depends(get_current_user_id)):
+async def get_documents(
+    request: Request,
+    response: Response,
+    class_id: uuid.UUID = Query(...),
+    limit: int = Query(DOCUMENTS_PAGE_SIZE, ge=1, le=DOCUMENTS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(get_current_user_id),
+):
     """
-    Returns a list of all documents for a given class.
+    Returns a page of documents for a given class, oldest first.
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    A matching If-None-Match is answered with 304 without reading the documents.
     """
-    documents = db.query(models.Document).join(models.Class).filter(models.Class.id == class_id, models.Class.user_id == user_id).all()
+    result = await db.execute(select(models.Class.documents_version).where(
+        models.Class.id == class_id,
+        models.Class.user_id == user_id,
+        models.Class.status != "deleting",
+    ))
+    version = result.scalar_one_or_none()
+    if version is None:
+        return []
+
+    etag = documents_etag(class_id, version, cursor, limit)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    query = select(
+        models.Document.id,
+        models.Document.filename,
+        models.Document.status,
+        models.Document.uploaded_at,
+    ).where(
+        models.Document.class_id == class_id,
+        models.Document.status != "deleting",
+    )
+    if cursor:
+        try:
+            after_uploaded_at, after_id = decode_cursor(cursor)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(
+            tuple_(models.Document.uploaded_at, models.Document.id) > tuple_(after_uploaded_at, after_id)
+        )
+    # Fetch one extra row to know whether there is a next page
+    result = await db.execute(
+        query.order_by(models.Document.uploaded_at, models.Document.id).limit(limit + 1)
+    )
+    rows = result.all()
+
+    response.headers.update(headers)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].uploaded_at, rows[-1].id)
     return [
         {
-            "id": str(doc.id),
-            "filename": doc.filename,
-            "status": doc.status,
-            "uploaded_at": doc.uploaded_at,
+            "id": str(row.id),
+            "filename": row.filename,
+            "status": row.status,
+            "uploaded_at": row.uploaded_at,
         }
-        for doc in documents
+        for row in rows
     ]
 
 
 @app.delete("/api/documents/{document_id}", status_code=204)
-def delete_document(document_id: uuid.UUID, db: Session = Depends(get_db), user_id: str = Depends(get_current_user_id)):
+async def delete_document(document_id: uuid.UUID, db: AsyncSession = Depends(get_db), user_id: str = Depends(get_current_user_id)):
     """
-    Deletes a single document by its UUID and removes corresponding embeddings from Pinecone and S3.
+    Marks a document as deleting and queues the cleanup.
+    The S3 file, its embeddings and the row are removed by the embedding worker.
     """
-    db_doc = db.query(models.Document).join(models.Class).filter(models.Document.id == document_id, models.Class.user_id == user_id).first()
+    result = await db.execute(select(models.Document).join(models.Class).where(
+        models.Document.id == document_id,
+        models.Class.user_id == user_id,
+        models.Document.status != "deleting",
+    ))
+    db_doc = result.scalars().first()
     if not db_doc:
         raise HTTPException(status_code=404, detail="Document not found")
-    # Delete S3 file
-    if db_doc.s3_url:
-        match = re.match(r"https://([^.]+)\.s3\.[^.]+\.amazonaws\.com/(.+)", db_doc.s3_url)
-        if match:
-            bucket, key = match.group(1), match.group(2)
-            try:
-                s3_client.delete_object(Bucket=bucket, Key=key)
-            except Exception as e:
-                print(f"Warning: Failed to delete S3 file {key}: {e}")
-    db.delete(db_doc)
-    db.commit()
-    # Delete corresponding embeddings from Pinecone
-    try:
-        index = pc.Index(PINECONE_INDEX_NAME)
-        index.delete(filter={"document_id": str(document_id)})
-        logger.info(f"Successfully deleted embeddings from Pinecone for document {document_id}")
-    except Exception as e:
-        logger.error(f"Failed to delete embeddings from Pinecone for document {document_id}: {e}")
+    db_doc.status = "deleting"
+    await release_documents(db, user_id, 1)
+    await db.commit()
+    await invalidate_presigned_urls(redis_client, [document_id])
+    celery_app.send_task(
+        'tasks.delete_documents',
+        args=[[str(document_id)]],
+    )
     return
 
 
-class BatchPresignRequest(BaseModel):
-    document_ids: List[str]
-
-class ClassCreate(BaseModel):
-    name: str
-
 @app.post("/api/presign/batch")
-def get_batch_presigned_urls(request: BatchPresignRequest, db: Session = Depends(get_db), user_id: str = Depends(get_current_user_id)):
-    """Get pre-signed URLs for multiple documents in a single request"""
-    # Fetch all documents for the user in a single query
-    docs = db.query(models.Document).filter(
+async def get_batch_presigned_urls(
+    request: BatchPresignRequest,
+    http_request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Get pre-signed URLs for multiple documents in a single request.
+    URLs come from the presign cache, and a matching If-None-Match is answered with 304.
+    """
+    # Fetch only the columns needed to sign, for all of the user's documents, in a single query
+    result = await db.execute(select(
+        models.Document.id,
+        models.Document.s3_bucket,
+        models.Document.s3_key,
+        models.Document.s3_url,
+    ).where(
         models.Document.id.in_(request.document_ids),
-        models.Document.user_id == user_id
-    ).all()
-    
-    # Create a map of document_id to document
-    doc_map = {str(doc.id): doc for doc in docs}
-    
-    # Initialize S3 client once
-    s3 = boto3.client(
-        "s3",
-        region_name=os.getenv("AWS_S3_REGION", "us-east-2"),
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        models.Document.user_id == user_id,
+        models.Document.status != "deleting",
+    ))
+    rows = result.all()
+
+    # Rows uploaded before bucket/key were stored get them parsed once and saved
+    backfilled = {}
+    for row in rows:
+        if row.s3_key is None and row.s3_url:
+            parsed = parse_s3_url(row.s3_url)
+            if parsed:
+                backfilled[row.id] = parsed
+    for doc_id, (bucket, key) in backfilled.items():
+        await db.execute(
+            update(models.Document).where(models.Document.id == doc_id).values(s3_bucket=bucket, s3_key=key)
+        )
+    if backfilled:
+        await db.commit()
+
+    urls = await get_presigned_download_urls(
+        redis_client,
+        [
+            (str(row.id), *backfilled.get(row.id, (row.s3_bucket, row.s3_key)))
+            for row in rows
+        ],
     )
-    
-    result = {}
-    for doc_id in request.document_ids:
-        doc = doc_map.get(doc_id)
-        if not doc or not doc.s3_url:
-            result[doc_id] = None
-            continue
-            
-        try:
-            # Parse bucket and key from s3_url
-            match = re.match(r"https://([^.]+)\.s3\.[^.]+\.amazonaws\.com/(.+)", doc.s3_url)
-            if not match:
-                result[doc_id] = None
-                continue
-                
-            bucket, key = match.group(1), match.group(2)
-            url = s3.generate_presigned_url(
-                ClientMethod='get_object',
-                Params={'Bucket': bucket, 'Key': key},
-                ExpiresIn=3600  # 1 hour
-            )
-            result[doc_id] = url
-        except Exception:
-            result[doc_id] = None
-    
+    result = {doc_id: urls.get(doc_id) for doc_id in request.document_ids}
+
+    etag = compute_etag(result)
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return result
 
 
+@app.post("/api/events/ticket")
+async def create_events_ticket(user_id: str = Depends(get_current_user_id)):
+    """
+    Issue a short-lived, single-use ticket for opening /api/events.
+    EventSource cannot set headers, so the stream is authenticated with this in the query
+    string rather than with the long-lived JWT, which would end up in access logs.
+    """
+    return {"ticket": await issue_stream_ticket(redis_client, user_id)}
+
+
+@app.get("/api/events")
+async def document_events(
+    request: Request,
+    ticket: str = Query(...),
+    class_id: Optional[uuid.UUID] = Query(None),
+    last_event_id: Optional[str] = Query(None),
+):
+    """
+    Server-sent stream of document status and progress events for the user's classes.
+    Opened with a ticket from POST /api/events/ticket; each reconnect needs a new one.
+    Reconnecting clients get every event after Last-Event-ID replayed first.
+    """
+    user_id = await redeem_stream_ticket(redis_client, ticket)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired ticket")
+    return StreamingResponse(
+        stream_document_events(
+            redis_client,
+            request,
+            user_id,
+            class_id=str(class_id) if class_id else None,
+            last_event_id=request.headers.get("last-event-id") or last_event_id,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/user/usage")
-def get_user_usage(db: Session = Depends(get_db), user_id: str = Depends(get_current_user_id)):
+async def get_user_usage(db: AsyncSession = Depends(get_db), user_id: str = Depends(get_current_user_id)):
     """Get current user usage statistics"""
-    doc_count = db.query(models.Document).filter(models.Document.user_id == user_id).count()
-    class_count = db.query(models.Class).filter(models.Class.user_id == user_id).count()
+    doc_count, class_count = await get_usage(db, user_id)
     
     return {
         "documents": {
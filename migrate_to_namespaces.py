@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Online migration of vectors from the shared default namespace into one namespace per
+(user, class).
+
+1. Deploy the worker and query service with VECTOR_STORE_LEGACY_FALLBACK=true. New vectors
+   go to class namespaces, and searches and deletes also cover the default namespace.
+2. Run `python migrate_to_namespaces.py copy`. It copies every vector into the namespace
+   named by its user_id/class_id metadata, keeping the same ID, so a re-run is harmless.
+   Progress is checkpointed after every page; if interrupted, run it again to resume.
+3. Set VECTOR_STORE_LEGACY_FALLBACK=false and redeploy.
+4. Run `python migrate_to_namespaces.py cleanup` to empty the default namespace.
+
+The store is the production Pinecone index unless --store names another, in the form
+shared.vector_store.migrate takes. Paging, parallel writes, --max-rate and the checkpoint
+are that module's, so both migrations behave the same way.
+
+A class deleted while step 2 is running can leave a copy of its vectors in a namespace
+that nothing searches any more. That is harmless; drop it with delete_namespace if needed.
+"""
+import argparse
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from shared.vector_store import PINECONE_INDEX_NAME, EMBEDDING_DIM, tenant_namespace
+from shared.vector_store.migrate import Checkpoint, RateLimiter, copy_namespace, open_store
+
+PAGE_SIZE = 100
+
+
+class TenantNamespaces:
+    """
+    Stands in for the target store of copy_namespace: each page read from the default
+    namespace is written to the class namespaces its records' metadata name.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.copied = 0
+        self.skipped = 0
+
+    def upsert_batch(self, records, namespace: Optional[str] = None) -> int:
+        by_namespace = {}
+        skipped = 0
+        for record in records:
+            if not record.metadata.get("user_id") or not record.metadata.get("class_id"):
+                skipped += 1
+                continue
+            by_namespace.setdefault(
+                tenant_namespace(record.metadata["user_id"], record.metadata["class_id"]), []
+            ).append(record)
+        written = sum(self.store.upsert_batch(batch, namespace=tenant) for tenant, batch in by_namespace.items())
+        with self.lock:
+            self.copied += written
+            self.skipped += skipped
+        print(f"📦 Copied {self.copied} vectors, skipped {self.skipped} without user/class")
+        return written
+
+
+def copy_vectors(store, checkpoint: Checkpoint, parallelism: int, max_rate: Optional[float]):
+    progress = checkpoint.namespace(None)
+    if progress["done"]:
+        print(f"✅ Already read {progress['copied']} vectors (delete {checkpoint.path} to start over)")
+        return
+
+    target = TenantNamespaces(store)
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        copy_namespace(
+            store, target, None, checkpoint, executor, parallelism, PAGE_SIZE, RateLimiter(max_rate),
+            sample_size=0, rng=random.Random(),
+        )
+    print(f"✅ Copy complete: read {progress['copied']} vectors from the default namespace")
+
+
+def cleanup_default_namespace(store):
+    deleted = 0
+    while True:
+        # Always read the first page: everything on it is deleted before the next read
+        page = store.scan(namespace=None, limit=PAGE_SIZE)
+        ids = [record.id for record in page.records]
+        if not ids:
+            break
+        store.delete_by_ids(ids, namespace=None)
+        deleted += len(ids)
+        print(f"🧹 Deleted {deleted} vectors from the default namespace")
+    print("✅ Default namespace is empty")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("phase", choices=["copy", "cleanup"])
+    parser.add_argument("--store", default=f"pinecone:{PINECONE_INDEX_NAME}")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--parallelism", type=int, default=4, help="pages written at once")
+    parser.add_argument("--max-rate", type=float, help="vectors per second, to spare the production store")
+    parser.add_argument("--checkpoint", default="namespace_migration.json")
+    args = parser.parse_args()
+
+    store = open_store(args.store, args.dim)
+    print(f"📊 Store: {args.store}")
+    if args.phase == "copy":
+        # Source and target are the same store; the checkpoint is tied to it
+        copy_vectors(store, Checkpoint(args.checkpoint, args.store, args.store), args.parallelism, args.max_rate)
+    else:
+        cleanup_default_namespace(store)
+
+
+if __name__ == "__main__":
+    main()
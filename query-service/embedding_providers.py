@@ -1,7 +1,6 @@
 import os
-from typing import List
-import openai
-from sentence_transformers import SentenceTransformer
+import threading
+from typing import Dict, List, Optional, Tuple
 
 class EmbeddingProvider:
     def embed(self, texts: List[str]) -> List[List[float]]:
@@ -11,24 +10,36 @@ class OpenAIEmbeddingProvider(EmbeddingProvider):
     def __init__(self, api_key: str = None, model: str = "text-embedding-ada-002"):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.model = model
-        openai.api_key = self.api_key
 
     def embed(self, texts: List[str]) -> List[List[float]]:
+        import openai
+        openai.api_key = self.api_key
         response = openai.embeddings.create(input=texts, model=self.model)
         return [d.embedding for d in response.data]
 
 class LocalEmbeddingProvider(EmbeddingProvider):
     def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        # Imported here so services embedding with OpenAI never load torch
+        from sentence_transformers import SentenceTransformer
         self.model = SentenceTransformer(model_name)
 
     def embed(self, texts: List[str]) -> List[List[float]]:
         return self.model.encode(texts, show_progress_bar=False).tolist()
 
-def get_embedding_provider() -> EmbeddingProvider:
-    provider = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
-    if provider == "openai":
-        return OpenAIEmbeddingProvider()
-    elif provider == "local":
-        return LocalEmbeddingProvider()
-    else:
-        raise ValueError(f"Unknown EMBEDDING_PROVIDER: {provider}") 
\ No newline at end of file
+_providers: Dict[Tuple[str, Optional[str]], EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+def get_embedding_provider(provider: Optional[str] = None, model: Optional[str] = None) -> EmbeddingProvider:
+    """Provider from the environment or the given provider and model, reused across calls."""
+    provider = (provider or os.getenv("EMBEDDING_PROVIDER", "openai")).lower()
+    model = model or os.getenv("EMBEDDING_MODEL") or None
+    key = (provider, model)
+    with _providers_lock:
+        if key not in _providers:
+            if provider == "openai":
+                _providers[key] = OpenAIEmbeddingProvider(model=model) if model else OpenAIEmbeddingProvider()
+            elif provider == "local":
+                _providers[key] = LocalEmbeddingProvider(model_name=model) if model else LocalEmbeddingProvider()
+            else:
+                raise ValueError(f"Unknown EMBEDDING_PROVIDER: {provider}")
+        return _providers[key] 
\ No newline at end of file
@@ -0,0 +1,272 @@
+"""
+The one way query-service talks to the LLM.
+
+- One OpenAI client per process over a pooled, keep-alive HTTP connection pool.
+- Every call has a deadline (LLM_DEADLINE_S). Retries, backoff and hedges all fit inside it.
+- Transient failures (timeouts, connection errors, 429 and 5xx) are retried up to
+  LLM_MAX_RETRIES times with jittered exponential backoff.
+- Optional hedging: once LLM_HEDGE_MIN_SAMPLES calls have been timed, a call still running
+  after the LLM_HEDGE_PERCENTILE latency gets a second, identical request, and whichever
+  answers first wins. This trims tail latency for at most one extra request per slow call.
+- A circuit breaker opens after LLM_BREAKER_FAILURES consecutive failed calls and fails
+  every call immediately for LLM_BREAKER_RESET_S seconds. Then one trial call decides
+  whether it closes again.
+
+Point LLM_BASE_URL (or OPENAI_BASE_URL) at llm_stub.py to run the query path offline.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+import openai
+from openai import OpenAI
+from prometheus_client import Counter, Gauge, Histogram
+
+from shared.tracing import get_tracer
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None  # None lets the client use OPENAI_BASE_URL or api.openai.com
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "20"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "3"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF_S = float(os.getenv("LLM_RETRY_BACKOFF_S", "0.25"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))  # e.g. 0.95; 0 disables hedging
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "50"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds",
+    "Latency of single LLM HTTP requests",
+    ["outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 1.5, 2, 3, 5, 8, 13, 20, 30),
+)
+LLM_CALLS = Counter("llm_calls_total", "LLM calls (including their retries and hedges) by outcome", ["outcome"])
+LLM_RETRIES = Counter("llm_retries_total", "LLM requests retried after a transient failure")
+LLM_HEDGES = Counter("llm_hedged_requests_total", "Hedge requests sent")
+LLM_HEDGE_WINS = Counter("llm_hedge_wins_total", "Hedged calls answered by the hedge rather than the primary")
+# With several worker processes, 1 while any live worker's breaker is open
+LLM_CIRCUIT_OPEN = Gauge("llm_circuit_open", "1 while the LLM circuit breaker is open", multiprocess_mode="livemax")
+
+tracer = get_tracer(__name__)
+
+
+class LLMError(Exception):
+    """The LLM could not produce an answer."""
+
+
+class LLMUnavailable(LLMError):
+    """The circuit breaker is open; the call was not attempted."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class LLMDeadlineExceeded(LLMError):
+    """No answer within the call's deadline."""
+
+
+@dataclass
+class Completion:
+    text: str
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+    hedged: bool = False
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one trial call) -> closed or open."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self._trial_in_flight:
+                raise LLMUnavailable(max(remaining, 1))
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+            LLM_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                LLM_CIRCUIT_OPEN.set(1)
+            self._trial_in_flight = False
+
+
+class LatencyTracker:
+    """Rolling window of successful request latencies, for the hedging delay."""
+
+    def __init__(self, size: int = 500):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+_TIMEOUT_ERRORS = (FutureTimeoutError, TimeoutError, openai.APITimeoutError)
+
+
+def _is_transient(error: Exception) -> bool:
+    """Failures worth retrying, and that count towards opening the circuit"""
+    if isinstance(error, _TIMEOUT_ERRORS + (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class LLMGateway:
+    def __init__(self):
+        self.client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=LLM_BASE_URL,
+            max_retries=0,  # retries are ours, so they respect the deadline and the breaker
+            http_client=httpx.Client(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                timeout=httpx.Timeout(LLM_DEADLINE_S, connect=LLM_CONNECT_TIMEOUT_S),
+            ),
+        )
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_S)
+        self.latencies = LatencyTracker()
+        # Primary and hedge requests run here so a slow one can be raced
+        self._executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONNECTIONS, thread_name_prefix="llm")
+
+    def _request(self, messages: List[Dict], deadline: float, **params) -> Completion:
+        started = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(
+                model=LLM_MODEL, messages=messages, timeout=max(deadline - time.monotonic(), 0.1), **params
+            )
+        except Exception:
+            LLM_REQUEST_SECONDS.labels("error").observe(time.perf_counter() - started)
+            raise
+        elapsed = time.perf_counter() - started
+        LLM_REQUEST_SECONDS.labels("ok").observe(elapsed)
+        self.latencies.record(elapsed)
+        usage = response.usage
+        return Completion(
+            text=response.choices[0].message.content,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None,
+        )
+
+    def _attempt(self, messages: List[Dict], deadline: float, **params) -> Completion:
+        """One attempt, hedged with a second request if the first is slower than usual."""
+        # Run in a copy of this context so the request's HTTP span joins the caller's trace
+        primary = self._executor.submit(contextvars.copy_context().run, self._request, messages, deadline, **params)
+        hedge_after = self.latencies.percentile(LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES) if LLM_HEDGE_PERCENTILE else None
+        if hedge_after is None or hedge_after >= deadline - time.monotonic():
+            return primary.result(timeout=max(deadline - time.monotonic(), 0))
+
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+        hedge = self._executor.submit(contextvars.copy_context().run, self._request, messages, deadline, **params)
+        LLM_HEDGES.inc()
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        LLM_HEDGE_WINS.inc()
+                    completion = future.result()
+                    completion.hedged = True
+                    return completion
+                error = future.exception()
+        if error is not None:
+            raise error
+        raise FutureTimeoutError
+
+    def complete(self, messages: List[Dict], deadline_s: float = LLM_DEADLINE_S, **params) -> Completion:
+        """
+        Chat completion within deadline_s seconds. Raises LLMUnavailable while the breaker is
+        open, LLMDeadlineExceeded when time runs out and LLMError for other failures.
+        """
+        with tracer.start_as_current_span("llm.chat_completion", attributes={"llm.model": LLM_MODEL}) as span:
+            completion = self._complete(messages, deadline_s, span, **params)
+            span.set_attribute("llm.prompt_tokens", completion.prompt_tokens or 0)
+            span.set_attribute("llm.completion_tokens", completion.completion_tokens or 0)
+            span.set_attribute("llm.hedged", completion.hedged)
+            return completion
+
+    def _complete(self, messages: List[Dict], deadline_s: float, span, **params) -> Completion:
+        self.breaker.before_call()
+        deadline = time.monotonic() + deadline_s
+        attempt = 0
+        while True:
+            try:
+                completion = self._attempt(messages, deadline, **params)
+            except Exception as e:
+                transient = _is_transient(e)
+                remaining = deadline - time.monotonic()
+                backoff = LLM_RETRY_BACKOFF_S * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if transient and attempt < LLM_MAX_RETRIES and remaining > backoff:
+                    attempt += 1
+                    LLM_RETRIES.inc()
+                    span.add_event("retry", {"attempt": attempt, "error": type(e).__name__})
+                    time.sleep(backoff)
+                    continue
+                if transient:
+                    self.breaker.record_failure()
+                else:
+                    # e.g. a rejected request: the LLM itself is up
+                    self.breaker.record_success()
+                if isinstance(e, _TIMEOUT_ERRORS) or remaining <= 0:
+                    LLM_CALLS.labels("deadline_exceeded").inc()
+                    raise LLMDeadlineExceeded(f"No LLM answer within {deadline_s:.0f}s") from e
+                LLM_CALLS.labels("error").inc()
+                raise LLMError(str(e)) from e
+            self.breaker.record_success()
+            LLM_CALLS.labels("ok").inc()
+            return completion
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """The process-wide gateway, created on first use."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
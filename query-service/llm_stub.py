@@ -0,0 +1,112 @@
+"""
+Local OpenAI-compatible stub for load-testing the query path offline.
+
+Serves /v1/chat/completions and /v1/embeddings with canned answers and deterministic
+embeddings, after a simulated latency, and fails a configurable share of requests:
+
+    uvicorn llm_stub:app --port 8010
+    OPENAI_BASE_URL=http://localhost:8010/v1 OPENAI_API_KEY=stub uvicorn main:app
+
+LLM_STUB_LATENCY_MS        median chat latency (default 800)
+LLM_STUB_LATENCY_SIGMA     log-normal spread of the chat latency, for a realistic tail (default 0.5)
+LLM_STUB_EMBEDDING_MS      embedding latency (default 30)
+LLM_STUB_ERROR_RATE        share of requests answered with a 503 (default 0)
+LLM_STUB_EMBEDDING_DIM     embedding dimension (default EMBEDDING_DIM, else 1536)
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import random
+import time
+import uuid
+from typing import List, Union
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "800"))
+LLM_STUB_LATENCY_SIGMA = float(os.getenv("LLM_STUB_LATENCY_SIGMA", "0.5"))
+LLM_STUB_EMBEDDING_MS = float(os.getenv("LLM_STUB_EMBEDDING_MS", "30"))
+LLM_STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))
+LLM_STUB_EMBEDDING_DIM = int(os.getenv("LLM_STUB_EMBEDDING_DIM", os.getenv("EMBEDDING_DIM", "1536")))
+
+app = FastAPI(title="ClassGPT LLM stub", description="OpenAI-compatible stub for offline load tests.")
+
+
+class ChatRequest(BaseModel):
+    model: str
+    messages: List[dict]
+    max_tokens: int = 500
+
+
+class EmbeddingRequest(BaseModel):
+    model: str
+    input: Union[str, List[str]]
+    # The openai client asks for base64 unless told otherwise
+    encoding_format: str = "float"
+
+
+def _tokens(text: str) -> int:
+    # Roughly four characters per token, close enough for load tests
+    return max(1, len(text) // 4)
+
+
+def _unavailable():
+    return JSONResponse(
+        status_code=503,
+        content={"error": {"message": "Stubbed outage", "type": "server_error", "code": None}},
+    )
+
+
+def _embedding(text: str, encoding_format: str) -> Union[List[float], str]:
+    # Seeded by the text, so equal texts get equal vectors across requests and processes
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(LLM_STUB_EMBEDDING_DIM).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    if encoding_format == "base64":
+        return base64.b64encode(vector.tobytes()).decode()
+    return vector.tolist()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatRequest):
+    await asyncio.sleep(LLM_STUB_LATENCY_MS / 1000 * random.lognormvariate(0, LLM_STUB_LATENCY_SIGMA))
+    if random.random() < LLM_STUB_ERROR_RATE:
+        return _unavailable()
+    prompt_tokens = sum(_tokens(str(message.get("content", ""))) for message in request.messages)
+    answer = "This is a stubbed answer based on the provided course material."
+    completion_tokens = min(_tokens(answer), request.max_tokens)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: EmbeddingRequest):
+    await asyncio.sleep(LLM_STUB_EMBEDDING_MS / 1000)
+    if random.random() < LLM_STUB_ERROR_RATE:
+        return _unavailable()
+    texts = [request.input] if isinstance(request.input, str) else request.input
+    return {
+        "object": "list",
+        "model": request.model,
+        "data": [{"object": "embedding", "index": i, "embedding": _embedding(text, request.encoding_format)} for i, text in enumerate(texts)],
+        "usage": {"prompt_tokens": sum(map(_tokens, texts)), "total_tokens": sum(map(_tokens, texts))},
+    }
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
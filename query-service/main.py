@@ -1,16 +1,25 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from embedding_providers import get_embedding_provider
-from pinecone_utils import search_embeddings
-from typing import List, Optional
-from openai import OpenAI
+from shared.vector_store import tenant_namespace, VECTOR_STORE_LEGACY_FALLBACK
+from shared.embedding_index import get_active_index, get_pending_index, get_reembed_progress
+from shared.rate_limit import RateLimiter
+from shared.tracing import setup_tracing, get_tracer
+from typing import List, Optional, Tuple
+from dataclasses import asdict
+from llm_gateway import get_llm_gateway, LLMError, LLMUnavailable, LLMDeadlineExceeded
 import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import requests
 from fastapi import Depends
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from prometheus_client import make_asgi_app, CollectorRegistry, Histogram, multiprocess
+import rerank
+from sessions import ChatSession, ContextChunk, SESSION_TURNS, load_session, new_session, save_session, delete_session
 
 app = FastAPI(
     title="ClassGPT Query Service",
@@ -18,10 +27,71 @@ app = FastAPI(
     version="1.0.0",
 )
 
-# Rate limiting setup
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Rate limits per user, counted in Redis so they hold across replicas
+limiter = RateLimiter()
+
+# Prometheus metrics (rerank latency, prompt size, ...), summed over every worker under server.py
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    metrics_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(metrics_registry)
+    app.mount("/metrics", make_asgi_app(registry=metrics_registry))
+else:
+    app.mount("/metrics", make_asgi_app())
+
+# OpenTelemetry spans for requests, auth and LLM calls and each query stage (off unless OTEL_TRACES_EXPORTER is set)
+setup_tracing("query-service", app=app)
+tracer = get_tracer(__name__)
+
+LLM_PROMPT_TOKENS = Histogram(
+    "query_llm_prompt_tokens",
+    "Prompt tokens per LLM call",
+    ["rerank_mode"],
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000),
+)
+QUERY_STAGE_SECONDS = Histogram(
+    "query_stage_seconds",
+    "Time spent in each stage of a request",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20),
+)
+
+# Report each request's stage timings in a Server-Timing header (used by benchmarks/query_load.py)
+QUERY_SERVER_TIMING = os.getenv("QUERY_SERVER_TIMING", "false").lower() == "true"
+_stage_timings: ContextVar[Optional[dict]] = ContextVar("stage_timings", default=None)
+
+@contextmanager
+def timed_stage(name: str):
+    """Time and trace a stage of the current request, e.g. `with timed_stage("embed"): ...`"""
+    started = time.perf_counter()
+    try:
+        with tracer.start_as_current_span(f"query.{name}"):
+            yield
+    finally:
+        elapsed = time.perf_counter() - started
+        QUERY_STAGE_SECONDS.labels(name).observe(elapsed)
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+@app.middleware("http")
+async def record_stage_timings(request, call_next):
+    # The dict is shared with the endpoint's context, including its worker thread
+    timings = {}
+    token = _stage_timings.set(timings)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _stage_timings.reset(token)
+    if timings:
+        total = time.perf_counter() - started
+        # Everything outside the named stages: body parsing, waiting for a worker thread, routing
+        timings["other"] = max(total - sum(timings.values()), 0.0)
+        QUERY_STAGE_SECONDS.labels("other").observe(timings["other"])
+        if QUERY_SERVER_TIMING:
+            timings["total"] = total
+            response.headers["Server-Timing"] = ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
+    return response
 
 # Conservative limits for personal project ($5-10/month budget)
 MAX_QUERY_LENGTH = 500  # Max 500 characters per query
@@ -33,6 +103,7 @@ class QueryRequest(BaseModel):
     top_k: Optional[int] = 5
     class_id: Optional[str] = None
     document_id: Optional[str] = None
+    session_id: Optional[str] = None  # continue a chat; omitted or expired starts a new one
 
 class ChunkResult(BaseModel):
     content: str
@@ -40,11 +111,14 @@ class ChunkResult(BaseModel):
     chunk_index: int
     score: float
     page_number: int = -1
+    rerank_score: Optional[float] = None
     payload: dict
 
 class LLMResponse(BaseModel):
     answer: str
     chunks: List[ChunkResult]
+    session_id: str
+    reused_context: bool = False
 
 security = HTTPBearer()
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8002/me")
@@ -53,14 +127,30 @@ AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8002/me")
 async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)):
     headers = {"Authorization": f"Bearer {credentials.credentials}"}
     try:
-        resp = requests.get(AUTH_SERVICE_URL, headers=headers, timeout=5)
+        with timed_stage("auth"):
+            resp = requests.get(AUTH_SERVICE_URL, headers=headers, timeout=5)
         resp.raise_for_status()
         return resp.json()["id"]
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-@app.post("/query", response_model=LLMResponse)
-@limiter.limit("30/hour")  # Rate limit: 30 queries per hour per IP
+def preload_models():
+    """Load the models query-service runs locally. server.py calls this before forking its workers."""
+    index = get_active_index()
+    if index.provider == "local":
+        get_embedding_provider(index.provider, index.model)
+    rerank.warm_up()
+
+@app.on_event("startup")
+def init_vector_store():
+    """Connect to the vector store and create its collection/indexes before serving queries"""
+    get_active_index().store()
+    rerank.warm_up()
+    get_llm_gateway()
+
+@app.post("/query", response_model=LLMResponse, dependencies=[
+    limiter.limit("30/hour", scope="query", identity=get_current_user_id)  # 30 queries per hour per user
+])
 def query_chunks(request: QueryRequest, user_id: str = Depends(get_current_user_id)):
     # Validate query length
     if len(request.query) > MAX_QUERY_LENGTH:
@@ -69,6 +159,10 @@ def query_chunks(request: QueryRequest, user_id: str = Depends(get_current_user_
             detail=f"Query too long. Maximum {MAX_QUERY_LENGTH} characters allowed."
         )
     
+    # Vectors are partitioned per class, so a query is always scoped to one
+    if not request.class_id:
+        raise HTTPException(status_code=400, detail="class_id is required.")
+    
     # Validate top_k
     if request.top_k and request.top_k > MAX_TOP_K:
         raise HTTPException(
@@ -76,65 +170,153 @@ def query_chunks(request: QueryRequest, user_id: str = Depends(get_current_user_
             detail=f"top_k too high. Maximum {MAX_TOP_K} results allowed."
         )
     
-    embedding_provider = get_embedding_provider()
-    query_embedding = embedding_provider.embed([request.query])[0]
+    # Follow-ups in a chat session may be answered from the previous turn's chunks
+    with timed_stage("session"):
+        session = load_session(request.session_id) if request.session_id else None
+    if session is None or not session.matches(user_id, request.class_id, request.document_id):
+        session = new_session(user_id, request.class_id, request.document_id)
+
+    index = get_active_index()
+    retrieved = _reuse_context(index, session) if session.can_reuse_context(request.query) else None
+    reused_context = retrieved is not None
+    if not reused_context:
+        retrieved = _search_context(index, request, user_id)
+    results = [result for result, _ in retrieved]
+    context = [chunk for _, chunk in retrieved]
+    SESSION_TURNS.labels("reused" if reused_context else "searched").inc()
+    print(f"[DEBUG] Session {session.id}: {'reused' if reused_context else 'searched'} context, {len(session.turns)} earlier turns")
+
+    # LLM synthesis, with the stable part of the prompt first so it can be served from the provider's prompt cache
+    messages = session.messages([chunk.content for chunk in results], request.query)
+
+    try:
+        with timed_stage("llm"):
+            completion = get_llm_gateway().complete(
+                messages,
+                max_tokens=500,  # Limit response length to control costs
+                temperature=0.1
+            )
+    except LLMUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail="The assistant is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+    except LLMDeadlineExceeded:
+        raise HTTPException(status_code=504, detail="The assistant took too long to answer. Please try again.")
+    except LLMError as e:
+        print(f"[DEBUG] LLM error: {e}")
+        raise HTTPException(status_code=502, detail="The assistant could not answer. Please try again.")
+    if completion.prompt_tokens is not None:
+        LLM_PROMPT_TOKENS.labels(rerank.RERANK_MODE).observe(completion.prompt_tokens)
+    
+    session.record_turn(request.query, completion.text, context, [chunk.content for chunk in results])
+    with timed_stage("session"):
+        save_session(session)
+
+    # Encoded here rather than by FastAPI so the encoding is timed with the other stages
+    with timed_stage("serialize"):
+        return JSONResponse(jsonable_encoder(LLMResponse(
+            answer=completion.text,
+            chunks=results,
+            session_id=session.id,
+            reused_context=reused_context
+        )))
+
+def _chunk_result(payload: dict, score: float, rerank_score: Optional[float]) -> ChunkResult:
+    return ChunkResult(
+        content=payload.get("content", ""),
+        document_id=payload.get("document_id", ""),
+        chunk_index=payload.get("chunk_index", -1),
+        score=score,
+        page_number=payload.get("page_number", -1),
+        rerank_score=rerank_score,
+        payload=payload
+    )
+
+def _search_context(index, request: QueryRequest, user_id: str) -> List[Tuple[ChunkResult, ContextChunk]]:
+    """Embed the query, search the class's namespace and rerank the candidates."""
+    # The query must be embedded by the model that built the index it searches
+    embedding_provider = get_embedding_provider(index.provider, index.model)
+    with timed_stage("embed"):
+        query_embedding = embedding_provider.embed([request.query])[0]
     
-    # Filter by user_id and class_id or document_id
-    filter_metadata = {"user_id": user_id}
-    if request.class_id:
-        filter_metadata["class_id"] = request.class_id
-    elif request.document_id:
-        filter_metadata["document_id"] = request.document_id
+    # Search only this class's namespace, optionally narrowed to one document
+    namespace = tenant_namespace(user_id, request.class_id)
+    filter_metadata = {"document_id": request.document_id} if request.document_id else None
     
     print(f"[DEBUG] Query embedding shape: {len(query_embedding)}")
-    print(f"[DEBUG] Pinecone filter: {filter_metadata}")
+    print(f"[DEBUG] Vector store namespace: {namespace}, filter: {filter_metadata}")
     print(f"[DEBUG] Query: {request.query}")
 
-    hits = search_embeddings(query_embedding, top_k=request.top_k, filter_metadata=filter_metadata)
-    print(f"[DEBUG] Pinecone hits returned: {len(hits)}")
-    for i, hit in enumerate(hits):
-        print(f"[DEBUG] Hit {i+1}: id={hit['id']}, score={hit['score']}, payload_keys={list((hit['payload'] or {}).keys())}")
-
-    results = []
-    for hit in hits:
-        payload = hit["payload"] or {}
-        results.append(ChunkResult(
-            content=payload.get("content", ""),
-            document_id=payload.get("document_id", ""),
-            chunk_index=payload.get("chunk_index", -1),
-            score=hit["score"],
-            page_number=payload.get("page_number", -1),
-            payload=payload
-        ))
-    
-    # LLM synthesis
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    context = "\n\n".join([f"Chunk {i+1}: {chunk.content}" for i, chunk in enumerate(results)])
-    prompt = (
-        "You are a helpful assistant for course materials. "
-        "Use ONLY the following context to answer the user's question. "
-        "If the answer is not in the context, say you don't know.\n\n"
-        f"Context:\n{context}\n\n"
-        f"Question: {request.query}\n"
-        "Answer:"
-    )
-    
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500,  # Limit response length to control costs
-            temperature=0.1
+    # With reranking, recall a wide candidate set cheaply and send only the best few chunks to the LLM
+    if rerank.RERANK_MODE == "none":
+        candidates, context_chunks = request.top_k, request.top_k
+    else:
+        candidates, context_chunks = max(rerank.RERANK_CANDIDATES, request.top_k), min(request.top_k, rerank.RERANK_CONTEXT_CHUNKS)
+
+    vector_store = index.store()
+    with timed_stage("search"):
+        hits = vector_store.search(query_embedding, top_k=candidates, filter=filter_metadata, namespace=namespace)
+        hit_namespaces = {hit.id: namespace for hit in hits}
+        if VECTOR_STORE_LEGACY_FALLBACK:
+            # Vectors not yet migrated out of the shared default namespace
+            legacy_filter = {"user_id": user_id, "class_id": request.class_id, **(filter_metadata or {})}
+            seen = {(hit.metadata.get("document_id"), hit.metadata.get("chunk_index")) for hit in hits}
+            hits += [
+                hit for hit in vector_store.search(query_embedding, top_k=candidates, filter=legacy_filter)
+                if (hit.metadata.get("document_id"), hit.metadata.get("chunk_index")) not in seen
+            ]
+            hits = sorted(hits, key=lambda hit: hit.score, reverse=True)[:candidates]
+    print(f"[DEBUG] Vector store hits returned: {len(hits)}")
+
+    with timed_stage("rerank"):
+        ranked = rerank.rerank(request.query, hits, context_chunks)
+    for i, (hit, rerank_score) in enumerate(ranked):
+        print(f"[DEBUG] Hit {i+1}: id={hit.id}, score={hit.score}, rerank_score={rerank_score}, payload_keys={list(hit.metadata.keys())}")
+
+    return [
+        (
+            _chunk_result(hit.metadata, hit.score, rerank_score),
+            ContextChunk(id=hit.id, namespace=hit_namespaces.get(hit.id), score=hit.score, rerank_score=rerank_score),
         )
-        answer = response.choices[0].message.content
-    except Exception as e:
-        print(f"[DEBUG] OpenAI API error: {e}")
-        answer = "I'm sorry, I encountered an error while processing your question. Please try again."
-    
-    return LLMResponse(
-        answer=answer,
-        chunks=results
-    )
+        for hit, rerank_score in ranked
+    ]
+
+def _reuse_context(index, session: ChatSession) -> Optional[List[Tuple[ChunkResult, ContextChunk]]]:
+    """The previous turn's chunks, fetched by ID. None if any of them is gone, e.g. its document was deleted."""
+    vector_store = index.store()
+    records = {}
+    with timed_stage("search"):
+        for namespace in {chunk.namespace for chunk in session.context}:
+            ids = [chunk.id for chunk in session.context if chunk.namespace == namespace]
+            records.update(vector_store.fetch(ids, namespace=namespace))
+    if any(chunk.id not in records for chunk in session.context):
+        print(f"[DEBUG] Session {session.id}: previous context changed, searching again")
+        return None
+    return [
+        (_chunk_result(records[chunk.id].metadata, chunk.score, chunk.rerank_score), chunk)
+        for chunk in session.context
+    ]
+
+@app.delete("/sessions/{session_id}")
+def end_session(session_id: str, user_id: str = Depends(get_current_user_id)):
+    """Forget a chat session, e.g. when the user starts a new conversation."""
+    session = load_session(session_id)
+    if session is None or session.user_id != str(user_id):
+        raise HTTPException(status_code=404, detail="Session not found.")
+    delete_session(session_id)
+    return {"status": "deleted"}
+
+@app.get("/embedding-index")
+def embedding_index(user_id: str = Depends(get_current_user_id)):
+    """The active embedding index, and the progress and ETA of any re-embedding job. Signed-in users only."""
+    pending = get_pending_index()
+    return {
+        "active": asdict(get_active_index()),
+        "pending": asdict(pending) if pending else None,
+        "reembed": get_reembed_progress(),
+    }
 
 @app.get("/health")
 def health():
@@ -0,0 +1,104 @@
+"""
+Production server for query-service: several worker processes sharing one copy of the models.
+
+The master process imports the app and loads the local models (the active index's
+embedding model with its tokenizer, and the cross-encoder when RERANK_MODE uses it), then
+gunicorn forks QUERY_WORKERS uvicorn workers from it. The workers share the weights
+copy-on-write instead of each loading their own. Memory grows by each worker's private
+pages (activations, caches, the interpreter's own objects), not by another model.
+
+Each worker gets QUERY_TORCH_THREADS threads for torch and the BLAS libraries, by default
+the CPUs divided evenly between the workers, so they do not oversubscribe the CPUs together.
+The master never runs the models itself: a forked child cannot use an OpenMP thread pool
+its parent started.
+
+    python server.py
+
+QUERY_WORKERS            worker processes (default 2)
+QUERY_TORCH_THREADS      torch/BLAS threads per worker (default CPUs // QUERY_WORKERS; set it
+                         when a container's CPU quota is below the CPUs it can see)
+QUERY_WORKER_TIMEOUT     seconds a worker may stall before it is restarted (default 120)
+PORT                     (default 8000)
+
+Prometheus metrics are collected from every worker through PROMETHEUS_MULTIPROC_DIR.
+"""
+import gc
+import glob
+import importlib.util
+import os
+import sys
+import tempfile
+
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "2"))
+QUERY_TORCH_THREADS = int(os.getenv("QUERY_TORCH_THREADS") or 0) or max(1, len(os.sched_getaffinity(0)) // QUERY_WORKERS)
+QUERY_WORKER_TIMEOUT = int(os.getenv("QUERY_WORKER_TIMEOUT", "120"))
+PORT = int(os.getenv("PORT", "8000"))
+
+# Read once, when numpy, torch and the tokenizers load, so they must be set before any import of them
+for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(variable, str(QUERY_TORCH_THREADS))
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+# Likewise read when prometheus_client loads
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="query_service_metrics_"))
+
+from gunicorn.app.base import BaseApplication  # noqa: E402
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def post_fork(server, worker):
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(QUERY_TORCH_THREADS)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
+
+
+class QueryServer(BaseApplication):
+    """Gunicorn serving an app object the master process has already loaded."""
+
+    def __init__(self, app, options: dict):
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def run(app=None, host: str = "0.0.0.0", port: int = PORT):
+    """Load the app and its models in this process, then fork the workers and serve until stopped."""
+    # Metrics files left by an earlier run would be added to this one's
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+    if importlib.util.find_spec("torch") is not None:
+        import torch
+        # Single-threaded here, so the master starts no OpenMP thread pool before forking
+        torch.set_num_threads(1)
+    import main
+    main.preload_models()
+    # Objects loaded so far are never collected, so the collector does not write to (and
+    # thereby copy) every page holding them in each worker
+    gc.freeze()
+    print(f"[DEBUG] Serving on {host}:{port} with {QUERY_WORKERS} workers, {QUERY_TORCH_THREADS} torch threads each")
+    QueryServer(app or main.app, {
+        "bind": f"{host}:{port}",
+        "workers": QUERY_WORKERS,
+        "worker_class": "uvicorn_worker.UvicornWorker",
+        "preload_app": True,
+        "timeout": QUERY_WORKER_TIMEOUT,
+        "keepalive": 5,
+        # Heartbeat files in memory: a container's overlay filesystem can stall them
+        "worker_tmp_dir": "/dev/shm" if os.path.isdir("/dev/shm") else None,
+        "post_fork": post_fork,
+        "child_exit": child_exit,
+    }).run()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,166 @@
+"""
+Server-side chat sessions, so follow-up questions build on the previous turn.
+
+A session lives in Redis as one JSON value with a sliding TTL (CHAT_SESSION_TTL). It holds
+the IDs of the chunks the last answer was based on, the last few turns verbatim and a
+compact summary of older ones.
+
+A follow-up that is about the same material ("explain step 2 again", "why?") reuses those
+chunks: they are fetched by ID, with no query embedding, vector search or rerank. The
+prompt is laid out so every turn of a session starts with the same messages (fixed
+instructions, then the context chunks, then earlier turns in order). Reusing turns
+therefore share a growing prefix with the previous request, which provider-side prompt
+caching can serve.
+"""
+import json
+import os
+import re
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import redis
+from prometheus_client import Counter
+
+from shared.redis_client import get_redis
+
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", str(30 * 60)))  # seconds since the last turn
+CHAT_SESSION_MAX_TURNS = int(os.getenv("CHAT_SESSION_MAX_TURNS", "4"))  # turns kept verbatim
+CHAT_SESSION_SUMMARY_CHARS = int(os.getenv("CHAT_SESSION_SUMMARY_CHARS", "1500"))
+CHAT_SESSION_ANSWER_CHARS = int(os.getenv("CHAT_SESSION_ANSWER_CHARS", "1200"))  # per kept answer
+# Share of a follow-up's content words that must appear in the previous context to reuse it
+CHAT_SESSION_REUSE_OVERLAP = float(os.getenv("CHAT_SESSION_REUSE_OVERLAP", "0.6"))
+CHAT_SESSION_REUSE_MAX_WORDS = int(os.getenv("CHAT_SESSION_REUSE_MAX_WORDS", "25"))
+
+SESSION_TURNS = Counter("query_session_turns_total", "Chat turns by how their context was retrieved", ["retrieval"])
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant for course materials. "
+    "Use ONLY the context provided in this conversation to answer the user's questions. "
+    "If the answer is not in the context, say you don't know."
+)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+    a an and are as at be but by can could did do does for from had has have how i if in into is it its
+    me my no not of on or so than that the their them then there these they this those to was we were
+    what when where which who why will with would you your about again also more please just
+    explain elaborate clarify tell show give say said mean means meant step part one two three
+""".split())
+_FOLLOW_UP_RE = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|again|above|previous|earlier|step \d+|part \d+|"
+    r"more detail|elaborate|clarify|what about|and why|why|how so|example|simpler)\b"
+)
+
+
+@dataclass
+class ContextChunk:
+    id: str
+    namespace: Optional[str]
+    score: float
+    rerank_score: Optional[float] = None
+
+
+@dataclass
+class ChatSession:
+    id: str
+    user_id: str
+    class_id: str
+    document_id: Optional[str] = None
+    context: List[ContextChunk] = field(default_factory=list)
+    # Text of the context chunks, for judging follow-ups without a fetch
+    context_text: str = ""
+    turns: List[Dict[str, str]] = field(default_factory=list)
+    summary: str = ""
+
+    def matches(self, user_id: str, class_id: str, document_id: Optional[str]) -> bool:
+        return (self.user_id, self.class_id, self.document_id) == (str(user_id), str(class_id), document_id)
+
+    def can_reuse_context(self, query: str) -> bool:
+        """Whether the previous turn's chunks are likely enough to answer this follow-up."""
+        if not self.context or not self.turns:
+            return False
+        lowered = query.lower()
+        words = _WORD_RE.findall(lowered)
+        if len(words) > CHAT_SESSION_REUSE_MAX_WORDS:
+            return False
+        content_words = [word for word in words if word not in _STOPWORDS]
+        if not content_words:
+            # "explain that again", "why?": nothing new to search for
+            return True
+        context_words = set(_WORD_RE.findall(self.context_text.lower()))
+        overlap = sum(word in context_words for word in content_words) / len(content_words)
+        if _FOLLOW_UP_RE.search(lowered):
+            return overlap >= CHAT_SESSION_REUSE_OVERLAP / 2
+        return overlap >= CHAT_SESSION_REUSE_OVERLAP
+
+    def messages(self, context_chunks: List[str], query: str) -> List[Dict[str, str]]:
+        """Prompt messages, most stable first so consecutive turns share a prefix."""
+        context = "\n\n".join(f"Chunk {i + 1}: {chunk}" for i, chunk in enumerate(context_chunks))
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Context:\n{context}"},
+        ]
+        if self.summary:
+            messages.append({"role": "user", "content": f"Earlier in this conversation:\n{self.summary}"})
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn["question"]})
+            messages.append({"role": "assistant", "content": turn["answer"]})
+        messages.append({"role": "user", "content": query})
+        return messages
+
+    def record_turn(self, question: str, answer: str, context: List[ContextChunk], context_chunks: List[str]):
+        if [chunk.id for chunk in context] != [chunk.id for chunk in self.context]:
+            # New material: earlier turns were about other chunks, so they move into the summary
+            self._summarize(self.turns)
+            self.turns = []
+        self.context = context
+        self.context_text = "\n".join(context_chunks)
+        self.turns.append({"question": question, "answer": answer[:CHAT_SESSION_ANSWER_CHARS]})
+        if len(self.turns) > CHAT_SESSION_MAX_TURNS:
+            self._summarize(self.turns[:-CHAT_SESSION_MAX_TURNS])
+            self.turns = self.turns[-CHAT_SESSION_MAX_TURNS:]
+
+    def _summarize(self, turns: List[Dict[str, str]]):
+        # One line per turn (the question and the first sentence of the answer), oldest dropped first
+        lines = [line for line in self.summary.split("\n") if line]
+        for turn in turns:
+            first_sentence = re.split(r"(?<=[.!?])\s", turn["answer"].strip(), maxsplit=1)[0]
+            lines.append(f"- Q: {turn['question'][:200]} A: {first_sentence[:300]}")
+        while lines and len("\n".join(lines)) > CHAT_SESSION_SUMMARY_CHARS:
+            lines.pop(0)
+        self.summary = "\n".join(lines)
+
+
+def _key(session_id: str) -> str:
+    return f"chat_session:{session_id}"
+
+
+def new_session(user_id: str, class_id: str, document_id: Optional[str]) -> ChatSession:
+    return ChatSession(id=uuid.uuid4().hex, user_id=str(user_id), class_id=str(class_id), document_id=document_id)
+
+
+def load_session(session_id: str) -> Optional[ChatSession]:
+    """The session, or None if it expired, never existed or Redis is unavailable."""
+    try:
+        raw = get_redis().get(_key(session_id))
+    except redis.RedisError as e:
+        print(f"[DEBUG] Failed to load chat session {session_id}: {e}")
+        return None
+    if not raw:
+        return None
+    data = json.loads(raw)
+    data["context"] = [ContextChunk(**chunk) for chunk in data["context"]]
+    return ChatSession(**data)
+
+
+def save_session(session: ChatSession):
+    """Store the session and restart its TTL. Best effort: a Redis failure only loses the history."""
+    try:
+        get_redis().set(_key(session.id), json.dumps(asdict(session)), ex=CHAT_SESSION_TTL)
+    except redis.RedisError as e:
+        print(f"[DEBUG] Failed to save chat session {session.id}: {e}")
+
+
+def delete_session(session_id: str):
+    get_redis().delete(_key(session_id))
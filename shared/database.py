@@ -0,0 +1,136 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from prometheus_client import Histogram, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing is per process. Budget Postgres connections as
+# replicas * processes per replica * (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
+
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out of the pool",
+    ["engine"],
+)
+DB_POOL_SIZE_GAUGE = Gauge(
+    "db_pool_size_connections",
+    "Connections currently held by the pool, idle or checked out",
+    ["engine"],
+)
+
+
+class _TimedPoolMixin:
+    """Records how long each checkout waited for a connection."""
+
+    metrics_name = "default"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.labels(self.metrics_name).observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_kwargs():
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _register_pool_gauges(pool, name):
+    pool.metrics_name = name
+    DB_POOL_CHECKED_OUT.labels(name).set_function(pool.checkedout)
+    DB_POOL_SIZE_GAUGE.labels(name).set_function(pool.size)
+
+
+def to_async_url(database_url: str):
+    """
+    Converts a postgresql:// URL to postgresql+asyncpg:// and returns (url, connect_args).
+    asyncpg does not understand libpq's sslmode query parameter, so it is moved to connect_args.
+    """
+    parts = urlsplit(database_url)
+    scheme = parts.scheme.split("+")[0]
+    if scheme in ("postgres", "postgresql"):
+        scheme = "postgresql+asyncpg"
+    query = dict(parse_qsl(parts.query))
+    connect_args = {}
+    sslmode = query.pop("sslmode", None)
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = sslmode
+    return urlunsplit((scheme, parts.netloc, parts.path, urlencode(query), parts.fragment)), connect_args
+
+
+def create_db_engine(database_url: str, name: str):
+    """Creates a sync engine with explicit pool sizing, pre-ping and pool wait-time metrics."""
+    engine = create_engine(database_url, poolclass=TimedQueuePool, **_pool_kwargs())
+    _register_pool_gauges(engine.pool, name)
+    return engine
+
+
+def create_async_db_engine(database_url: str, name: str):
+    """Creates an asyncpg engine with explicit pool sizing, pre-ping and pool wait-time metrics."""
+    url, connect_args = to_async_url(database_url)
+    engine = create_async_engine(
+        url,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        connect_args=connect_args,
+        **_pool_kwargs(),
+    )
+    _register_pool_gauges(engine.sync_engine.pool, name)
+    return engine
+
+
+def create_async_session_factory(engine):
+    return async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+def create_session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@contextmanager
+def session_scope(session_factory):
+    """
+    One session for a whole unit of work (e.g. a Celery task).
+    Commits on success, rolls back on error, always closes.
+    """
+    db = session_factory()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
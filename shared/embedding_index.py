@@ -0,0 +1,149 @@
+"""
+Which embedding model and vector index the services use.
+
+The active index is what query-service searches and the worker writes. While a
+re-embedding job (embedding-worker/reembed.py) builds a new index it is registered as
+pending, and the worker writes every new document to both. When the job finishes,
+cutover() makes the pending index active in one Redis transaction, so the query
+embedding model and the index it searches always change together.
+
+Both are stored in Redis as JSON. Until an index has been activated, the active index
+is the one configured by EMBEDDING_PROVIDER / EMBEDDING_MODEL / EMBEDDING_DIM.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Tuple
+
+import redis
+
+from .redis_client import get_redis
+from .vector_store import EMBEDDING_DIM, VectorStore, get_vector_store
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
+DEFAULT_EMBEDDING_MODELS = {"openai": "text-embedding-ada-002", "local": "all-MiniLM-L6-v2"}
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODELS.get(EMBEDDING_PROVIDER)
+
+# How long a process trusts its copy of the active/pending indexes. A re-embedding job waits
+# this long after registering its index before reading chunks, so every worker dual-writes by then.
+EMBEDDING_INDEX_CACHE_TTL = float(os.getenv("EMBEDDING_INDEX_CACHE_TTL", "5"))
+
+ACTIVE_INDEX_KEY = "embedding_index:active"
+PENDING_INDEX_KEY = "embedding_index:pending"
+REEMBED_PROGRESS_KEY = "embedding_index:reembed"
+
+
+@dataclass(frozen=True)
+class EmbeddingIndex:
+    """An embedding model and the vector index holding its vectors."""
+
+    provider: str
+    model: str
+    dimension: int
+    # Pinecone index or Qdrant collection; None is the one configured in the environment
+    name: Optional[str] = None
+
+    def store(self) -> VectorStore:
+        return get_vector_store(self.name, self.dimension)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw) -> "EmbeddingIndex":
+        return cls(**json.loads(raw))
+
+
+DEFAULT_INDEX = EmbeddingIndex(provider=EMBEDDING_PROVIDER, model=EMBEDDING_MODEL, dimension=EMBEDDING_DIM)
+
+_cached: Optional[Tuple[EmbeddingIndex, Optional[EmbeddingIndex]]] = None
+_cached_at = 0.0
+_cache_lock = threading.Lock()
+
+
+def _load() -> Tuple[EmbeddingIndex, Optional[EmbeddingIndex]]:
+    global _cached, _cached_at
+    with _cache_lock:
+        if _cached is not None and time.monotonic() - _cached_at < EMBEDDING_INDEX_CACHE_TTL:
+            return _cached
+        try:
+            active, pending = get_redis().mget(ACTIVE_INDEX_KEY, PENDING_INDEX_KEY)
+            _cached = (
+                EmbeddingIndex.from_json(active) if active else DEFAULT_INDEX,
+                EmbeddingIndex.from_json(pending) if pending else None,
+            )
+        except redis.RedisError as e:
+            # Keep serving with what we last knew rather than failing every request
+            logger.warning(f"Failed to read embedding indexes, using the last known: {e}")
+            if _cached is None:
+                return DEFAULT_INDEX, None
+        _cached_at = time.monotonic()
+        return _cached
+
+
+def get_active_index() -> EmbeddingIndex:
+    """The index to search and write."""
+    return _load()[0]
+
+
+def get_pending_index() -> Optional[EmbeddingIndex]:
+    """The index a re-embedding job is building, if any."""
+    return _load()[1]
+
+
+def get_write_indexes() -> List[EmbeddingIndex]:
+    """Every index a new or deleted document must be written to: the active one and any pending one."""
+    active, pending = _load()
+    return [active] if pending is None or pending == active else [active, pending]
+
+
+def invalidate_cache():
+    global _cached
+    with _cache_lock:
+        _cached = None
+
+
+def set_pending_index(index: EmbeddingIndex):
+    get_redis().set(PENDING_INDEX_KEY, index.to_json())
+    invalidate_cache()
+
+
+def clear_pending_index():
+    get_redis().delete(PENDING_INDEX_KEY)
+    invalidate_cache()
+
+
+def cutover() -> EmbeddingIndex:
+    """Atomically make the pending index the active one. Returns the new active index."""
+    client = get_redis()
+    with client.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(PENDING_INDEX_KEY)
+                pending = pipe.get(PENDING_INDEX_KEY)
+                if not pending:
+                    raise ValueError("No pending embedding index to cut over to")
+                pipe.multi()
+                pipe.set(ACTIVE_INDEX_KEY, pending)
+                pipe.delete(PENDING_INDEX_KEY)
+                pipe.execute()
+                break
+            except redis.WatchError:
+                continue
+    invalidate_cache()
+    return EmbeddingIndex.from_json(pending)
+
+
+def get_reembed_progress() -> Optional[dict]:
+    """The state of the current or last re-embedding job, as written by embedding-worker/reembed.py."""
+    raw = get_redis().get(REEMBED_PROGRESS_KEY)
+    return json.loads(raw) if raw else None
+
+
+def set_reembed_progress(progress: dict):
+    get_redis().set(REEMBED_PROGRESS_KEY, json.dumps(progress))
@@ -0,0 +1,40 @@
+import json
+import logging
+import os
+
+import redis
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Each user has one Redis stream of document events. Stream entry IDs double as SSE event
+# IDs, so a reconnecting client replays everything after its Last-Event-ID.
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "1000"))
+EVENT_STREAM_TTL = int(os.getenv("EVENT_STREAM_TTL", str(24 * 60 * 60)))  # 1 day since the last event
+
+def event_stream_key(user_id) -> str:
+    return f"events:user:{user_id}"
+
+
+def publish_document_event(user_id, class_id, document_id, status, progress=None, message=None):
+    """
+    Append a document status/progress event to the user's event stream.
+    Best effort: a Redis failure is logged and never fails the caller.
+    """
+    event = {
+        "type": "document",
+        "class_id": str(class_id),
+        "document_id": str(document_id),
+        "status": status,
+        "progress": progress,
+        "message": message,
+    }
+    key = event_stream_key(user_id)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.xadd(key, {"data": json.dumps(event)}, maxlen=EVENT_STREAM_MAXLEN, approximate=True)
+        pipe.expire(key, EVENT_STREAM_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to publish event for document {document_id}: {e}")
@@ -0,0 +1,80 @@
+"""
+Text extracted from uploaded PDFs, stored once per distinct file so a document can be
+chunked and embedded again without downloading and parsing it.
+
+Rows of extracted_texts are keyed by the SHA-256 of the file's bytes and
+documents.content_hash points at them, so identical uploads share a row. The pages are
+stored as zlib-compressed JSON, [[page_number, text], ...], a fraction of the text's size.
+Each row records the extractor that produced it; text from another extractor is treated
+as missing and extracted again.
+"""
+import hashlib
+import json
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+Pages = List[Tuple[int, str]]
+
+_LOAD_QUERY = text("""
+    SELECT pages_zlib FROM extracted_texts
+    WHERE content_hash = :content_hash AND extractor = :extractor
+""")
+# A row from another extractor is replaced; one from the same extractor is already right
+_SAVE_QUERY = text("""
+    INSERT INTO extracted_texts (content_hash, extractor, page_count, text_bytes, pages_zlib)
+    VALUES (:content_hash, :extractor, :page_count, :text_bytes, :pages_zlib)
+    ON CONFLICT (content_hash) DO UPDATE SET
+        extractor = EXCLUDED.extractor,
+        page_count = EXCLUDED.page_count,
+        text_bytes = EXCLUDED.text_bytes,
+        pages_zlib = EXCLUDED.pages_zlib,
+        created_at = NOW()
+    WHERE extracted_texts.extractor <> EXCLUDED.extractor
+""")
+_DELETE_UNREFERENCED_QUERY = text("""
+    DELETE FROM extracted_texts t
+    WHERE t.content_hash = ANY(:content_hashes)
+      AND NOT EXISTS (SELECT 1 FROM documents d WHERE d.content_hash = t.content_hash)
+""")
+
+
+def content_hash(data: bytes) -> str:
+    """The key a file's extracted text is stored under."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def encode_pages(pages: Pages) -> bytes:
+    return zlib.compress(json.dumps(pages, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_pages(blob: bytes) -> Pages:
+    return [(page_number, page_text) for page_number, page_text in json.loads(zlib.decompress(blob))]
+
+
+def load_pages(db, content_hash: str, extractor: str) -> Optional[Pages]:
+    """The stored pages of a file, or None if it was not extracted (by this extractor) yet."""
+    blob = db.execute(_LOAD_QUERY, {"content_hash": content_hash, "extractor": extractor}).scalar()
+    return decode_pages(bytes(blob)) if blob is not None else None
+
+
+def save_pages(db, content_hash: str, extractor: str, pages: Pages) -> int:
+    """Store a file's pages as part of the caller's transaction. Returns the stored size in bytes."""
+    blob = encode_pages(pages)
+    db.execute(_SAVE_QUERY, {
+        "content_hash": content_hash,
+        "extractor": extractor,
+        "page_count": len(pages),
+        "text_bytes": sum(len(page_text.encode("utf-8")) for _, page_text in pages),
+        "pages_zlib": blob,
+    })
+    return len(blob)
+
+
+def delete_unreferenced(db, content_hashes: Iterable[Optional[str]]) -> int:
+    """After documents are deleted, delete the stored text of any of their files no other document has."""
+    content_hashes = sorted({content_hash for content_hash in content_hashes if content_hash})
+    if not content_hashes:
+        return 0
+    return db.execute(_DELETE_UNREFERENCED_QUERY, {"content_hashes": content_hashes}).rowcount
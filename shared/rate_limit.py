@@ -0,0 +1,190 @@
+"""
+Rate limits shared by every replica and process of a service, stored in Redis.
+
+Each limit is a sliding-window counter: a count for the current fixed window plus the
+previous window's count, weighted by how much of it the sliding window still covers. That
+is two integers per limit and caller, however many requests they make. One Lua script
+checks all of a route's limits and counts the request atomically, in a single round trip.
+
+Callers are identified by their user ID on authenticated routes and by client IP
+otherwise. Behind a reverse proxy, start uvicorn with --proxy-headers and set
+FORWARDED_ALLOW_IPS to the proxy's address so the client IP is the real one.
+
+    limiter = RateLimiter()
+
+    @app.post("/query", dependencies=[limiter.limit("30/hour", scope="query", identity=get_current_user_id)])
+
+If Redis is unavailable or slower than RATE_LIMIT_TIMEOUT_MS, requests are let through.
+"""
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import redis
+import redis.asyncio
+from fastapi import Depends, HTTPException, Request
+from prometheus_client import Counter, Histogram
+
+from .redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_TIMEOUT_MS = float(os.getenv("RATE_LIMIT_TIMEOUT_MS", "100"))
+RATE_LIMIT_PREFIX = "ratelimit"
+
+RATE_LIMIT_CHECK_SECONDS = Histogram(
+    "rate_limit_check_seconds",
+    "Time spent checking a request against its rate limits",
+    ["scope"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+RATE_LIMIT_REQUESTS = Counter(
+    "rate_limit_requests_total",
+    "Requests checked against rate limits, by outcome (allowed, limited or error)",
+    ["scope", "outcome"],
+)
+
+# KEYS[i] is limit i's hash, ARGV[2i-1] and ARGV[2i] its count and window in milliseconds.
+# Every limit is checked before any is counted, so a rejected request uses up none of them.
+# Returns {allowed, requests left under the tightest limit, milliseconds until allowed}.
+_SLIDING_WINDOW_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local buckets, currents, previouses = {}, {}, {}
+local remaining = -1
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[2 * i - 1])
+    local window = tonumber(ARGV[2 * i])
+    local bucket = math.floor(now / window)
+    local state = redis.call('HMGET', key, 'window', 'current', 'previous')
+    local stored = tonumber(state[1])
+    local current, previous = 0, 0
+    if stored == bucket then
+        current = tonumber(state[2]) or 0
+        previous = tonumber(state[3]) or 0
+    elseif stored == bucket - 1 then
+        previous = tonumber(state[2]) or 0
+    end
+    local elapsed = (now % window) / window
+    local used = previous * (1 - elapsed) + current
+    if used + 1 > limit then
+        local wait
+        if current + 1 > limit then
+            -- Not within this window: wait for the next one and for enough of this one to slide out
+            wait = (window - now % window) + math.max(0, 1 - (limit - 1) / current) * window
+        else
+            wait = (1 - (limit - 1 - current) / previous - elapsed) * window
+        end
+        retry_after = math.max(retry_after, math.max(1, math.ceil(wait)))
+    else
+        local left = math.floor(limit - 1 - used)
+        if remaining < 0 or left < remaining then
+            remaining = left
+        end
+    end
+    buckets[i], currents[i], previouses[i] = bucket, current, previous
+end
+if retry_after > 0 then
+    return {0, 0, retry_after}
+end
+for i, key in ipairs(KEYS) do
+    redis.call('HSET', key, 'window', buckets[i], 'current', currents[i] + 1, 'previous', previouses[i])
+    redis.call('PEXPIRE', key, 2 * tonumber(ARGV[2 * i]))
+end
+return {1, remaining, 0}
+"""
+
+_LIMIT_RE = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+_UNIT_SECONDS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+
+
+@dataclass(frozen=True)
+class Limit:
+    count: int
+    window_s: int
+
+    @classmethod
+    def parse(cls, spec: str) -> "Limit":
+        """A limit written as "30/hour", "5/minute" or "100/15minutes"."""
+        match = _LIMIT_RE.match(spec)
+        if not match:
+            raise ValueError(f"Invalid rate limit: {spec!r}")
+        count, multiple, unit = match.groups()
+        return cls(count=int(count), window_s=int(multiple or 1) * _UNIT_SECONDS[unit])
+
+    def __str__(self):
+        return f"{self.count} per {self.window_s} seconds"
+
+
+def client_key(request: Request) -> str:
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class RateLimitExceeded(HTTPException):
+    def __init__(self, limits: List[Limit], retry_after_s: int):
+        super().__init__(
+            status_code=429,
+            detail=f"Rate limit exceeded: {', '.join(str(limit) for limit in limits)}",
+            headers={"Retry-After": str(retry_after_s)},
+        )
+
+
+class RateLimiter:
+    """Builds FastAPI dependencies that enforce rate limits. Set `enabled` to False to turn them off."""
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED, client: Optional[redis.asyncio.Redis] = None):
+        self.enabled = enabled
+        self._client = client
+        self._script = None
+
+    def limit(self, *specs: str, scope: str, identity: Optional[Callable] = None):
+        """
+        A dependency allowing each caller at most every one of `specs` on the routes that use
+        it; routes sharing a scope share the budget. With `identity`, a dependency returning
+        the authenticated user's ID, callers are counted per user instead of per client IP.
+        """
+        limits = [Limit.parse(spec) for spec in specs]
+        if identity is None:
+            async def check_rate_limit(request: Request):
+                await self.check(scope, client_key(request), limits)
+        else:
+            async def check_rate_limit(request: Request, user_id=Depends(identity)):
+                await self.check(scope, f"user:{user_id}" if user_id else client_key(request), limits)
+        return Depends(check_rate_limit)
+
+    async def check(self, scope: str, key: str, limits: List[Limit]):
+        """Count one request by `key` against `limits`, raising RateLimitExceeded if it is over any."""
+        if not self.enabled:
+            return
+        started = time.perf_counter()
+        try:
+            allowed, _remaining, retry_after_ms = await asyncio.wait_for(
+                self.hit(scope, key, limits), RATE_LIMIT_TIMEOUT_MS / 1000
+            )
+        except (redis.RedisError, asyncio.TimeoutError) as e:
+            RATE_LIMIT_REQUESTS.labels(scope, "error").inc()
+            logger.warning(f"Rate limit check for {scope} failed, allowing the request: {e!r}")
+            return
+        finally:
+            RATE_LIMIT_CHECK_SECONDS.labels(scope).observe(time.perf_counter() - started)
+        if not allowed:
+            RATE_LIMIT_REQUESTS.labels(scope, "limited").inc()
+            raise RateLimitExceeded(limits, math.ceil(retry_after_ms / 1000))
+        RATE_LIMIT_REQUESTS.labels(scope, "allowed").inc()
+
+    async def hit(self, scope: str, key: str, limits: List[Limit]) -> Tuple[bool, int, int]:
+        """(allowed, requests left, milliseconds until allowed), counting the request if allowed."""
+        if self._script is None:
+            self._script = (self._client or get_async_redis()).register_script(_SLIDING_WINDOW_LUA)
+        # The hash tag keeps a caller's limits in one Redis Cluster slot, as a script needs
+        keys = [f"{RATE_LIMIT_PREFIX}:{{{scope}:{key}}}:{limit.count}/{limit.window_s}" for limit in limits]
+        args = [value for limit in limits for value in (limit.count, limit.window_s * 1000)]
+        allowed, remaining, retry_after_ms = await self._script(keys=keys, args=args)
+        return bool(allowed), int(remaining), int(retry_after_ms)
@@ -0,0 +1,32 @@
+import os
+import ssl
+
+import redis
+import redis.asyncio
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+
+_redis_client = None
+_async_redis_client = None
+
+
+def get_redis() -> redis.Redis:
+    """The process-wide synchronous Redis client, created on first use."""
+    global _redis_client
+    if _redis_client is None:
+        if ".upstash.io" in REDIS_URL:
+            _redis_client = redis.Redis.from_url(REDIS_URL, ssl_cert_reqs=ssl.CERT_NONE)
+        else:
+            _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """The process-wide asyncio Redis client, for use on the event loop."""
+    global _async_redis_client
+    if _async_redis_client is None:
+        if ".upstash.io" in REDIS_URL:
+            _async_redis_client = redis.asyncio.Redis.from_url(REDIS_URL, ssl_cert_reqs=ssl.CERT_NONE)
+        else:
+            _async_redis_client = redis.asyncio.Redis.from_url(REDIS_URL)
+    return _async_redis_client
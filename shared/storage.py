@@ -1,28 +1,182 @@
+import logging
 import os
-import boto3
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from botocore.exceptions import ClientError
 
+logger = logging.getLogger(__name__)
+
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET")
 AWS_S3_REGION = os.getenv("AWS_S3_REGION", "us-east-2")
 
-s3_client = boto3.client(
-    "s3",
-    region_name=AWS_S3_REGION,
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-)
+# Presigned upload URLs only need to live long enough for the browser to start the transfer
+PRESIGNED_UPLOAD_EXPIRES_IN = int(os.getenv("PRESIGNED_UPLOAD_EXPIRES_IN", "900"))  # 15 minutes
+
+# Files larger than one part go up as a multipart upload with parts sent concurrently.
+# 5MB is the smallest part size S3 accepts.
+S3_MULTIPART_CHUNK_SIZE = int(os.getenv("S3_MULTIPART_CHUNK_SIZE", str(5 * 1024 * 1024)))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+
+# DeleteObjects accepts at most 1000 keys per call
+S3_DELETE_BATCH_SIZE = 1000
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client():
+    """
+    The process-wide S3 client, created on first use. Importing boto3 and building a
+    client takes a few hundred milliseconds, so services do it in their startup hook
+    rather than when this module is imported.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                _s3_client = boto3.client(
+                    "s3",
+                    region_name=AWS_S3_REGION,
+                    aws_access_key_id=AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                )
+    return _s3_client
+
+def _transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_CHUNK_SIZE,
+        multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+        max_concurrency=S3_MAX_CONCURRENCY,
+        use_threads=True,
+    )
+
+def build_s3_key(user_id, class_id, document_id, filename):
+    """
+    Returns the object key for a document's file.
+    Files are stored under user_id/class_id/document_id/filename for isolation, so two
+    documents never share an object even when their filenames match.
+    """
+    return f"{user_id}/{class_id}/{document_id}/{filename}"
+
+def s3_url_for_key(key):
+    """Returns the public-style S3 URL stored on document rows for a key."""
+    return f"https://{AWS_S3_BUCKET}.s3.{AWS_S3_REGION}.amazonaws.com/{key}"
+
+def parse_s3_url(s3_url):
+    """
+    Splits an S3 URL stored on a document row into (bucket, key).
+    Returns None if the URL is not in the expected format.
+    """
+    match = re.match(r"https://([^.]+)\.s3\.[^.]+\.amazonaws\.com/(.+)", s3_url)
+    if not match:
+        return None
+    return match.group(1), match.group(2)
 
-def upload_file_to_s3(file_bytes, filename, user_id, class_id):
+def upload_file_to_s3(file_bytes, filename, user_id, class_id, document_id):
     """
     Uploads a file to S3 and returns the S3 URL.
-    The file will be stored under user_id/class_id/filename for isolation.
+    The file will be stored under user_id/class_id/document_id/filename for isolation.
+    """
+    key = build_s3_key(user_id, class_id, document_id, filename)
+    try:
+        get_s3_client().put_object(Bucket=AWS_S3_BUCKET, Key=key, Body=file_bytes)
+        return s3_url_for_key(key)
+    except ClientError as e:
+        raise RuntimeError(f"Failed to upload to S3: {e}")
+
+def upload_fileobj_to_s3(fileobj, filename, user_id, class_id, document_id):
+    """
+    Streams a file-like object (e.g. a spooled UploadFile) to S3 and returns the S3 URL.
+    The object is read part by part, so the whole file never has to sit in memory.
     """
-    key = f"{user_id}/{class_id}/{filename}"
+    key = build_s3_key(user_id, class_id, document_id, filename)
     try:
-        s3_client.put_object(Bucket=AWS_S3_BUCKET, Key=key, Body=file_bytes)
-        url = f"https://{AWS_S3_BUCKET}.s3.{AWS_S3_REGION}.amazonaws.com/{key}"
-        return url
+        fileobj.seek(0)
+        get_s3_client().upload_fileobj(fileobj, AWS_S3_BUCKET, key, Config=_transfer_config())
+        return s3_url_for_key(key)
     except ClientError as e:
-        raise RuntimeError(f"Failed to upload to S3: {e}") 
\ No newline at end of file
+        raise RuntimeError(f"Failed to upload to S3: {e}")
+
+def upload_fileobjs_to_s3(files, user_id, class_id):
+    """
+    Uploads several (fileobj, filename, document_id) triples in parallel and returns their S3 URLs
+    in the same order. Wall time is roughly that of the slowest file.
+    If any upload fails, the files that did upload are deleted before the error is raised.
+    """
+    if not files:
+        return []
+    with ThreadPoolExecutor(max_workers=len(files)) as pool:
+        futures = [
+            pool.submit(upload_fileobj_to_s3, fileobj, filename, user_id, class_id, document_id)
+            for fileobj, filename, document_id in files
+        ]
+        wait(futures)
+    errors = [future.exception() for future in futures if future.exception()]
+    if errors:
+        uploaded = [parse_s3_url(future.result())[1] for future in futures if not future.exception()]
+        try:
+            delete_s3_objects(uploaded)
+        except Exception as e:
+            logger.warning(f"Failed to clean up {len(uploaded)} S3 files after a failed upload: {e}")
+        raise errors[0]
+    return [future.result() for future in futures]
+
+def generate_presigned_upload(key, max_size, expires_in=PRESIGNED_UPLOAD_EXPIRES_IN):
+    """
+    Returns a presigned POST ({"url": ..., "fields": {...}}) that lets a client
+    upload one object directly to S3. S3 itself rejects bodies larger than max_size.
+    """
+    try:
+        return get_s3_client().generate_presigned_post(
+            Bucket=AWS_S3_BUCKET,
+            Key=key,
+            Conditions=[["content-length-range", 1, max_size]],
+            ExpiresIn=expires_in,
+        )
+    except ClientError as e:
+        raise RuntimeError(f"Failed to presign S3 upload: {e}")
+
+def get_s3_object_size(key):
+    """
+    Returns the size in bytes of an uploaded object, or None if it does not exist.
+    """
+    try:
+        response = get_s3_client().head_object(Bucket=AWS_S3_BUCKET, Key=key)
+        return response["ContentLength"]
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise RuntimeError(f"Failed to inspect S3 object: {e}")
+
+def delete_s3_object(key):
+    """Deletes a single object from the uploads bucket."""
+    try:
+        get_s3_client().delete_object(Bucket=AWS_S3_BUCKET, Key=key)
+    except ClientError as e:
+        raise RuntimeError(f"Failed to delete S3 object: {e}")
+
+def delete_s3_objects(keys, bucket=None):
+    """
+    Deletes many objects with DeleteObjects, S3_DELETE_BATCH_SIZE keys per call.
+    Returns the number of keys deleted. Keys that no longer exist count as deleted.
+    """
+    bucket = bucket or AWS_S3_BUCKET
+    deleted = 0
+    for start in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+        batch = keys[start:start + S3_DELETE_BATCH_SIZE]
+        try:
+            response = get_s3_client().delete_objects(
+                Bucket=bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+        except ClientError as e:
+            raise RuntimeError(f"Failed to delete S3 objects: {e}")
+        errors = response.get("Errors", [])
+        if errors:
+            raise RuntimeError(f"Failed to delete {len(errors)} S3 objects, first error: {errors[0]}")
+        deleted += len(batch)
+    return deleted
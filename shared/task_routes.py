@@ -0,0 +1,18 @@
+"""
+The queue each embedding-worker task is sent to. ingestion-service routes the tasks it
+sends with this table and the worker routes its scheduled ones with it, so a task's
+queue is decided in one place. Each worker consumes the queues of its profile, see
+embedding-worker/celery_config.py.
+"""
+EMBEDDING_QUEUE = "embedding_queue"
+DELETION_QUEUE = "deletion_queue"
+
+TASK_ROUTES = {
+    # Long and CPU-heavy: PDF extraction and, with a local model, embedding
+    "tasks.process_document": {"queue": EMBEDDING_QUEUE},
+    # Short and waiting on S3, the vector store and Postgres
+    "tasks.delete_class": {"queue": DELETION_QUEUE},
+    "tasks.delete_documents": {"queue": DELETION_QUEUE},
+    "tasks.reconcile_usage_counters": {"queue": DELETION_QUEUE},
+    "tasks.expire_stale_uploads": {"queue": DELETION_QUEUE},
+}
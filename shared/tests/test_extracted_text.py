@@ -0,0 +1,35 @@
+"""
+Tests for the stored form of extracted PDF text.
+
+    python -m pytest shared/tests -q
+"""
+from shared.extracted_text import content_hash, decode_pages, encode_pages
+
+
+def _pages(count):
+    return [
+        (page_number, f"Lecture {page_number}: gradient descent on a convex loss.\n" * 40)
+        for page_number in range(1, count + 1)
+    ]
+
+
+def test_pages_round_trip():
+    pages = _pages(5) + [(6, ""), (7, "   \n")]
+    assert decode_pages(encode_pages(pages)) == pages
+
+
+def test_round_trip_keeps_non_ascii_text():
+    pages = [(1, "∇f(x) = 0, λ ≥ 0 — Übung 3"), (2, "表 1\tdata set")]
+    assert decode_pages(encode_pages(pages)) == pages
+
+
+def test_stored_pages_are_smaller_than_the_text():
+    pages = _pages(20)
+    text_bytes = sum(len(page_text.encode("utf-8")) for _, page_text in pages)
+    assert len(encode_pages(pages)) < text_bytes / 4
+
+
+def test_content_hash_identifies_the_file():
+    assert content_hash(b"%PDF-1.7 one") == content_hash(b"%PDF-1.7 one")
+    assert content_hash(b"%PDF-1.7 one") != content_hash(b"%PDF-1.7 two")
+    assert len(content_hash(b"")) == 64
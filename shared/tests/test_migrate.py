@@ -0,0 +1,145 @@
+"""Tests for copying vectors between backends with shared.vector_store.migrate."""
+import random
+import uuid
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from shared.vector_store import VectorRecord
+from shared.vector_store.memory_store import InMemoryVectorStore
+from shared.vector_store.migrate import Checkpoint, migrate, payload_checksum
+
+DIMENSION = 16
+
+
+def _populate(store, rng, layout):
+    for namespace, size in layout.items():
+        store.upsert_batch(
+            [
+                VectorRecord(
+                    id=str(uuid.uuid4()),
+                    values=[rng.uniform(-1, 1) for _ in range(DIMENSION)],
+                    metadata={"namespace": namespace or "", "chunk_index": i},
+                )
+                for i in range(size)
+            ],
+            namespace=namespace,
+        )
+
+
+def _checkpoint(tmp_path):
+    return Checkpoint(str(tmp_path / "checkpoint.json"), "memory:source", "memory:target")
+
+
+def test_migrate_copies_and_verifies_every_namespace(tmp_path):
+    source, target = InMemoryVectorStore(DIMENSION), InMemoryVectorStore(DIMENSION)
+    _populate(source, random.Random(0), {None: 7, "u1.c1": 45, "u1.c2": 3})
+
+    reports = migrate(source, target, _checkpoint(tmp_path), parallelism=3, batch_size=10, sample_size=5, seed=0)
+
+    assert {report.namespace: report.copied for report in reports} == {None: 7, "u1.c1": 45, "u1.c2": 3}
+    assert all(report.ok and report.sampled == min(5, report.copied) for report in reports)
+    assert target.count(namespace="u1.c1") == 45
+
+
+def test_migrate_resumes_from_checkpoint(tmp_path):
+    source, target = InMemoryVectorStore(DIMENSION), InMemoryVectorStore(DIMENSION)
+    _populate(source, random.Random(1), {"a": 30, "b": 20})
+    calls = []
+    original_upsert = target.upsert_batch
+
+    def crash_on_fourth_page(records, batch_size=None, namespace=None):
+        calls.append(namespace)
+        if len(calls) == 4:
+            raise ConnectionError("target went away")
+        return original_upsert(records, batch_size, namespace)
+
+    target.upsert_batch = crash_on_fourth_page
+    with pytest.raises(ConnectionError):
+        migrate(source, target, _checkpoint(tmp_path), namespaces=["a", "b"], parallelism=1, batch_size=10)
+
+    checkpoint = _checkpoint(tmp_path)
+    assert checkpoint.namespace("a")["done"] and not checkpoint.namespace("b")["done"]
+    assert checkpoint.namespace("b")["copied"] == 0
+
+    def record_calls(records, batch_size=None, namespace=None):
+        calls.append(namespace)
+        return original_upsert(records, batch_size, namespace)
+
+    target.upsert_batch = record_calls
+    calls.clear()
+    reports = migrate(source, target, checkpoint, namespaces=["a", "b"], parallelism=1, batch_size=10)
+
+    assert calls == ["b", "b"]
+    assert [report.ok for report in reports] == [True, True]
+    assert target.count(namespace="b") == 20
+
+
+def test_resumed_migration_samples_only_written_pages(tmp_path):
+    source, target = InMemoryVectorStore(DIMENSION), InMemoryVectorStore(DIMENSION)
+    _populate(source, random.Random(4), {"a": 30})
+    first_page = source.scan(namespace="a", limit=10)
+    failing_id = source.scan(namespace="a", cursor=first_page.next_cursor, limit=10).records[0].id
+    original_upsert = target.upsert_batch
+
+    def crash_on_second_page(records, batch_size=None, namespace=None):
+        if records[0].id == failing_id:
+            raise ConnectionError("target went away")
+        return original_upsert(records, batch_size, namespace)
+
+    target.upsert_batch = crash_on_second_page
+    with pytest.raises(ConnectionError):
+        migrate(source, target, _checkpoint(tmp_path), parallelism=2, batch_size=10, sample_size=30)
+
+    progress = _checkpoint(tmp_path).namespace("a")
+    assert progress["copied"] == progress["seen"] == 10
+    assert set(progress["sample"]) <= {record.id for record in first_page.records}
+
+    target.upsert_batch = original_upsert
+    checkpoint = _checkpoint(tmp_path)
+    report = migrate(source, target, checkpoint, parallelism=2, batch_size=10, sample_size=30)[0]
+
+    assert checkpoint.namespace("a")["seen"] == 30
+    assert report.ok and report.sampled == 30
+
+
+def test_verification_catches_changed_records(tmp_path):
+    source, target = InMemoryVectorStore(DIMENSION), InMemoryVectorStore(DIMENSION)
+    _populate(source, random.Random(2), {"a": 10})
+    migrate(source, target, _checkpoint(tmp_path), sample_size=10)
+    record = source.scan(namespace="a", limit=1).records[0]
+    target.upsert_batch([VectorRecord(id=record.id, values=record.values, metadata={"changed": True})], namespace="a")
+
+    report = migrate(source, target, _checkpoint(tmp_path), sample_size=10)[0]
+
+    assert report.mismatched == [record.id]
+    assert not report.ok
+
+
+def test_checkpoint_rejects_other_migration(tmp_path):
+    checkpoint = _checkpoint(tmp_path)
+    checkpoint.save()
+
+    with pytest.raises(ValueError):
+        Checkpoint(checkpoint.path, "memory:source", "memory:elsewhere")
+
+
+def test_payload_checksum_ignores_integral_floats():
+    assert payload_checksum({"chunk_index": 3, "page": 1.0}) == payload_checksum({"page": 1, "chunk_index": 3.0})
+    assert payload_checksum({"page": 1.5}) != payload_checksum({"page": 1})
+
+
+def test_migrate_memory_to_qdrant(tmp_path):
+    pytest.importorskip("qdrant_client")
+    from qdrant_client import QdrantClient
+    from shared.vector_store.qdrant_store import QdrantVectorStore
+
+    source = InMemoryVectorStore(DIMENSION)
+    _populate(source, random.Random(3), {None: 5, "u1.c1": 25})
+    target = QdrantVectorStore(QdrantClient(location=":memory:"), "migrated", DIMENSION, upsert_parallelism=1)
+
+    reports = migrate(source, target, _checkpoint(tmp_path), parallelism=1, batch_size=10, sample_size=10)
+
+    assert [(report.namespace, report.copied, report.ok) for report in reports] == [(None, 5, True), ("u1.c1", 25, True)]
+    assert sorted(target.list_namespaces(), key=str) == [None, "u1.c1"]
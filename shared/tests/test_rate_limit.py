@@ -0,0 +1,147 @@
+"""
+Tests for the Redis sliding-window rate limiter.
+
+Runs against fakeredis (with lupa for Lua) unless REDIS_TEST_URL points at a running
+server, e.g. redis://localhost:6379/15. The server's keys are left to expire.
+
+    python -m pytest shared/tests -q
+"""
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+
+from shared.rate_limit import Limit, RateLimiter, RateLimitExceeded
+
+# Deliberately loose: a local round trip is well under this
+PERF_MAX_P95_CHECK_MS = float(os.getenv("RATE_LIMIT_PERF_MAX_P95_CHECK_MS", "5"))
+
+
+def _client():
+    url = os.getenv("REDIS_TEST_URL")
+    if url:
+        import redis.asyncio
+        return redis.asyncio.Redis.from_url(url)
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeAsyncRedis()
+
+
+@pytest.fixture
+def limiter():
+    return RateLimiter(enabled=True, client=_client())
+
+
+def _scope():
+    return f"test-{uuid.uuid4().hex}"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_parse_limits():
+    assert Limit.parse("30/hour") == Limit(30, 3600)
+    assert Limit.parse("5 / minute") == Limit(5, 60)
+    assert Limit.parse("100/15minutes") == Limit(100, 900)
+    with pytest.raises(ValueError):
+        Limit.parse("30 per hour")
+
+
+def test_allows_up_to_the_limit(limiter):
+    async def scenario():
+        scope, limits = _scope(), [Limit(3, 60)]
+        results = [await limiter.hit(scope, "user:a", limits) for _ in range(4)]
+        assert [allowed for allowed, _, _ in results] == [True, True, True, False]
+        assert [remaining for _, remaining, _ in results[:3]] == [2, 1, 0]
+        assert 0 < results[3][2] <= 2 * 60_000
+        # Other callers and scopes have their own budgets
+        assert (await limiter.hit(scope, "user:b", limits))[0]
+        assert (await limiter.hit(_scope(), "user:a", limits))[0]
+
+    run(scenario())
+
+
+def test_rejected_requests_use_up_no_limit(limiter):
+    async def scenario():
+        scope, limits = _scope(), [Limit(5, 60), Limit(2, 60)]
+        assert [(await limiter.hit(scope, "ip:1", limits))[0] for _ in range(4)] == [True, True, False, False]
+        # The 5/minute limit only counted the two allowed requests
+        allowed, remaining, _ = await limiter.hit(scope, "ip:1", [Limit(5, 60)])
+        assert allowed and remaining == 2
+
+    run(scenario())
+
+
+def test_allowed_again_after_retry_after(limiter):
+    async def scenario():
+        scope, limits = _scope(), [Limit(2, 1)]
+        await limiter.hit(scope, "user:a", limits)
+        await limiter.hit(scope, "user:a", limits)
+        allowed, _, retry_after_ms = await limiter.hit(scope, "user:a", limits)
+        assert not allowed and retry_after_ms <= 2000
+        await asyncio.sleep(retry_after_ms / 1000 + 0.01)
+        assert (await limiter.hit(scope, "user:a", limits))[0]
+
+    run(scenario())
+
+
+def test_check_raises_429_with_retry_after(limiter):
+    async def scenario():
+        scope, limits = _scope(), [Limit(1, 60)]
+        await limiter.check(scope, "user:a", limits)
+        with pytest.raises(RateLimitExceeded) as raised:
+            await limiter.check(scope, "user:a", limits)
+        assert raised.value.status_code == 429
+        # Until the previous window's request has slid out of the next window: up to two windows
+        assert 1 <= int(raised.value.headers["Retry-After"]) <= 120
+
+    run(scenario())
+
+
+def test_fails_open_without_redis():
+    import redis.asyncio
+    limiter = RateLimiter(enabled=True, client=redis.asyncio.Redis(port=1, socket_connect_timeout=0.05))
+    run(limiter.check(_scope(), "user:a", [Limit(1, 60)]))
+    run(limiter.check(_scope(), "user:a", [Limit(1, 60)]))
+
+
+def test_dependency_counts_per_user():
+    pytest.importorskip("httpx")
+    from fastapi import FastAPI, Header
+    from fastapi.testclient import TestClient
+
+    limiter = RateLimiter(enabled=True, client=_client())
+
+    def user_id(x_user: str = Header(...)):
+        return x_user
+
+    app = FastAPI()
+    scope = _scope()
+
+    @app.get("/limited", dependencies=[limiter.limit("2/minute", scope=scope, identity=user_id)])
+    def limited():
+        return {"ok": True}
+
+    client = TestClient(app)
+    statuses = [client.get("/limited", headers={"X-User": "a"}).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    assert client.get("/limited", headers={"X-User": "b"}).status_code == 200
+
+
+def test_check_latency(limiter):
+    async def scenario():
+        scope, limits = _scope(), [Limit(1_000_000, 3600), Limit(1_000_000, 60)]
+        await limiter.check(scope, "user:a", limits)
+        timings = []
+        for _ in range(200):
+            started = time.perf_counter()
+            await limiter.check(scope, "user:a", limits)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        p95_ms = timings[int(len(timings) * 0.95)] * 1000
+        assert p95_ms < PERF_MAX_P95_CHECK_MS, f"p95 check took {p95_ms:.2f} ms"
+
+    run(scenario())
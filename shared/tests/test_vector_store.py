@@ -0,0 +1,282 @@
+"""
+Conformance and performance tests every VectorStore backend must pass.
+
+Runs against the in-memory backend and Qdrant. Qdrant uses the client's local
+mode unless QDRANT_TEST_URL points at a running server, e.g. http://localhost:6333.
+The latency test depends on the machine, so it only runs with VECTOR_STORE_PERF_TESTS=1.
+
+    python -m pytest shared/tests -q
+    VECTOR_STORE_PERF_TESTS=1 python -m pytest shared/tests -q -s -k latency
+"""
+import os
+import random
+import time
+import uuid
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from shared.vector_store import VectorRecord, chunk_vector_id
+
+DIMENSION = 32
+PERF_TESTS = os.getenv("VECTOR_STORE_PERF_TESTS") == "1"
+PERF_RECORDS = int(os.getenv("VECTOR_STORE_PERF_RECORDS", "5000"))
+PERF_QUERIES = int(os.getenv("VECTOR_STORE_PERF_QUERIES", "200"))
+# Deliberately loose: catches pathological regressions, not machine-to-machine noise
+PERF_MAX_P95_SEARCH_MS = float(os.getenv("VECTOR_STORE_PERF_MAX_P95_SEARCH_MS", "250"))
+
+
+def _memory_store():
+    from shared.vector_store.memory_store import InMemoryVectorStore
+    return InMemoryVectorStore(DIMENSION, initial_capacity=4)
+
+
+def _qdrant_store():
+    pytest.importorskip("qdrant_client")
+    from qdrant_client import QdrantClient
+    from shared.vector_store.qdrant_store import QdrantVectorStore
+    url = os.getenv("QDRANT_TEST_URL")
+    client = QdrantClient(url=url) if url else QdrantClient(location=":memory:")
+    collection = f"conformance_{uuid.uuid4().hex}"
+    # Local mode is not thread-safe, so only a server gets concurrent batch uploads
+    store = QdrantVectorStore(client, collection, DIMENSION, upsert_parallelism=4 if url else 1)
+    store.cleanup = lambda: client.delete_collection(collection)
+    return store
+
+
+BACKENDS = {
+    "memory": _memory_store,
+    "qdrant": _qdrant_store,
+}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def store(request):
+    store = BACKENDS[request.param]()
+    yield store
+    cleanup = getattr(store, "cleanup", None)
+    if cleanup:
+        cleanup()
+
+
+def _vector(rng, dimension=DIMENSION):
+    return [rng.uniform(-1, 1) for _ in range(dimension)]
+
+
+def _record(rng, **metadata):
+    return VectorRecord(id=str(uuid.uuid4()), values=_vector(rng), metadata=metadata)
+
+
+def test_upsert_and_count(store):
+    rng = random.Random(0)
+    records = [_record(rng, class_id="a" if i % 2 else "b", chunk_index=i) for i in range(25)]
+
+    assert store.upsert_batch(records, batch_size=10) == 25
+    assert store.count() == 25
+    assert store.count({"class_id": "a"}) == 12
+    assert store.count({"class_id": {"$in": ["a", "b"]}}) == 25
+
+
+def test_upsert_replaces_existing_id(store):
+    rng = random.Random(1)
+    record = _record(rng, content="old")
+    store.upsert_batch([record])
+    store.upsert_batch([VectorRecord(id=record.id, values=record.values, metadata={"content": "new"})])
+
+    assert store.count() == 1
+    hits = store.search(record.values, top_k=1)
+    assert hits[0].id == record.id
+    assert hits[0].metadata["content"] == "new"
+
+
+def test_search_orders_by_cosine_similarity(store):
+    query = [1.0] + [0.0] * (DIMENSION - 1)
+    closest = VectorRecord(id=str(uuid.uuid4()), values=[2.0] + [0.0] * (DIMENSION - 1), metadata={"rank": 1})
+    middle = VectorRecord(id=str(uuid.uuid4()), values=[1.0, 1.0] + [0.0] * (DIMENSION - 2), metadata={"rank": 2})
+    farthest = VectorRecord(id=str(uuid.uuid4()), values=[-1.0] + [0.0] * (DIMENSION - 1), metadata={"rank": 3})
+    store.upsert_batch([farthest, closest, middle])
+
+    hits = store.search(query, top_k=3)
+
+    assert [hit.id for hit in hits] == [closest.id, middle.id, farthest.id]
+    assert hits[0].score == pytest.approx(1.0, abs=1e-5)
+    assert hits[1].score == pytest.approx(2 ** -0.5, abs=1e-5)
+    assert hits[2].score == pytest.approx(-1.0, abs=1e-5)
+
+
+def test_search_respects_top_k_and_filter(store):
+    rng = random.Random(2)
+    records = [_record(rng, user_id="u1", class_id=f"c{i % 3}") for i in range(30)]
+    store.upsert_batch(records)
+
+    hits = store.search(_vector(rng), top_k=4, filter={"user_id": "u1", "class_id": "c1"})
+
+    assert len(hits) == 4
+    assert all(hit.metadata["class_id"] == "c1" for hit in hits)
+    assert store.search(_vector(rng), top_k=4, filter={"user_id": "someone-else"}) == []
+
+
+def test_search_returns_metadata(store):
+    rng = random.Random(3)
+    record = _record(rng, document_id="d1", chunk_index=7, content="hello", page_number=2)
+    store.upsert_batch([record])
+
+    hit = store.search(record.values, top_k=1)[0]
+
+    assert hit.metadata == {"document_id": "d1", "chunk_index": 7, "content": "hello", "page_number": 2}
+
+
+def test_delete_by_ids(store):
+    rng = random.Random(4)
+    records = [_record(rng) for _ in range(10)]
+    store.upsert_batch(records)
+
+    store.delete_by_ids([records[0].id, records[5].id, str(uuid.uuid4())])
+
+    assert store.count() == 8
+    remaining = {hit.id for hit in store.search(_vector(rng), top_k=10)}
+    assert records[0].id not in remaining and records[5].id not in remaining
+
+
+def test_delete_by_filter(store):
+    rng = random.Random(5)
+    records = [_record(rng, document_id=f"d{i % 4}") for i in range(20)]
+    store.upsert_batch(records)
+
+    store.delete_by_filter({"document_id": {"$in": ["d0", "d2"]}})
+
+    assert store.count() == 10
+    assert store.count({"document_id": "d0"}) == 0
+    assert store.count({"document_id": "d1"}) == 5
+
+
+def test_delete_by_filter_rejects_empty_filter(store):
+    rng = random.Random(6)
+    store.upsert_batch([_record(rng)])
+
+    with pytest.raises(ValueError):
+        store.delete_by_filter({})
+    assert store.count() == 1
+
+
+def test_unsupported_filter_operator(store):
+    with pytest.raises(ValueError):
+        store.count({"chunk_index": {"$gt": 3}})
+
+
+def test_namespaces_are_isolated(store):
+    rng = random.Random(8)
+    shared_vector = _vector(rng)
+    store.upsert_batch([VectorRecord(id=str(uuid.uuid4()), values=shared_vector, metadata={"tenant": "a"})], namespace="a")
+    store.upsert_batch([_record(rng, tenant="b") for _ in range(3)], namespace="b")
+    store.upsert_batch([_record(rng, tenant="default")])
+
+    assert store.count(namespace="a") == 1
+    assert store.count(namespace="b") == 3
+    assert store.count() == 1
+    assert store.count(namespace="missing") == 0
+    assert [hit.metadata for hit in store.search(shared_vector, top_k=5, namespace="a")] == [{"tenant": "a"}]
+    assert {hit.metadata["tenant"] for hit in store.search(shared_vector, top_k=5, namespace="b")} == {"b"}
+    assert store.search(shared_vector, top_k=5, namespace="missing") == []
+
+
+def test_delete_namespace(store):
+    rng = random.Random(9)
+    kept = _record(rng)
+    store.upsert_batch([_record(rng) for _ in range(5)], namespace="dropped")
+    store.upsert_batch([kept], namespace="kept")
+
+    store.delete_namespace("dropped")
+    store.delete_namespace("never-written")
+
+    assert store.count(namespace="dropped") == 0
+    assert store.count(namespace="kept") == 1
+    store.delete_by_ids([kept.id])
+    assert store.count(namespace="kept") == 1
+    store.delete_by_ids([kept.id], namespace="kept")
+    assert store.count(namespace="kept") == 0
+
+
+def test_scan_pages_through_namespace(store):
+    rng = random.Random(10)
+    records = {record.id: record for record in (_record(rng, chunk_index=i) for i in range(23))}
+    store.upsert_batch(list(records.values()), namespace="scanned")
+    store.upsert_batch([_record(rng)], namespace="other")
+
+    seen, cursor, pages = {}, None, 0
+    while True:
+        page = store.scan(namespace="scanned", cursor=cursor, limit=10)
+        pages += 1
+        seen.update((record.id, record) for record in page.records)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert set(seen) == set(records)
+    for record_id, record in seen.items():
+        assert record.metadata == records[record_id].metadata
+        assert len(record.values) == DIMENSION
+    assert store.scan(namespace="missing").records == []
+
+
+def test_fetch(store):
+    rng = random.Random(11)
+    records = [_record(rng, chunk_index=i) for i in range(5)]
+    store.upsert_batch(records, namespace="fetched")
+
+    fetched = store.fetch([records[1].id, records[3].id, str(uuid.uuid4())], namespace="fetched")
+
+    assert set(fetched) == {records[1].id, records[3].id}
+    assert fetched[records[3].id].metadata == {"chunk_index": 3}
+    assert store.fetch([records[1].id]) == {}
+    assert store.fetch([], namespace="fetched") == {}
+
+
+def test_list_namespaces(store):
+    rng = random.Random(12)
+    assert store.list_namespaces() == []
+
+    store.upsert_batch([_record(rng)], namespace="a")
+    store.upsert_batch([_record(rng) for _ in range(2)], namespace="b")
+    assert sorted(store.list_namespaces()) == ["a", "b"]
+
+    store.upsert_batch([_record(rng)])
+    store.delete_namespace("a")
+    assert set(store.list_namespaces()) == {None, "b"}
+
+
+def test_chunk_vector_id_is_stable_uuid():
+    document_id = str(uuid.uuid4())
+
+    assert chunk_vector_id(document_id, 3) == chunk_vector_id(document_id, 3)
+    assert chunk_vector_id(document_id, 3) != chunk_vector_id(document_id, 4)
+    assert uuid.UUID(chunk_vector_id(document_id, 0))  # Qdrant only accepts UUID or integer IDs
+
+
+@pytest.mark.skipif(not PERF_TESTS, reason="set VECTOR_STORE_PERF_TESTS=1 to measure latency")
+def test_search_latency(store):
+    rng = random.Random(7)
+    records = [_record(rng, class_id=f"c{i % 10}") for i in range(PERF_RECORDS)]
+
+    started = time.perf_counter()
+    store.upsert_batch(records)
+    upsert_seconds = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(PERF_QUERIES):
+        query = _vector(rng)
+        started = time.perf_counter()
+        store.search(query, top_k=5, filter={"class_id": "c3"})
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+
+    print(
+        f"\n{type(store).__name__}: upserted {PERF_RECORDS} in {upsert_seconds:.2f}s "
+        f"({PERF_RECORDS / upsert_seconds:.0f}/s), search p50={p50:.2f}ms p95={p95:.2f}ms"
+    )
+    assert store.count() == PERF_RECORDS
+    assert p95 < PERF_MAX_P95_SEARCH_MS
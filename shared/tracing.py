@@ -0,0 +1,125 @@
+"""
+OpenTelemetry tracing for every service.
+
+setup_tracing() installs a tracer provider and instruments the libraries a service uses:
+FastAPI, SQLAlchemy, Celery, botocore (S3), requests, httpx and Redis. Outgoing HTTP calls
+and Celery messages carry the W3C trace context, so one trace follows an upload from
+ingestion-service through process_document to the vector upsert, and a query through
+auth-service and the LLM.
+
+OTEL_TRACES_EXPORTER picks where spans go:
+- "none" (default): tracing is off and nothing is instrumented
+- "otlp": OTLP over HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (e.g. http://jaeger:4318)
+- "console": printed to stdout
+- "file": one JSON span per line appended to OTEL_TRACES_FILE
+
+The standard OTEL_* variables (OTEL_SERVICE_NAME, OTEL_TRACES_SAMPLER, ...) apply as usual.
+Each service lists the instrumentation packages for its libraries in its requirements.
+Code adds its own spans with get_tracer(__name__).start_as_current_span(...), which are
+no-ops while tracing is off.
+"""
+import importlib
+import importlib.util
+import logging
+import os
+from typing import Iterable, Optional
+
+from opentelemetry import trace
+
+logger = logging.getLogger(__name__)
+
+OTEL_TRACES_EXPORTER = os.getenv("OTEL_TRACES_EXPORTER", "none").lower()
+OTEL_TRACES_FILE = os.getenv("OTEL_TRACES_FILE", "traces.jsonl")
+
+# Client libraries traced in every service that has them and their instrumentation installed
+_LIBRARY_INSTRUMENTORS = (
+    ("botocore", "opentelemetry.instrumentation.botocore", "BotocoreInstrumentor"),
+    ("httpx", "opentelemetry.instrumentation.httpx", "HTTPXClientInstrumentor"),
+    # Newer openai releases send their requests with httpx2
+    ("httpx2", "opentelemetry.instrumentation.httpx", "HTTPX2ClientInstrumentor"),
+    ("redis", "opentelemetry.instrumentation.redis", "RedisInstrumentor"),
+    ("requests", "opentelemetry.instrumentation.requests", "RequestsInstrumentor"),
+)
+
+_configured = False
+
+
+def tracing_enabled() -> bool:
+    return OTEL_TRACES_EXPORTER != "none"
+
+
+def _exporter():
+    if OTEL_TRACES_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+    if OTEL_TRACES_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    if OTEL_TRACES_EXPORTER == "file":
+        return ConsoleSpanExporter(
+            out=open(OTEL_TRACES_FILE, "a", buffering=1),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    raise ValueError(f"Unknown OTEL_TRACES_EXPORTER: {OTEL_TRACES_EXPORTER}")
+
+
+def setup_tracing(service_name: str, app=None, engines: Iterable = (), celery: bool = False) -> bool:
+    """
+    Start exporting spans and instrument the process's libraries, plus the given FastAPI
+    app and SQLAlchemy engines (sync or async). Celery workers must call this after the
+    fork, from worker_process_init, and shutdown_tracing() from worker_process_shutdown.
+    Returns False, doing nothing, while tracing is off.
+    """
+    global _configured
+    if not tracing_enabled():
+        return False
+    if not _configured:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)}))
+        provider.add_span_processor(BatchSpanProcessor(_exporter()))
+        trace.set_tracer_provider(provider)
+        for library, module, instrumentor in _LIBRARY_INSTRUMENTORS:
+            if importlib.util.find_spec(library) is None:
+                continue
+            try:
+                getattr(importlib.import_module(module), instrumentor)().instrument()
+            except (ImportError, AttributeError):
+                logger.info(f"{library} calls are not traced: {module} is not installed")
+        _configured = True
+        logger.info(f"Tracing {service_name} with the {OTEL_TRACES_EXPORTER} exporter")
+
+    if app is not None:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        FastAPIInstrumentor.instrument_app(app, excluded_urls="health,metrics")
+        # uvicorn ends with the default SIGTERM handler, which skips the SDK's atexit flush
+        app.router.add_event_handler("shutdown", shutdown_tracing)
+    engines = [getattr(engine, "sync_engine", engine) for engine in engines]
+    if engines:
+        from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+        SQLAlchemyInstrumentor().instrument(engines=engines)
+    if celery:
+        from opentelemetry.instrumentation.celery import CeleryInstrumentor
+        instrumentor = CeleryInstrumentor()
+        if not instrumentor.is_instrumented_by_opentelemetry:
+            instrumentor.instrument()
+    return True
+
+
+def shutdown_tracing():
+    """Export the spans still buffered. Call before the process exits."""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+def get_tracer(name: str) -> trace.Tracer:
+    return trace.get_tracer(name)
+
+
+def current_trace_id() -> Optional[str]:
+    """The current trace's ID as hex, for correlating logs with traces; None outside a trace."""
+    context = trace.get_current_span().get_span_context()
+    return format(context.trace_id, "032x") if context.is_valid else None
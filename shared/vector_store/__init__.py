@@ -0,0 +1,104 @@
+"""
+One vector store interface for the worker and the query service.
+
+Backends import their client libraries lazily, so a service only needs the
+package for the backend it is configured with (VECTOR_STORE_BACKEND).
+"""
+import os
+import threading
+import uuid
+from typing import Dict, Optional, Tuple
+
+from .base import ScanPage, SearchHit, VectorRecord, VectorStore, normalize_filter
+
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone")  # "pinecone", "qdrant" or "memory"
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1536"))
+
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "classgpt-chunks")
+
+QDRANT_URL = os.getenv("QDRANT_URL") or os.getenv("VECTOR_STORE_URL", "http://vector-store:6333")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "classgpt_chunks")
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "true").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_UPSERT_PARALLELISM = int(os.getenv("QDRANT_UPSERT_PARALLELISM", "4"))
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "true").lower() == "true"  # int8 scalar quantization
+
+# Vectors live in one namespace per (user, class). Vectors written before namespaces existed
+# sit in the default namespace; while migrate_to_namespaces.py copies them out, set this so
+# searches and deletes also cover the default namespace.
+VECTOR_STORE_LEGACY_FALLBACK = os.getenv("VECTOR_STORE_LEGACY_FALLBACK", "false").lower() == "true"
+
+# Chunk vector IDs are derived from (document_id, chunk_index), so writing a chunk twice,
+# e.g. by a re-embedding job and a dual-writing worker, replaces rather than duplicates it
+CHUNK_ID_NAMESPACE = uuid.UUID("5b0c3f38-1f0e-4d4b-9a51-6f1f0f3a2c7e")
+
+_stores: Dict[Tuple[Optional[str], int], VectorStore] = {}
+_store_lock = threading.Lock()
+
+
+def tenant_namespace(user_id, class_id) -> str:
+    """The namespace holding one class's vectors."""
+    return f"{user_id}.{class_id}"
+
+
+def chunk_vector_id(document_id, chunk_index) -> str:
+    """The vector ID of one document chunk, the same in every index."""
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{document_id}:{chunk_index}"))
+
+
+def create_vector_store(
+    backend: str = VECTOR_STORE_BACKEND,
+    dimension: int = EMBEDDING_DIM,
+    name: Optional[str] = None,
+) -> VectorStore:
+    """
+    Build a new store for the backend from the environment configuration. `name` is the
+    Pinecone index or Qdrant collection, PINECONE_INDEX_NAME / QDRANT_COLLECTION by default.
+    """
+    if backend == "pinecone":
+        from .pinecone_store import PineconeVectorStore
+        return PineconeVectorStore(PINECONE_API_KEY, name or PINECONE_INDEX_NAME, dimension, region=PINECONE_ENVIRONMENT)
+    if backend == "qdrant":
+        from .qdrant_store import QdrantVectorStore
+        return QdrantVectorStore.from_url(
+            QDRANT_URL,
+            QDRANT_API_KEY,
+            name or QDRANT_COLLECTION,
+            dimension,
+            prefer_grpc=QDRANT_PREFER_GRPC,
+            grpc_port=QDRANT_GRPC_PORT,
+            upsert_parallelism=QDRANT_UPSERT_PARALLELISM,
+            quantization=QDRANT_QUANTIZATION,
+        )
+    if backend == "memory":
+        from .memory_store import InMemoryVectorStore
+        return InMemoryVectorStore(dimension)
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def get_vector_store(name: Optional[str] = None, dimension: int = EMBEDDING_DIM) -> VectorStore:
+    """The process-wide store for an index, created on first use (after any worker fork)."""
+    key = (name, dimension)
+    store = _stores.get(key)
+    if store is None:
+        with _store_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = _stores[key] = create_vector_store(dimension=dimension, name=name)
+    return store
+
+
+__all__ = [
+    "ScanPage",
+    "SearchHit",
+    "VectorRecord",
+    "VectorStore",
+    "normalize_filter",
+    "tenant_namespace",
+    "chunk_vector_id",
+    "create_vector_store",
+    "get_vector_store",
+]
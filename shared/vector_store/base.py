@@ -0,0 +1,132 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+@dataclass
+class VectorRecord:
+    id: str
+    values: Sequence[float]
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class SearchHit:
+    id: str
+    score: float
+    metadata: Dict[str, Any]
+
+
+@dataclass
+class ScanPage:
+    records: List[VectorRecord]
+    # Pass back to scan() for the next page; None once the namespace is exhausted
+    next_cursor: Optional[str]
+
+
+def normalize_filter(filter: Optional[Dict]) -> Dict[str, List[Any]]:
+    """
+    Turns a metadata filter into {field: [accepted values]}; all fields must match.
+
+    Supported forms are the subset every backend can express:
+    {"field": value}, {"field": {"$eq": value}} and {"field": {"$in": [values]}}.
+    """
+    normalized = {}
+    for key, condition in (filter or {}).items():
+        if isinstance(condition, dict):
+            if set(condition) == {"$eq"}:
+                normalized[key] = [condition["$eq"]]
+            elif set(condition) == {"$in"}:
+                normalized[key] = list(condition["$in"])
+            else:
+                raise ValueError(f"Unsupported filter condition for '{key}': {condition}")
+        else:
+            normalized[key] = [condition]
+    return normalized
+
+
+class VectorStore(ABC):
+    """
+    A vector index keyed by string IDs, with flat metadata stored next to each vector.
+
+    Records live in namespaces: separate partitions that are searched, counted and deleted
+    independently. namespace=None is the default namespace. Searching a small namespace
+    only touches that tenant's vectors, and dropping one is a single call.
+
+    Implementations hold their client/index handle for the life of the process, so create
+    one per process (see get_vector_store) rather than one per call.
+    """
+
+    batch_size = 100
+
+    def upsert_batch(
+        self,
+        records: Iterable[VectorRecord],
+        batch_size: Optional[int] = None,
+        namespace: Optional[str] = None,
+    ) -> int:
+        """Insert or replace records, sent in batches. Returns the number of records written."""
+        batch_size = batch_size or self.batch_size
+        batch = []
+        written = 0
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self._upsert(batch, namespace)
+                written += len(batch)
+                batch = []
+        if batch:
+            self._upsert(batch, namespace)
+            written += len(batch)
+        return written
+
+    @abstractmethod
+    def _upsert(self, records: List[VectorRecord], namespace: Optional[str]):
+        """Write one batch of records."""
+
+    @abstractmethod
+    def search(
+        self,
+        vector: Sequence[float],
+        top_k: int = 5,
+        filter: Optional[Dict] = None,
+        namespace: Optional[str] = None,
+    ) -> List[SearchHit]:
+        """Most similar records first, by cosine similarity."""
+
+    @abstractmethod
+    def delete_by_ids(self, ids: Iterable[str], namespace: Optional[str] = None):
+        """Delete records by ID. Unknown IDs are ignored."""
+
+    def delete_by_filter(self, filter: Dict, namespace: Optional[str] = None):
+        """Delete every record whose metadata matches the filter. An empty filter is rejected."""
+        if not normalize_filter(filter):
+            raise ValueError("delete_by_filter requires a non-empty filter")
+        self._delete_by_filter(filter, namespace)
+
+    @abstractmethod
+    def _delete_by_filter(self, filter: Dict, namespace: Optional[str]):
+        """Delete every record matching a non-empty filter."""
+
+    @abstractmethod
+    def delete_namespace(self, namespace: str):
+        """Delete every record in a namespace. Deleting an empty namespace is a no-op."""
+
+    @abstractmethod
+    def count(self, filter: Optional[Dict] = None, namespace: Optional[str] = None) -> int:
+        """Number of records in the namespace, optionally only those matching the filter."""
+
+    @abstractmethod
+    def list_namespaces(self) -> List[Optional[str]]:
+        """Every namespace holding at least one record; None stands for the default namespace."""
+
+    @abstractmethod
+    def scan(self, namespace: Optional[str] = None, cursor: Optional[str] = None, limit: int = 100) -> ScanPage:
+        """
+        One page of a namespace's records, vectors included, in a stable order.
+        Records written during a scan may or may not be returned.
+        """
+
+    @abstractmethod
+    def fetch(self, ids: Iterable[str], namespace: Optional[str] = None) -> Dict[str, VectorRecord]:
+        """The records with these IDs, vectors included. Missing IDs are left out."""
@@ -0,0 +1,185 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .base import ScanPage, SearchHit, VectorRecord, VectorStore, normalize_filter
+
+
+class _Partition:
+    """The vectors of one namespace, L2-normalised in one contiguous matrix."""
+
+    def __init__(self, dimension: int, initial_capacity: int):
+        self.dimension = dimension
+        self.matrix = np.zeros((initial_capacity, dimension), dtype=np.float32)
+        self.size = 0
+        self.ids: List[str] = []
+        self.metadata: List[Dict] = []
+        self.rows: Dict[str, int] = {}
+
+    def _grow(self, needed: int):
+        capacity = len(self.matrix)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((capacity, self.dimension), dtype=np.float32)
+        grown[:self.size] = self.matrix[:self.size]
+        self.matrix = grown
+
+    def upsert(self, records: List[VectorRecord], vectors: List[np.ndarray]):
+        self._grow(self.size + len(records))
+        for record, vector in zip(records, vectors):
+            row = self.rows.get(record.id)
+            if row is None:
+                row = self.size
+                self.size += 1
+                self.rows[record.id] = row
+                self.ids.append(record.id)
+                self.metadata.append(dict(record.metadata))
+            else:
+                self.metadata[row] = dict(record.metadata)
+            self.matrix[row] = vector
+
+    def matching_rows(self, filter: Optional[Dict]) -> np.ndarray:
+        conditions = normalize_filter(filter)
+        if not conditions:
+            return np.arange(self.size)
+        return np.fromiter(
+            (
+                row for row, metadata in enumerate(self.metadata)
+                if all(metadata.get(key) in accepted for key, accepted in conditions.items())
+            ),
+            dtype=np.int64,
+        )
+
+    def delete_row(self, row: int):
+        # Move the last row into the hole so the live rows stay contiguous
+        last = self.size - 1
+        deleted_id = self.ids[row]
+        if row != last:
+            moved_id = self.ids[last]
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = moved_id
+            self.metadata[row] = self.metadata[last]
+            self.rows[moved_id] = row
+        self.ids.pop()
+        self.metadata.pop()
+        del self.rows[deleted_id]
+        self.size = last
+
+
+class InMemoryVectorStore(VectorStore):
+    """
+    NumPy-backed store for tests, local development and benchmarks.
+
+    Each namespace keeps its vectors L2-normalised in one contiguous matrix, so a search is a
+    single matrix-vector product over the namespace's rows that pass the filter.
+    """
+
+    def __init__(self, dimension: int, initial_capacity: int = 1024):
+        self.dimension = dimension
+        self.initial_capacity = initial_capacity
+        self._partitions: Dict[Optional[str], _Partition] = {}
+        self._lock = threading.Lock()
+
+    def _normalize(self, values: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(values, dtype=np.float32)
+        if vector.shape != (self.dimension,):
+            raise ValueError(f"Expected a vector of dimension {self.dimension}, got {vector.shape}")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _upsert(self, records: List[VectorRecord], namespace: Optional[str]):
+        vectors = [self._normalize(record.values) for record in records]
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                partition = self._partitions[namespace] = _Partition(self.dimension, self.initial_capacity)
+            partition.upsert(records, vectors)
+
+    def search(
+        self,
+        vector: Sequence[float],
+        top_k: int = 5,
+        filter: Optional[Dict] = None,
+        namespace: Optional[str] = None,
+    ) -> List[SearchHit]:
+        query = self._normalize(vector)
+        normalize_filter(filter)  # reject unsupported filters even for an empty namespace
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None or top_k <= 0:
+                return []
+            rows = partition.matching_rows(filter)
+            if not len(rows):
+                return []
+            scores = partition.matrix[rows] @ query
+            k = min(top_k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                SearchHit(id=partition.ids[rows[i]], score=float(scores[i]), metadata=dict(partition.metadata[rows[i]]))
+                for i in top
+            ]
+
+    def delete_by_ids(self, ids: Iterable[str], namespace: Optional[str] = None):
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return
+            for record_id in ids:
+                row = partition.rows.get(record_id)
+                if row is not None:
+                    partition.delete_row(row)
+
+    def _delete_by_filter(self, filter: Dict, namespace: Optional[str]):
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return
+            # Highest rows first, so moving the last row never moves one still to be deleted
+            for row in sorted(partition.matching_rows(filter), reverse=True):
+                partition.delete_row(int(row))
+
+    def delete_namespace(self, namespace: str):
+        with self._lock:
+            self._partitions.pop(namespace, None)
+
+    def count(self, filter: Optional[Dict] = None, namespace: Optional[str] = None) -> int:
+        normalize_filter(filter)  # reject unsupported filters even for an empty namespace
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            return len(partition.matching_rows(filter)) if partition else 0
+
+    def list_namespaces(self) -> List[Optional[str]]:
+        with self._lock:
+            return [namespace for namespace, partition in self._partitions.items() if partition.size]
+
+    def _record(self, partition: _Partition, row: int) -> VectorRecord:
+        return VectorRecord(
+            id=partition.ids[row],
+            values=partition.matrix[row].tolist(),
+            metadata=dict(partition.metadata[row]),
+        )
+
+    def scan(self, namespace: Optional[str] = None, cursor: Optional[str] = None, limit: int = 100) -> ScanPage:
+        # Pages are in ID order and the cursor is the last ID returned
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return ScanPage(records=[], next_cursor=None)
+            ids = sorted(record_id for record_id in partition.ids if cursor is None or record_id > cursor)
+            page = ids[:limit]
+            records = [self._record(partition, partition.rows[record_id]) for record_id in page]
+            return ScanPage(records=records, next_cursor=page[-1] if len(ids) > limit else None)
+
+    def fetch(self, ids: Iterable[str], namespace: Optional[str] = None) -> Dict[str, VectorRecord]:
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return {}
+            return {
+                record_id: self._record(partition, partition.rows[record_id])
+                for record_id in ids if record_id in partition.rows
+            }
@@ -0,0 +1,301 @@
+"""
+Copy every vector, payload and namespace from one vector store to another without
+re-embedding, e.g. to move production from Pinecone to Qdrant.
+
+    python -m shared.vector_store.migrate --source pinecone:classgpt-chunks \\
+        --target qdrant:http://vector-store:6333#classgpt_chunks --max-rate 2000
+
+Stores are given as:
+
+    pinecone:<index>                  PINECONE_API_KEY / PINECONE_ENVIRONMENT from the environment
+    qdrant:<url>#<collection>         QDRANT_API_KEY from the environment
+    local:<path>#<collection>         embedded on-disk Qdrant, for development and dry runs
+
+Each namespace is read page by page while up to --parallelism pages are written to the
+target at once. The checkpoint records, per namespace, the cursor of the last page whose
+write finished along with every page before it, so a crashed or interrupted run picks up
+where it stopped when started again with the same arguments. Records are upserted under
+their original IDs, so pages written again after a resume are harmless.
+
+Once a namespace is copied its source and target counts are compared, and a random
+sample of its records is fetched from both sides and compared by payload checksum and
+vector. Vectors are compared after L2 normalisation and within a tolerance, since Qdrant
+stores cosine vectors normalised and Pinecone as float32. Stop writers to the source
+first, or the counts of namespaces still being written will differ.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from . import EMBEDDING_DIM, PINECONE_API_KEY, PINECONE_ENVIRONMENT, QDRANT_API_KEY, QDRANT_GRPC_PORT, QDRANT_PREFER_GRPC
+from .base import VectorRecord, VectorStore
+
+logger = logging.getLogger(__name__)
+
+VECTOR_TOLERANCE = 1e-4
+
+
+def open_store(spec: str, dimension: int) -> VectorStore:
+    """Build a store from a pinecone:, qdrant: or local: spec (see the module docstring)."""
+    kind, _, location = spec.partition(":")
+    if kind == "pinecone" and location:
+        from .pinecone_store import PineconeVectorStore
+        return PineconeVectorStore(PINECONE_API_KEY, location, dimension, region=PINECONE_ENVIRONMENT)
+    if kind in ("qdrant", "local") and "#" in location:
+        from qdrant_client import QdrantClient
+        from .qdrant_store import QdrantVectorStore
+        path, _, collection = location.rpartition("#")
+        if kind == "local":
+            # Embedded mode is not thread-safe, so batches go one at a time
+            return QdrantVectorStore(QdrantClient(path=path), collection, dimension, upsert_parallelism=1)
+        return QdrantVectorStore.from_url(
+            path, QDRANT_API_KEY, collection, dimension, prefer_grpc=QDRANT_PREFER_GRPC, grpc_port=QDRANT_GRPC_PORT
+        )
+    raise ValueError(f"Invalid store spec {spec!r}: expected pinecone:<index>, qdrant:<url>#<collection> or local:<path>#<collection>")
+
+
+def payload_checksum(metadata: Dict) -> str:
+    """Checksum of a payload that ignores key order and Pinecone turning integers into floats."""
+    canonical = {
+        key: int(value) if isinstance(value, float) and value.is_integer() else value
+        for key, value in metadata.items()
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _unit(values) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in values))
+    return [v / norm for v in values] if norm else list(values)
+
+
+def records_match(source: VectorRecord, target: VectorRecord) -> bool:
+    if payload_checksum(source.metadata) != payload_checksum(target.metadata):
+        return False
+    if len(source.values) != len(target.values):
+        return False
+    return all(abs(a - b) <= VECTOR_TOLERANCE for a, b in zip(_unit(source.values), _unit(target.values)))
+
+
+class RateLimiter:
+    """Paces callers to an average of `rate` units per second; no limit when rate is falsy."""
+
+    def __init__(self, rate: Optional[float]):
+        self.rate = rate
+        self._started = time.monotonic()
+        self._units = 0
+
+    def acquire(self, units: int):
+        if not self.rate:
+            return
+        self._units += units
+        delay = self._started + self._units / self.rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Checkpoint:
+    """Per-namespace progress, saved atomically as JSON after every completed page."""
+
+    def __init__(self, path: str, source: str, target: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {"source": source, "target": target, "namespaces": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if (saved["source"], saved["target"]) != (source, target):
+                raise ValueError(
+                    f"{path} belongs to a migration from {saved['source']} to {saved['target']}; "
+                    "pass another --checkpoint or delete it"
+                )
+            self.state = saved
+
+    def namespace(self, namespace: Optional[str]) -> Dict:
+        # JSON has no None keys; "" is the default namespace, as in Pinecone
+        return self.state["namespaces"].setdefault(
+            namespace or "", {"cursor": None, "done": False, "copied": 0, "seen": 0, "sample": []}
+        )
+
+    def save(self):
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.path)
+
+
+@dataclass
+class NamespaceReport:
+    namespace: Optional[str]
+    copied: int
+    source_count: int
+    target_count: int
+    sampled: int
+    mismatched: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.source_count == self.target_count and not self.mismatched
+
+
+def _sample(progress: Dict, records: List[VectorRecord], sample_size: int, rng: random.Random):
+    # Reservoir sampling, so every record of the namespace is equally likely to be checked
+    sample = progress["sample"]
+    for record in records:
+        progress["seen"] += 1
+        if len(sample) < sample_size:
+            sample.append(record.id)
+        else:
+            slot = rng.randrange(progress["seen"])
+            if slot < sample_size:
+                sample[slot] = record.id
+
+
+def copy_namespace(
+    source: VectorStore,
+    target: VectorStore,
+    namespace: Optional[str],
+    checkpoint: Checkpoint,
+    executor: ThreadPoolExecutor,
+    parallelism: int,
+    batch_size: int,
+    limiter: RateLimiter,
+    sample_size: int,
+    rng: random.Random,
+):
+    progress = checkpoint.namespace(namespace)
+    if progress["done"]:
+        return
+    in_flight = deque()
+
+    def complete_oldest():
+        # Only the oldest page advances the checkpoint, so every page before its cursor is written.
+        # It is sampled only now, so the sample never holds records a crash kept from the target.
+        future, next_cursor, records = in_flight.popleft()
+        future.result()
+        _sample(progress, records, sample_size, rng)
+        progress["cursor"] = next_cursor
+        progress["copied"] += len(records)
+        checkpoint.save()
+
+    cursor = progress["cursor"]
+    while True:
+        page = source.scan(namespace=namespace, cursor=cursor, limit=batch_size)
+        if page.records:
+            limiter.acquire(len(page.records))
+            future = executor.submit(target.upsert_batch, page.records, namespace=namespace)
+            in_flight.append((future, page.next_cursor, page.records))
+            if len(in_flight) >= parallelism:
+                complete_oldest()
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    while in_flight:
+        complete_oldest()
+    progress["done"] = True
+    checkpoint.save()
+
+
+def verify_namespace(source: VectorStore, target: VectorStore, namespace: Optional[str], progress: Dict) -> NamespaceReport:
+    sample = progress["sample"]
+    source_records = source.fetch(sample, namespace=namespace)
+    target_records = target.fetch(sample, namespace=namespace)
+    mismatched = [
+        record_id for record_id, record in source_records.items()
+        if record_id not in target_records or not records_match(record, target_records[record_id])
+    ]
+    return NamespaceReport(
+        namespace=namespace,
+        copied=progress["copied"],
+        source_count=source.count(namespace=namespace),
+        target_count=target.count(namespace=namespace),
+        sampled=len(source_records),
+        mismatched=mismatched,
+    )
+
+
+def migrate(
+    source: VectorStore,
+    target: VectorStore,
+    checkpoint: Checkpoint,
+    namespaces: Optional[List[Optional[str]]] = None,
+    parallelism: int = 4,
+    batch_size: int = 100,
+    max_rate: Optional[float] = None,
+    sample_size: int = 100,
+    seed: Optional[int] = None,
+) -> List[NamespaceReport]:
+    """Copy the namespaces (all of the source's by default) and verify each one."""
+    if namespaces is None:
+        namespaces = source.list_namespaces()
+    limiter = RateLimiter(max_rate)
+    rng = random.Random(seed)
+    reports = []
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        for namespace in namespaces:
+            copy_namespace(
+                source, target, namespace, checkpoint, executor, parallelism, batch_size, limiter, sample_size, rng
+            )
+            report = verify_namespace(source, target, namespace, checkpoint.namespace(namespace))
+            logger.info(
+                "namespace %r: copied %d, source %d, target %d, %d/%d sampled records match",
+                namespace, report.copied, report.source_count, report.target_count,
+                report.sampled - len(report.mismatched), report.sampled,
+            )
+            reports.append(report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True)
+    parser.add_argument("--target", required=True)
+    parser.add_argument("--namespace", action="append", help="only copy this namespace (repeatable; '' is the default namespace)")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--parallelism", type=int, default=4, help="pages written to the target at once")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--max-rate", type=float, help="vectors per second, to spare the production stores")
+    parser.add_argument("--sample-size", type=int, default=100, help="records per namespace to compare")
+    parser.add_argument("--checkpoint", default="vector_migration_checkpoint.json")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    source = open_store(args.source, args.dim)
+    target = open_store(args.target, args.dim)
+    namespaces = [namespace or None for namespace in args.namespace] if args.namespace else None
+    started = time.monotonic()
+    reports = migrate(
+        source,
+        target,
+        Checkpoint(args.checkpoint, args.source, args.target),
+        namespaces=namespaces,
+        parallelism=args.parallelism,
+        batch_size=args.batch_size,
+        max_rate=args.max_rate,
+        sample_size=args.sample_size,
+    )
+    failed = [report for report in reports if not report.ok]
+    logger.info(
+        "%d namespaces, %d vectors in %.0fs, %d failed verification",
+        len(reports), sum(report.copied for report in reports), time.monotonic() - started, len(failed),
+    )
+    for report in failed:
+        logger.error(
+            "namespace %r: source %d, target %d, mismatched IDs %s",
+            report.namespace, report.source_count, report.target_count, report.mismatched[:10],
+        )
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from .base import ScanPage, SearchHit, VectorRecord, VectorStore, normalize_filter
+
+logger = logging.getLogger(__name__)
+
+
+def _pinecone_filter(filter: Optional[Dict]) -> Optional[Dict]:
+    conditions = normalize_filter(filter)
+    if not conditions:
+        return None
+    return {
+        key: {"$eq": accepted[0]} if len(accepted) == 1 else {"$in": accepted}
+        for key, accepted in conditions.items()
+    }
+
+
+class PineconeVectorStore(VectorStore):
+    """Pinecone index. The index is created if missing and its handle is reused for every call."""
+
+    # Pinecone recommends upserting in batches of 100
+    batch_size = 100
+    delete_batch_size = 1000
+
+    def __init__(self, api_key: str, index_name: str, dimension: int, region: str = "us-east-1", client=None):
+        if client is None:
+            if not api_key:
+                raise ValueError("Pinecone credentials not configured")
+            from pinecone import Pinecone
+            client = Pinecone(api_key=api_key)
+        self.client = client
+        self.index_name = index_name
+        self.dimension = dimension
+        self._ensure_index(region)
+        self.index = client.Index(index_name)
+
+    def _ensure_index(self, region: str):
+        if self.index_name in self.client.list_indexes().names():
+            return
+        from pinecone import ServerlessSpec
+        logger.info(f"Creating Pinecone index '{self.index_name}'")
+        self.client.create_index(
+            name=self.index_name,
+            dimension=self.dimension,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=region),
+        )
+
+    def _upsert(self, records: List[VectorRecord], namespace: Optional[str]):
+        self.index.upsert(
+            vectors=[
+                {"id": record.id, "values": list(record.values), "metadata": record.metadata}
+                for record in records
+            ],
+            namespace=namespace or "",
+        )
+
+    def search(
+        self,
+        vector: Sequence[float],
+        top_k: int = 5,
+        filter: Optional[Dict] = None,
+        namespace: Optional[str] = None,
+    ) -> List[SearchHit]:
+        query = {"vector": list(vector), "top_k": top_k, "include_metadata": True, "namespace": namespace or ""}
+        pinecone_filter = _pinecone_filter(filter)
+        if pinecone_filter:
+            query["filter"] = pinecone_filter
+        results = self.index.query(**query)
+        return [
+            SearchHit(id=match.id, score=match.score, metadata=dict(match.metadata or {}))
+            for match in results.matches
+        ]
+
+    def delete_by_ids(self, ids: Iterable[str], namespace: Optional[str] = None):
+        ids = list(ids)
+        for i in range(0, len(ids), self.delete_batch_size):
+            self.index.delete(ids=ids[i:i + self.delete_batch_size], namespace=namespace or "")
+
+    def _delete_by_filter(self, filter: Dict, namespace: Optional[str]):
+        self.index.delete(filter=_pinecone_filter(filter), namespace=namespace or "")
+
+    def delete_namespace(self, namespace: str):
+        try:
+            self.index.delete(delete_all=True, namespace=namespace)
+        except Exception as e:
+            # Deleting a namespace that was never written to is a 404
+            if getattr(e, "status", None) != 404:
+                raise
+
+    def count(self, filter: Optional[Dict] = None, namespace: Optional[str] = None) -> int:
+        pinecone_filter = _pinecone_filter(filter)
+        if pinecone_filter:
+            stats = self.index.describe_index_stats(filter=pinecone_filter)
+        else:
+            stats = self.index.describe_index_stats()
+        summary = stats.namespaces.get(namespace or "")
+        return summary.vector_count if summary else 0
+
+    def list_namespaces(self) -> List[Optional[str]]:
+        stats = self.index.describe_index_stats()
+        return [
+            namespace or None
+            for namespace, summary in stats.namespaces.items()
+            if summary.vector_count
+        ]
+
+    def scan(self, namespace: Optional[str] = None, cursor: Optional[str] = None, limit: int = 100) -> ScanPage:
+        # Listing IDs is only supported on serverless indexes
+        page = self.index.list_paginated(namespace=namespace or "", limit=limit, pagination_token=cursor)
+        ids = [vector.id for vector in page.vectors]
+        fetched = self.fetch(ids, namespace) if ids else {}
+        return ScanPage(
+            records=[fetched[record_id] for record_id in ids if record_id in fetched],
+            next_cursor=page.pagination.next if page.pagination else None,
+        )
+
+    def fetch(self, ids: Iterable[str], namespace: Optional[str] = None) -> Dict[str, VectorRecord]:
+        ids = list(ids)
+        records = {}
+        for i in range(0, len(ids), self.batch_size):
+            response = self.index.fetch(ids=ids[i:i + self.batch_size], namespace=namespace or "")
+            for record_id, vector in response.vectors.items():
+                records[record_id] = VectorRecord(id=record_id, values=list(vector.values), metadata=dict(vector.metadata or {}))
+        return records
@@ -0,0 +1,250 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from qdrant_client import QdrantClient, models
+
+from .base import ScanPage, SearchHit, VectorRecord, VectorStore, normalize_filter
+
+logger = logging.getLogger(__name__)
+
+# Payload fields every query filters on
+INDEXED_PAYLOAD_FIELDS = ("user_id", "class_id", "document_id")
+# Namespaces are a tenant-indexed payload field, so Qdrant stores each namespace's points together
+NAMESPACE_FIELD = "_namespace"
+
+
+def _qdrant_filter(filter: Optional[Dict], namespace: Optional[str]) -> models.Filter:
+    if namespace is None:
+        must = [models.IsEmptyCondition(is_empty=models.PayloadField(key=NAMESPACE_FIELD))]
+    else:
+        must = [models.FieldCondition(key=NAMESPACE_FIELD, match=models.MatchValue(value=namespace))]
+    for key, accepted in normalize_filter(filter).items():
+        must.append(models.FieldCondition(
+            key=key,
+            match=models.MatchValue(value=accepted[0]) if len(accepted) == 1 else models.MatchAny(any=accepted),
+        ))
+    return models.Filter(must=must)
+
+
+def _payload(record: VectorRecord, namespace: Optional[str]) -> Dict:
+    if namespace is None:
+        return record.metadata
+    return {**record.metadata, NAMESPACE_FIELD: namespace}
+
+
+def _metadata(payload: Optional[Dict]) -> Dict:
+    metadata = dict(payload or {})
+    metadata.pop(NAMESPACE_FIELD, None)
+    return metadata
+
+
+class QdrantVectorStore(VectorStore):
+    """
+    Qdrant collection. On startup the collection, the keyword payload indexes and int8 scalar
+    quantization are created if missing. Record IDs must be UUID strings and, unlike
+    Pinecone, are unique across namespaces.
+
+    upsert_batch sends batches concurrently without waiting for each to be applied, then
+    sends the last batch with wait=True. Updates to a collection are applied in order, so
+    once that returns every earlier batch is searchable too.
+    """
+
+    batch_size = 256
+    # Upper bound on namespaces returned by list_namespaces
+    max_namespaces = 1_000_000
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        collection_name: str,
+        dimension: int,
+        upsert_parallelism: int = 4,
+        quantization: bool = True,
+    ):
+        self.client = client
+        self.collection_name = collection_name
+        self.dimension = dimension
+        self.upsert_parallelism = upsert_parallelism
+        self.quantization = quantization
+        self._ensure_collection()
+
+    @classmethod
+    def from_url(
+        cls,
+        url: str,
+        api_key: Optional[str],
+        collection_name: str,
+        dimension: int,
+        prefer_grpc: bool = True,
+        grpc_port: int = 6334,
+        **kwargs,
+    ):
+        client = QdrantClient(url=url, api_key=api_key, prefer_grpc=prefer_grpc, grpc_port=grpc_port)
+        return cls(client, collection_name, dimension, **kwargs)
+
+    def _quantization_config(self):
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+
+    def _ensure_collection(self):
+        if not self.client.collection_exists(self.collection_name):
+            logger.info(f"Creating Qdrant collection '{self.collection_name}'")
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=models.VectorParams(size=self.dimension, distance=models.Distance.COSINE),
+                quantization_config=self._quantization_config() if self.quantization else None,
+            )
+            existing_indexes = {}
+        else:
+            info = self.client.get_collection(self.collection_name)
+            existing_indexes = info.payload_schema or {}
+            if self.quantization and info.config.quantization_config is None:
+                logger.info(f"Enabling scalar quantization on Qdrant collection '{self.collection_name}'")
+                self.client.update_collection(
+                    collection_name=self.collection_name,
+                    quantization_config=self._quantization_config(),
+                )
+        if NAMESPACE_FIELD not in existing_indexes:
+            logger.info(f"Creating tenant payload index on '{NAMESPACE_FIELD}'")
+            self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=NAMESPACE_FIELD,
+                field_schema=models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True),
+                wait=True,
+            )
+        for field_name in INDEXED_PAYLOAD_FIELDS:
+            if field_name not in existing_indexes:
+                logger.info(f"Creating keyword payload index on '{field_name}'")
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=models.PayloadSchemaType.KEYWORD,
+                    wait=True,
+                )
+
+    def upsert_batch(
+        self,
+        records: Iterable[VectorRecord],
+        batch_size: Optional[int] = None,
+        namespace: Optional[str] = None,
+    ) -> int:
+        batch_size = batch_size or self.batch_size
+        points = [
+            models.PointStruct(id=record.id, vector=list(record.values), payload=_payload(record, namespace))
+            for record in records
+        ]
+        if not points:
+            return 0
+        batches = [points[i:i + batch_size] for i in range(0, len(points), batch_size)]
+        *pending, last = batches
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.upsert_parallelism) as executor:
+                # list() re-raises the first failed batch
+                list(executor.map(lambda batch: self._upsert_points(batch, wait=False), pending))
+        # Consistency barrier: returns once this and every earlier update is applied
+        self._upsert_points(last, wait=True)
+        return len(points)
+
+    def _upsert_points(self, points: List[models.PointStruct], wait: bool):
+        self.client.upsert(collection_name=self.collection_name, points=points, wait=wait)
+
+    def _upsert(self, records: List[VectorRecord], namespace: Optional[str]):
+        self.upsert_batch(records, batch_size=len(records), namespace=namespace)
+
+    def search(
+        self,
+        vector: Sequence[float],
+        top_k: int = 5,
+        filter: Optional[Dict] = None,
+        namespace: Optional[str] = None,
+    ) -> List[SearchHit]:
+        response = self.client.query_points(
+            collection_name=self.collection_name,
+            query=list(vector),
+            limit=top_k,
+            query_filter=_qdrant_filter(filter, namespace),
+            with_payload=True,
+        )
+        return [
+            SearchHit(id=str(point.id), score=point.score, metadata=_metadata(point.payload))
+            for point in response.points
+        ]
+
+    def delete_by_ids(self, ids: Iterable[str], namespace: Optional[str] = None):
+        ids = list(ids)
+        if ids:
+            # Point IDs are collection-wide, so restrict the delete to the namespace's points
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.FilterSelector(filter=models.Filter(
+                    must=[models.HasIdCondition(has_id=ids), *_qdrant_filter(None, namespace).must],
+                )),
+                wait=True,
+            )
+
+    def _delete_by_filter(self, filter: Dict, namespace: Optional[str]):
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=models.FilterSelector(filter=_qdrant_filter(filter, namespace)),
+            wait=True,
+        )
+
+    def delete_namespace(self, namespace: str):
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=models.FilterSelector(filter=_qdrant_filter(None, namespace)),
+            wait=True,
+        )
+
+    def count(self, filter: Optional[Dict] = None, namespace: Optional[str] = None) -> int:
+        return self.client.count(
+            collection_name=self.collection_name,
+            count_filter=_qdrant_filter(filter, namespace),
+            exact=True,
+        ).count
+
+    def list_namespaces(self) -> List[Optional[str]]:
+        response = self.client.facet(
+            collection_name=self.collection_name,
+            key=NAMESPACE_FIELD,
+            limit=self.max_namespaces,
+            exact=True,
+        )
+        namespaces = [hit.value for hit in response.hits if hit.count]
+        if self.count(namespace=None):
+            namespaces.insert(0, None)
+        return namespaces
+
+    def _record(self, point) -> VectorRecord:
+        return VectorRecord(id=str(point.id), values=list(point.vector), metadata=_metadata(point.payload))
+
+    def scan(self, namespace: Optional[str] = None, cursor: Optional[str] = None, limit: int = 100) -> ScanPage:
+        points, next_offset = self.client.scroll(
+            collection_name=self.collection_name,
+            scroll_filter=_qdrant_filter(None, namespace),
+            limit=limit,
+            offset=cursor,
+            with_payload=True,
+            with_vectors=True,
+        )
+        return ScanPage(
+            records=[self._record(point) for point in points],
+            next_cursor=str(next_offset) if next_offset is not None else None,
+        )
+
+    def fetch(self, ids: Iterable[str], namespace: Optional[str] = None) -> Dict[str, VectorRecord]:
+        ids = list(ids)
+        if not ids:
+            return {}
+        points, _ = self.client.scroll(
+            collection_name=self.collection_name,
+            scroll_filter=models.Filter(
+                must=[models.HasIdCondition(has_id=ids), *_qdrant_filter(None, namespace).must],
+            ),
+            limit=len(ids),
+            with_payload=True,
+            with_vectors=True,
+        )
+        return {str(point.id): self._record(point) for point in points}
@@ -11,6 +11,7 @@ CREATE TABLE IF NOT EXISTS classes (
   id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
   user_id UUID,
   name TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'active', -- "active" or "deleting"
   created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -19,7 +20,7 @@ CREATE TABLE IF NOT EXISTS documents (
   id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
   class_id UUID NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
   filename TEXT NOT NULL,
-  status TEXT NOT NULL, -- e.g., "pending", "processing", "indexed", "failed"
+  status TEXT NOT NULL, -- e.g., "uploading", "pending", "processed", "failed", "deleting"
   uploaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
   updated_at TIMESTAMP DEFAULT NOW()
 );
@@ -42,6 +43,81 @@ CREATE TABLE IF NOT EXISTS document_chunks (
     created_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Add status column to existing classes table if not present (used for background deletion)
+ALTER TABLE classes ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'active';
+
+-- Parsed S3 location of each document, so presigning never re-parses s3_url
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS s3_bucket TEXT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS s3_key TEXT;
+
+-- Owner and S3 location of each document
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS user_id UUID;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS s3_url TEXT;
+
+-- Per-user usage counters, kept up to date in the same transaction as document and class
+-- inserts/deletes so quota checks are a single row lookup. Reconciled periodically by the worker.
+CREATE TABLE IF NOT EXISTS user_usage (
+  user_id UUID PRIMARY KEY,
+  document_count INTEGER NOT NULL DEFAULT 0,
+  class_count INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_documents_user_id ON documents(user_id);
+CREATE INDEX IF NOT EXISTS idx_classes_user_id ON classes(user_id);
+
+-- Per-class change counter for the documents listing ETag. Bumped by a trigger whenever a
+-- document of the class is added, removed, or changes a listed column.
+ALTER TABLE classes ADD COLUMN IF NOT EXISTS documents_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_class_documents_version() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP <> 'INSERT' THEN
+    UPDATE classes SET documents_version = documents_version + 1 WHERE id = OLD.class_id;
+  END IF;
+  IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.class_id IS DISTINCT FROM OLD.class_id) THEN
+    UPDATE classes SET documents_version = documents_version + 1 WHERE id = NEW.class_id;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS documents_version_insert_delete ON documents;
+CREATE TRIGGER documents_version_insert_delete
+  AFTER INSERT OR DELETE ON documents
+  FOR EACH ROW EXECUTE FUNCTION bump_class_documents_version();
+
+DROP TRIGGER IF EXISTS documents_version_update ON documents;
+CREATE TRIGGER documents_version_update
+  AFTER UPDATE ON documents
+  FOR EACH ROW
+  WHEN (OLD.class_id IS DISTINCT FROM NEW.class_id
+        OR OLD.filename IS DISTINCT FROM NEW.filename
+        OR OLD.status IS DISTINCT FROM NEW.status
+        OR OLD.uploaded_at IS DISTINCT FROM NEW.uploaded_at)
+  EXECUTE FUNCTION bump_class_documents_version();
+
+-- Keyset pagination of a class's documents on (uploaded_at, id)
+CREATE INDEX IF NOT EXISTS idx_documents_class_uploaded_at_id ON documents(class_id, uploaded_at, id);
+
+-- Page of each chunk, so chunks can be re-embedded from the database with their metadata
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS page_number INTEGER;
+
+-- Text extracted from each distinct uploaded file, keyed by the SHA-256 of its bytes, so
+-- documents can be chunked again without downloading and parsing the PDF
+-- (shared/extracted_text.py). pages_zlib is zlib-compressed JSON: [[page_number, text], ...]
+CREATE TABLE IF NOT EXISTS extracted_texts (
+  content_hash TEXT PRIMARY KEY,
+  extractor TEXT NOT NULL,
+  page_count INTEGER NOT NULL,
+  text_bytes INTEGER NOT NULL,
+  pages_zlib BYTEA NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash);
+
 -- Create indexes for faster lookups
 CREATE INDEX IF NOT EXISTS idx_documents_class_id ON documents(class_id);
 CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks(document_id);
@@ -50,4 +126,4 @@ CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks(document_id);
 INSERT INTO classes (id, user_id, name) VALUES 
 ('f47ac10b-58cc-4372-a567-0e02b2c3d479', 'a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11', 'CMSC351'),
 ('747ac10b-58cc-4372-a567-0e02b2c3d479', 'a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11', 'MATH240')
-ON CONFLICT (id) DO NOTHING; 
\ No newline at end of file
+ON CONFLICT (id) DO NOTHING; 
\ No newline at end of file